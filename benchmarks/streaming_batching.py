@@ -0,0 +1,186 @@
+"""
+This benchmark measures the number of WebSocket frames and of message loop
+wakeups needed to deliver an update storm (like a scene switching a lot of
+lights at once) to a single Streaming API client, with and without batching.
+
+The consumer replicates the structure of StreamingApiProvider._message_loop:
+an incoming waiter task which never completes and an outcoming waiter task,
+both awaited with asyncio.wait; frames are sent to a fake WebSocket.
+
+Usage::
+
+    python -m benchmarks.streaming_batching [--scenes N] [--lights N]
+"""
+import argparse
+import asyncio
+import functools
+import time
+from typing import Sequence, Tuple
+
+from dpl.api.streaming_api.delivery_manager import DeliveryManager
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.message_codec import send_message, send_batch
+
+
+SESSION_ID = 'S1'
+
+SAMPLE_DTO = {
+    'id': 'L1',
+    'is_enabled': True,
+    'is_available': True,
+    'last_updated': 1517232368.30256,
+    'capabilities': ['actuator', 'has_state', 'is_active'],
+    'commands': ['activate', 'deactivate', 'toggle', 'on', 'off'],
+    'state': 'on',
+    'is_active': True,
+    'placement': 'R1',
+    'friendly_name': 'Ceiling light'
+}
+
+
+class FakeWebSocket(object):
+    """
+    Counts frames sent by the server
+    """
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def send_str(self, data: str) -> None:
+        self.frames += 1
+        self.bytes += len(data)
+
+    def send_bytes(self, data: bytes) -> None:
+        self.frames += 1
+        self.bytes += len(data)
+
+
+async def consume(
+        loop: asyncio.AbstractEventLoop, manager: DeliveryManager,
+        ws: FakeWebSocket, total: int, batch_size: int, flush_window: float
+) -> int:
+    """
+    Sends pending messages until the specified number of messages is sent.
+    Returns the number of loop wakeups
+    """
+    start_task = functools.partial(asyncio.ensure_future, loop=loop)
+
+    if batch_size > 1:
+        get_message = functools.partial(
+            manager.get_messages, SESSION_ID, max_count=batch_size,
+            flush_window=flush_window
+        )
+    else:
+        get_message = functools.partial(manager.get_message, SESSION_ID)
+
+    incoming_waiter = loop.create_future()  # a silent client
+    outcoming_waiter = start_task(get_message())
+    sent = 0
+    wakeups = 0
+
+    while sent < total:
+        done, _ = await asyncio.wait(
+            (incoming_waiter, outcoming_waiter),
+            return_when=asyncio.FIRST_COMPLETED, loop=loop
+        )
+        wakeups += 1
+
+        result = outcoming_waiter.result()
+
+        if batch_size > 1:
+            if len(result) == 1:
+                send_message(ws, result[0])
+            else:
+                send_batch(ws, result)
+
+            sent += len(result)
+        else:
+            send_message(ws, result)
+            sent += 1
+
+        outcoming_waiter = start_task(get_message())
+
+    outcoming_waiter.cancel()
+    incoming_waiter.cancel()
+
+    return wakeups
+
+
+async def produce(
+        loop: asyncio.AbstractEventLoop, manager: DeliveryManager,
+        scenes: int, lights: int
+) -> None:
+    """
+    Generates update storms: all the lights of a scene are updated in a
+    single loop iteration, like on a synchronous fan-out of events
+    """
+    for _ in range(scenes):
+        for light in range(lights):
+            manager.put_message_nowait(SESSION_ID, Message(
+                timestamp=time.time(), type_='data',
+                topic='things/L%d/modified' % light, body=SAMPLE_DTO
+            ))
+
+        await asyncio.sleep(0.001, loop=loop)
+
+
+def run(
+        scenes: int, lights: int, batch_size: int, flush_window: float
+) -> Tuple[int, int, int, float]:
+    """
+    Returns the number of frames, of wakeups, of sent bytes and the elapsed
+    time in seconds
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    manager = DeliveryManager(
+        loop=loop, max_pending_messages=scenes * lights
+    )
+    ws = FakeWebSocket()
+
+    started = time.perf_counter()
+    wakeups, _ = loop.run_until_complete(asyncio.gather(
+        consume(
+            loop, manager, ws, scenes * lights, batch_size, flush_window
+        ),
+        produce(loop, manager, scenes, lights),
+        loop=loop
+    ))
+    elapsed = time.perf_counter() - started
+    loop.close()
+
+    return ws.frames, wakeups, ws.bytes, elapsed
+
+
+def main(argv: Sequence[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    arg_parser.add_argument('--scenes', type=int, default=50)
+    arg_parser.add_argument('--lights', type=int, default=80)
+    args = arg_parser.parse_args(argv)
+
+    print(
+        "%-22s %8s %8s %10s %10s %12s" % (
+            'mode', 'frames', 'wakeups', 'KiB', 'frames/s', 'messages/s'
+        )
+    )
+
+    modes = (
+        ('unbatched', 1, 0),
+        ('batched, window 0', 100, 0),
+        ('batched, window 5 ms', 100, 0.005),
+    )
+
+    for name, batch_size, flush_window in modes:
+        frames, wakeups, sent, elapsed = run(
+            args.scenes, args.lights, batch_size, flush_window
+        )
+        messages = args.scenes * args.lights
+
+        print("%-22s %8d %8d %10.1f %10.0f %12.0f" % (
+            name, frames, wakeups, sent / 1024, frames / elapsed,
+            messages / elapsed
+        ))
+
+
+if __name__ == '__main__':
+    main()
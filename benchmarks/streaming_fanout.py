@@ -0,0 +1,126 @@
+"""
+This benchmark measures CPU time spent on encoding of a single event for all
+of its Streaming API subscribers, comparing per-session encoding of Messages
+with encoding to a SharedFrame.
+
+Usage::
+
+    python -m benchmarks.streaming_fanout [--events N]
+"""
+import argparse
+import time
+from typing import Callable, Sequence
+
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.message_json import (
+    message_dumps, SharedFrame, FramedMessage
+)
+
+
+SUBSCRIBER_COUNTS = (1, 10, 50, 100, 200, 500)
+
+SAMPLE_DTO = {
+    'id': 'P1',
+    'is_enabled': True,
+    'is_available': True,
+    'last_updated': 1517232368.30256,
+    'capabilities': [
+        'actuator', 'has_state', 'is_active', 'has_volume', 'is_muted',
+        'track_info', 'multi_source', 'play_stop', 'pausable',
+        'track_switching'
+    ],
+    'commands': [
+        'activate', 'deactivate', 'toggle', 'play', 'stop', 'pause',
+        'set_volume', 'set_muted', 'next', 'previous', 'set_source'
+    ],
+    'state': 'playing',
+    'is_active': True,
+    'volume': 42,
+    'is_muted': False,
+    'track_info': {
+        'title': 'Some track title', 'artist': 'Some artist',
+        'album': 'Some album', 'length': 245.3, 'position': 12.5
+    },
+    'available_sources': ['radio', 'usb', 'bluetooth', 'line_in', 'network'],
+    'current_source': 'network',
+    'placement': 'R1',
+    'friendly_name': 'Living room player'
+}
+
+
+def per_session_encoding(subscribers: int, retained: bool) -> None:
+    """
+    Builds and encodes a separate Message for each subscriber
+    """
+    timestamp = time.time()
+
+    for i in range(subscribers):
+        message = Message(
+            timestamp=timestamp, type_='data',
+            topic='things/P1/modified', body=SAMPLE_DTO
+        )
+
+        if retained:
+            message.message_id = i
+
+        message_dumps(message)
+
+
+def shared_frame_encoding(subscribers: int, retained: bool) -> None:
+    """
+    Builds a single SharedFrame and renders it for each subscriber
+    """
+    frame = SharedFrame(
+        Message(
+            timestamp=time.time(), type_='data',
+            topic='things/P1/modified', body=SAMPLE_DTO
+        )
+    )
+    shared_message = FramedMessage(frame)
+
+    for i in range(subscribers):
+        if retained:
+            message = FramedMessage(frame, message_id=i)
+        else:
+            message = shared_message
+
+        message_dumps(message)
+
+
+def measure(
+        fan_out: Callable[[int, bool], None], subscribers: int,
+        retained: bool, events: int
+) -> float:
+    """
+    Returns CPU time per event in microseconds
+    """
+    started = time.process_time()
+
+    for _ in range(events):
+        fan_out(subscribers, retained)
+
+    return (time.process_time() - started) / events * 1e6
+
+
+def main(argv: Sequence[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    arg_parser.add_argument('--events', type=int, default=200)
+    args = arg_parser.parse_args(argv)
+
+    print(
+        "%12s %9s %20s %20s" % (
+            'subscribers', 'retained', 'per-session, us/evt',
+            'shared frame, us/evt'
+        )
+    )
+
+    for retained in (False, True):
+        for subscribers in SUBSCRIBER_COUNTS:
+            old = measure(per_session_encoding, subscribers, retained, args.events)
+            new = measure(shared_frame_encoding, subscribers, retained, args.events)
+
+            print("%12d %9s %20.1f %20.1f" % (subscribers, retained, old, new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+"""
+This benchmark is a load generator for the Streaming API. It measures how
+many concurrent sessions and events per second the server can sustain and
+how long it takes for an update of a Thing to reach clients.
+
+A StreamingApiProvider is started in a separate process together with an
+in-memory ThingRepository, ThingService and EventHub wired like in the
+Controller, with a stub AuthService that accepts any token. Then N clients
+are connected: each of them authenticates, subscribes to updates of all
+Things and acknowledges retained messages. M Things are updated through the
+repository at the specified total rate for the specified time.
+
+The latency is measured from the moment of an update of a Thing (the
+last_updated field of its DTO) till the moment a client parsed the message.
+Clients and the server run on the same host, so their clocks are the same.
+CPU time and memory usage (RSS) are measured for the server process only.
+
+The report is printed (or saved) as JSON, so results of different runs can
+be compared.
+
+Usage::
+
+    python -m benchmarks.streaming_load [--clients N] [--things M]
+        [--rate EVENTS_PER_SECOND] [--duration SECONDS] [--retained]
+        [--batching] [--output PATH]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Any, Dict, List, Mapping, Sequence
+
+import aiohttp
+
+from dpl.auth.abs_auth_service import AbsAuthService
+from dpl.auth.auth_context import AuthContext
+from dpl.events.build_object_related_event import build_object_related_event
+from dpl.events.event_hub import EventHub
+from dpl.integrations.base_things.abs_temp_sensor import AbsTemperatureSensor
+from dpl.repo_impls.in_memory.thing_repository import ThingRepository
+from dpl.service_impls.thing_service import ThingService
+from dpl.things.thing import Thing
+from dpl.api.streaming_api.streaming_api_provider import StreamingApiProvider
+
+
+HOST = '127.0.0.1'
+
+# the interval between two rounds of updates of Things, in seconds
+TICK = 0.01
+
+
+class StubAuthService(AbsAuthService):
+    """
+    Accepts any access token; the token is used as a Session identifier
+    """
+    def view_current_session(self, access_token: str) -> Dict[str, Any]:
+        return {'domain_id': access_token}
+
+    def check_permission(self, access_token: str, *args, **kwargs) -> None:
+        pass
+
+
+class LoadSensor(Thing, AbsTemperatureSensor):
+    """
+    A temperature sensor which value is changed by the load generator
+    """
+    def __init__(self, domain_id: str):
+        super().__init__(
+            domain_id=domain_id, con_instance=None, con_params={},
+            metadata={'placement': 'R1', 'friendly_name': domain_id}
+        )
+        self._temperature = 20.0
+
+    @property
+    def is_available(self) -> bool:
+        return True
+
+    @property
+    def temperature_c(self) -> float:
+        return self._temperature
+
+    def set_temperature(self, value: float) -> None:
+        self._temperature = value
+        self._apply_update()
+
+
+def _read_rss_kb() -> int:
+    """
+    Returns the current resident set size of this process in kilobytes;
+    falls back to the peak value if the current one is not available
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+
+        return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure_process() -> Dict[str, float]:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    return {
+        'cpu_user': usage.ru_utime, 'cpu_system': usage.ru_stime,
+        'rss_kb': _read_rss_kb(), 'max_rss_kb': usage.ru_maxrss,
+        'wall': time.perf_counter()
+    }
+
+
+async def drive_updates(
+        loop: asyncio.AbstractEventLoop, sensors: Sequence[LoadSensor],
+        rate: float, duration: float
+) -> int:
+    """
+    Updates the Things in a round-robin order with the specified total rate
+    and returns the number of performed updates
+    """
+    started = loop.time()
+    published = 0
+
+    while True:
+        elapsed = loop.time() - started
+
+        if elapsed >= duration:
+            return published
+
+        due = int(elapsed * rate)
+
+        while published < due:
+            sensor = sensors[published % len(sensors)]
+            sensor.set_temperature(20.0 + published % 100 / 10)
+            published += 1
+
+        await asyncio.sleep(TICK, loop=loop)
+
+
+async def serve(
+        loop: asyncio.AbstractEventLoop, options: Mapping[str, Any], conn
+) -> None:
+    """
+    Starts the server, performs updates on request of the parent process and
+    sends back the measurements of this process
+    """
+    thing_repo = ThingRepository()
+    thing_service = ThingService(thing_repo)
+    event_hub = EventHub()
+    event_hub.register_handler(
+        source_type=ThingService, handler=functools.partial(
+            build_object_related_event, target_root_topic='things'
+        )
+    )
+    thing_service.subscribe(event_hub)
+
+    provider = StreamingApiProvider(
+        auth_context=AuthContext(), auth_service=StubAuthService(),
+        loop=loop, max_pending_messages=options['max_pending'],
+        batch_flush_window=options['flush_window']
+    )
+    event_hub.subscribe(provider)
+
+    sensors = [
+        LoadSensor('T%d' % number) for number in range(options['things'])
+    ]
+
+    for sensor in sensors:
+        thing_repo.add(sensor)
+
+    await provider.start()
+    await provider.create_server(HOST, options['port'])
+
+    recv = functools.partial(loop.run_in_executor, None, conn.recv)
+
+    conn.send('ready')
+    await recv()  # all clients are connected and subscribed
+
+    before = _measure_process()
+    published = await drive_updates(
+        loop, sensors, options['rate'], options['duration']
+    )
+    after_updates = _measure_process()
+
+    await recv()  # clients received everything they could
+
+    after_drain = _measure_process()
+    conn.send({
+        'published': published,
+        'before': before, 'after_updates': after_updates,
+        'after_drain': after_drain
+    })
+
+    await provider.shutdown_server()
+    await provider.stop()
+
+
+def run_server(options: Mapping[str, Any], conn) -> None:
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(serve(loop, options, conn))
+    loop.close()
+
+
+class ClientStats(object):
+    """
+    Statistics collected by all clients
+    """
+    def __init__(self):
+        self.received = 0
+        self.frames = 0
+        self.acks = 0
+        self.latencies = list()  # type: List[float]
+        self.first_received_at = None
+        self.last_received_at = None
+
+
+def _control(topic: str, body: Mapping[str, Any]) -> str:
+    return json.dumps({
+        'timestamp': time.time(), 'type': 'control', 'topic': topic,
+        'body': body
+    })
+
+
+async def connect_client(
+        session: aiohttp.ClientSession, url: str, number: int,
+        options: argparse.Namespace
+) -> aiohttp.ClientWebSocketResponse:
+    """
+    Connects a client, performs authentication and subscription
+    """
+    ws = await session.ws_connect(url)
+
+    ws.send_str(_control('auth', {
+        'access_token': 'load-client-%d' % number,
+        'batching': options.batching
+    }))
+    ws.send_str(_control('subscribe', {
+        'target_topic': 'things/+/modified',
+        'retain_messages': options.retained
+    }))
+
+    while True:
+        message = json.loads((await ws.receive()).data)
+
+        if message['topic'] == 'subscribe_ack':
+            return ws
+
+        if message['topic'] == 'error':
+            raise RuntimeError("Failed to connect: %s" % message['body'])
+
+
+async def consume(
+        ws: aiohttp.ClientWebSocketResponse, stats: ClientStats
+) -> None:
+    """
+    Receives data messages until the connection is closed, measures their
+    latency and acknowledges retained ones with a single cumulative
+    acknowledgement for each frame
+    """
+    while True:
+        frame = await ws.receive()
+
+        if frame.type != aiohttp.WSMsgType.TEXT:
+            return
+
+        now = time.time()
+        parsed = json.loads(frame.data)
+
+        if parsed['topic'] == 'batch':
+            messages = parsed['body']['messages']
+        else:
+            messages = (parsed, )
+
+        last_message_id = None
+
+        for message in messages:
+            if message['type'] != 'data':
+                continue
+
+            stats.received += 1
+            stats.latencies.append(now - message['body']['last_updated'])
+            last_message_id = message.get('message_id', last_message_id)
+
+        stats.frames += 1
+        stats.last_received_at = now
+
+        if stats.first_received_at is None:
+            stats.first_received_at = now
+
+        if last_message_id is not None:
+            ws.send_str(_control('delivery_ack', {'up_to': last_message_id}))
+            stats.acks += 1
+
+
+def _percentile(ordered: Sequence[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+
+    return ordered[index]
+
+
+def build_report(
+        options: argparse.Namespace, stats: ClientStats,
+        server: Mapping[str, Any], clients_cpu: float
+) -> Dict[str, Any]:
+    before = server['before']
+    after_updates = server['after_updates']
+    after_drain = server['after_drain']
+    latencies = sorted(stats.latencies)
+    expected = server['published'] * options.clients
+
+    receiving_time = 0.0
+
+    if stats.first_received_at is not None:
+        receiving_time = stats.last_received_at - stats.first_received_at
+
+    server_cpu = (
+        after_drain['cpu_user'] + after_drain['cpu_system'] -
+        before['cpu_user'] - before['cpu_system']
+    )
+    server_wall = after_drain['wall'] - before['wall']
+
+    return {
+        'parameters': {
+            'clients': options.clients, 'things': options.things,
+            'rate': options.rate, 'duration': options.duration,
+            'retained': options.retained, 'batching': options.batching,
+            'flush_window': options.flush_window,
+            'max_pending': options.max_pending,
+            'python': sys.version.split()[0]
+        },
+        'events': {
+            'published': server['published'],
+            'published_per_second': server['published'] / options.duration
+        },
+        'delivery': {
+            'expected': expected,
+            'received': stats.received,
+            'ratio': stats.received / expected if expected else 0.0,
+            'frames': stats.frames,
+            'acks_sent': stats.acks,
+            'messages_per_second': (
+                stats.received / receiving_time if receiving_time else 0.0
+            )
+        },
+        'latency_ms': {
+            'p50': _percentile(latencies, 0.5) * 1000,
+            'p90': _percentile(latencies, 0.9) * 1000,
+            'p99': _percentile(latencies, 0.99) * 1000,
+            'max': (latencies[-1] if latencies else 0.0) * 1000,
+            'mean': (
+                sum(latencies) / len(latencies) * 1000 if latencies else 0.0
+            )
+        },
+        'server': {
+            'cpu_seconds': server_cpu,
+            'cpu_percent': server_cpu / server_wall * 100,
+            'cpu_seconds_per_1k_messages': (
+                server_cpu / stats.received * 1000 if stats.received else 0.0
+            ),
+            'rss_before_kb': before['rss_kb'],
+            'rss_after_updates_kb': after_updates['rss_kb'],
+            'rss_after_drain_kb': after_drain['rss_kb'],
+            'rss_growth_kb': after_drain['rss_kb'] - before['rss_kb'],
+            'max_rss_kb': after_drain['max_rss_kb']
+        },
+        'clients_cpu_seconds': clients_cpu
+    }
+
+
+async def run_clients(
+        loop: asyncio.AbstractEventLoop, options: argparse.Namespace, conn
+) -> Dict[str, Any]:
+    url = 'http://%s:%d/' % (HOST, options.port)
+    stats = ClientStats()
+
+    async with aiohttp.ClientSession(loop=loop) as session:
+        connections = list()
+
+        # connect in portions to not to exhaust the backlog of the listener
+        for first in range(0, options.clients, 50):
+            connections.extend(await asyncio.gather(*(
+                connect_client(session, url, number, options)
+                for number in range(first, min(first + 50, options.clients))
+            ), loop=loop))
+
+        consumers = [
+            asyncio.ensure_future(consume(ws, stats), loop=loop)
+            for ws in connections
+        ]
+
+        clients_cpu = time.process_time()
+        conn.send('start')
+
+        await asyncio.sleep(options.duration + options.drain, loop=loop)
+        clients_cpu = time.process_time() - clients_cpu
+        conn.send('stop')
+
+        server = await loop.run_in_executor(None, conn.recv)
+
+        for ws in connections:
+            await ws.close()
+
+        await asyncio.gather(*consumers, loop=loop, return_exceptions=True)
+
+    return build_report(options, stats, server, clients_cpu)
+
+
+def main(argv: Sequence[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    arg_parser.add_argument('--clients', type=int, default=100)
+    arg_parser.add_argument('--things', type=int, default=50)
+    arg_parser.add_argument(
+        '--rate', type=float, default=100,
+        help="the total number of updates of Things per second"
+    )
+    arg_parser.add_argument('--duration', type=float, default=10)
+    arg_parser.add_argument(
+        '--drain', type=float, default=2,
+        help="the time to wait for delivery after the last update"
+    )
+    arg_parser.add_argument('--retained', action='store_true')
+    arg_parser.add_argument('--batching', action='store_true')
+    arg_parser.add_argument('--flush-window', type=float, default=0)
+    arg_parser.add_argument('--max-pending', type=int, default=1000)
+    arg_parser.add_argument('--port', type=int, default=10899)
+    arg_parser.add_argument(
+        '--output', help="a path to save the JSON report to"
+    )
+    options = arg_parser.parse_args(argv)
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server_process = multiprocessing.Process(
+        target=run_server, args=({
+            'port': options.port, 'things': options.things,
+            'rate': options.rate, 'duration': options.duration,
+            'max_pending': options.max_pending,
+            'flush_window': options.flush_window
+        }, child_conn)
+    )
+    server_process.start()
+
+    try:
+        parent_conn.recv()  # the server is ready
+
+        loop = asyncio.get_event_loop()
+        report = loop.run_until_complete(
+            run_clients(loop, options, parent_conn)
+        )
+    finally:
+        server_process.join(timeout=10)
+
+        if server_process.is_alive():
+            server_process.terminate()
+
+    encoded = json.dumps(report, indent=2, sort_keys=True)
+
+    if options.output is None:
+        print(encoded)
+    else:
+        with open(options.output, 'w') as output:
+            output.write(encoded + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+This benchmark measures the time of resolution of subscribers of a topic
+by SubscriptionStorage with a large number of subscriptions, with and
+without the per-topic resolution cache.
+
+Each Session is subscribed to a mix of exact and wildcard topics, like a
+dashboard which watches all modifications of Things and deletion of a
+specific Thing. Topics of published events are distributed over a limited
+set of Things, so some of them are repeated, like in a real system.
+
+Usage::
+
+    python -m benchmarks.subscription_matching [--sessions N] [--events N]
+"""
+import argparse
+import random
+import time
+from typing import Callable, List, Sequence
+
+from dpl.api.streaming_api.subscription_storage import SubscriptionStorage
+
+
+THINGS_COUNT = 200
+
+
+def build_storage(sessions: int, cache_size: int) -> SubscriptionStorage:
+    """
+    Builds a storage with 10 thousands of subscriptions by default: each
+    Session has four subscriptions, one of them is a wildcard one
+
+    :param sessions: the number of Sessions to be subscribed
+    :param cache_size: the size of the resolution cache
+    :return: a filled storage
+    """
+    storage = SubscriptionStorage(cache_size=cache_size)
+    rnd = random.Random(42)
+
+    for number in range(sessions):
+        session_id = 'S%d' % number
+        things = rnd.sample(range(THINGS_COUNT), 3)
+
+        storage.add_subscription(
+            session_id, 'things/L%d/modified' % things[0], True
+        )
+        storage.add_subscription(session_id, 'things/L%d/#' % things[1])
+        storage.add_subscription(
+            session_id, 'things/L%d/deleted' % things[2]
+        )
+
+        if number % 10 == 0:
+            storage.add_subscription(session_id, 'things/+/modified')
+        else:
+            storage.add_subscription(
+                session_id, 'placements/R%d/+' % (number % 50)
+            )
+
+    return storage
+
+
+def build_topics(count: int) -> List[str]:
+    rnd = random.Random(7)
+
+    return [
+        'things/L%d/modified' % rnd.randrange(THINGS_COUNT)
+        for _ in range(count)
+    ]
+
+
+def measure(resolve: Callable[[str], object], topics: Sequence[str]) -> float:
+    """
+    Returns the average time of a single resolution in microseconds
+    """
+    started = time.perf_counter()
+
+    for topic in topics:
+        resolve(topic)
+
+    return (time.perf_counter() - started) / len(topics) * 1e6
+
+
+def main(argv: Sequence[str] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    arg_parser.add_argument('--sessions', type=int, default=2500)
+    arg_parser.add_argument('--events', type=int, default=20000)
+    args = arg_parser.parse_args(argv)
+
+    topics = build_topics(args.events)
+
+    uncached = build_storage(args.sessions, cache_size=0)
+    cached = build_storage(args.sessions, cache_size=1024)
+
+    print("subscriptions: %d, sessions: %d, events: %d" % (
+        args.sessions * 4, args.sessions, args.events
+    ))
+    print("%-36s %12s" % ('case', 'us/event'))
+
+    cases = (
+        ('resolve_subscribers, no cache', uncached.resolve_subscribers),
+        ('resolve_subscribers, LRU cache', cached.resolve_subscribers),
+        ('is_subscribed, no cache', lambda topic: uncached.is_subscribed(
+            'S1', topic
+        )),
+        ('is_subscribed, LRU cache', lambda topic: cached.is_subscribed(
+            'S1', topic
+        )),
+    )
+
+    for name, resolve in cases:
+        print("%-36s %12.2f" % (name, measure(resolve, topics)))
+
+    # the cache is invalidated on each change of subscriptions
+    started = time.perf_counter()
+
+    for number in range(1000):
+        cached.add_subscription('X', 'things/L%d/added' % number)
+        cached.resolve_subscribers(topics[number])
+        cached.remove_subscription('X', 'things/L%d/added' % number)
+
+    print("%-36s %12.2f" % (
+        'subscribe + resolve + unsubscribe',
+        (time.perf_counter() - started) / 1000 * 1e6
+    ))
+
+
+if __name__ == '__main__':
+    main()
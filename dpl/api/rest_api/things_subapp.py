@@ -2,7 +2,8 @@
 This module contains definitions of an aiohttp
 application controlling the /things/ route
 """
-from typing import Mapping
+import json
+from typing import Mapping, Optional, Tuple
 
 import aiohttp.web as web
 from dpl.utils import filtering
@@ -19,15 +20,21 @@ from dpl.services.abs_thing_service import (
     ServiceUnsupportedCommandError
 )
 from dpl.api.api_errors import ERROR_TEMPLATES
+from dpl.events.event_journal import EventJournal, JournalRecord
 
-from .common import make_json_response
+from .common import make_json_response, CONTENT_TYPE_JSON
 from .restricted_access_decorator import restricted_access
 from .json_decode_decorator import json_decode_decorator
 
 
+# the number of history records to be read from the disk at once
+HISTORY_CHUNK_SIZE = 100
+
+
 def build_things_subapp(
         thing_service: AbsThingService,
-        additional_data: Mapping = EMPTY_MAPPING
+        additional_data: Mapping = EMPTY_MAPPING,
+        event_journal: Optional[EventJournal] = None
 ) -> web.Application:
     """
     A factory of aiohttp's Applications. Initializes and returns
@@ -37,10 +44,14 @@ def build_things_subapp(
            managing of Things
     :param additional_data: additional data to be saved in app's
            context (data store)
+    :param event_journal: an instance of EventJournal to read the
+           history of Things from; the /{id}/history path is not
+           available if not specified
     :return: an instance of aiohttp Application
     """
     app = web.Application()
     app['thing_service'] = thing_service
+    app['event_journal'] = event_journal
     app.update(additional_data)
     router = app.router
 
@@ -51,6 +62,10 @@ def build_things_subapp(
     router.add_post(path='/{id}/execute', handler=thing_execute_post_handler)
     router.add_route(method='OPTIONS', path='/{id}/execute', handler=thing_execute_options_handler)
 
+    if event_journal is not None:
+        router.add_get(path='/{id}/history', handler=thing_history_get_handler)
+        router.add_route(method='OPTIONS', path='/{id}/history', handler=thing_options_handler)
+
     return app
 
 
@@ -258,3 +273,115 @@ async def thing_execute_options_handler(request: web.Request) -> web.Response:
         headers={'Allow': 'POST, OPTIONS'}
     )
 
+
+def _get_time_range(query: Mapping) -> Tuple[float, float]:
+    """
+    Extracts the requested time range from query parameters
+
+    :param query: query parameters of a request
+    :return: the beginning and the end of the time range
+    :raises ValueError: if the time range is invalid
+    """
+    since = float(query.get('from', 0.0))
+    until = float(query.get('to', float('inf')))
+
+    if not since <= until:  # is False for NaN values too
+        raise ValueError("Invalid time range: %s - %s" % (since, until))
+
+    return since, until
+
+
+def _format_history_record(record: JournalRecord) -> bytes:
+    """
+    Formats a record of the history as a JSON object. The body of the record
+    is already encoded, so it's not decoded and encoded again
+
+    :param record: a record to be formatted
+    :return: a JSON object as bytes
+    """
+    timestamp, topic, body = record
+    head = '{"timestamp": %s, "topic": %s, "body": ' % (
+        json.dumps(timestamp), json.dumps(topic)
+    )
+
+    return head.encode('utf-8') + body + b'}'
+
+
+@restricted_access
+async def thing_history_get_handler(
+        request: web.Request
+) -> web.StreamResponse:
+    """
+    A handler for GET requests for path /things/{id}/history. Streams all
+    saved events of the specified Thing for the requested time range. The
+    history is read from the disk in chunks, so the whole history is never
+    loaded into memory
+
+    :param request: request to be processed
+    :return: a response to request
+    """
+    thing_id = _get_thing_id(request)
+    thing_service = request.app['thing_service']  # type: AbsThingService
+    event_journal = request.app['event_journal']  # type: EventJournal
+
+    try:
+        since, until = _get_time_range(request.query)
+
+    except ValueError:
+        return make_json_response(
+            status=400,
+            content=ERROR_TEMPLATES[3120].to_dict()
+        )
+
+    try:
+        thing_service.view(thing_id)
+
+    except ServiceEntityResolutionError:
+        return make_json_response(
+            status=404,
+            content=ERROR_TEMPLATES[1005].to_dict()
+        )
+
+    except AuthInsufficientPrivilegesError:
+        error_dict = ERROR_TEMPLATES[2110].to_dict()
+
+        error_dict["user_message"] = error_dict["user_message"].format(
+            action="viewing of things history"
+        )
+
+        return make_json_response(
+            status=403,
+            content=error_dict
+        )
+
+    cursor = event_journal.open_cursor(
+        key='things/%s' % thing_id, since=since, until=until
+    )
+
+    response = web.StreamResponse()
+    response.content_type = CONTENT_TYPE_JSON
+    await response.prepare(request)
+
+    try:
+        response.write(b'{"history": [')
+        separator = b''
+
+        while True:
+            records = await cursor.fetch(HISTORY_CHUNK_SIZE)
+
+            if not records:
+                break
+
+            for record in records:
+                response.write(separator + _format_history_record(record))
+                separator = b', '
+
+            await response.drain()
+
+        response.write(b']}')
+        await response.write_eof()
+
+    finally:
+        await cursor.close()
+
+    return response
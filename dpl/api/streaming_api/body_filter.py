@@ -0,0 +1,231 @@
+"""
+This module contains a compiler of filter expressions - of declarative
+conditions over fields of message bodies (DTOs of objects) which are
+specified by clients on subscription.
+
+Expressions are JSON objects of the following forms:
+
+- ``{"field": "temperature_c", "gt": 30}`` - a comparison of a field value;
+  supported operators: eq, ne, gt, ge, lt, le, in (the value is one of the
+  listed ones), contains (the list or string value contains the specified
+  item) and exists (the field is present or not);
+- ``{"field": "is_available", "changed": true}`` - the field value was
+  changed by this update (or was not changed, if false);
+- ``{"and": [expr, ...]}``, ``{"or": [expr, ...]}`` and ``{"not": expr}``.
+
+Fields of nested objects are referenced with dots: ``metadata.vendor``.
+Comparisons with absent fields and with values of incompatible types are
+false.
+"""
+import operator
+from collections import abc
+from typing import Any, Callable, Mapping, Optional
+
+
+# a compiled filter: accepts the current and the previous (if known) body
+# of a message and returns True if the message must to be sent
+BodyPredicate = Callable[[Mapping, Optional[Mapping]], bool]
+
+# a value returned for absent fields
+_MISSING = object()
+
+# the maximal depth of nested logical expressions
+MAX_DEPTH = 16
+
+
+class FilterSyntaxError(ValueError):
+    """
+    An exception to be raised if a filter expression is malformed
+    """
+    pass
+
+
+def _contains(container: Any, item: Any) -> bool:
+    if not isinstance(container, (list, str)):
+        return False
+
+    return item in container
+
+
+def _is_in(value: Any, options: Any) -> bool:
+    return value in options
+
+
+COMPARISONS = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'gt': operator.gt,
+    'ge': operator.ge,
+    'lt': operator.lt,
+    'le': operator.le,
+    'in': _is_in,
+    'contains': _contains,
+}  # type: Mapping[str, Callable[[Any, Any], bool]]
+
+
+def _compile_getter(field: str) -> Callable[[Optional[Mapping]], Any]:
+    """
+    Compiles a function which extracts the value of the specified field from
+    a body of a message
+
+    :param field: a name of the field, nested fields are separated by dots
+    :return: a function which returns the value or _MISSING
+    """
+    path = field.split('.')
+
+    if len(path) == 1:
+        def _get(body):
+            if body is None:
+                return _MISSING
+
+            return body.get(field, _MISSING)
+
+        return _get
+
+    def _get_nested(body):
+        value = body
+
+        for key in path:
+            if not isinstance(value, abc.Mapping):
+                return _MISSING
+
+            value = value.get(key, _MISSING)
+
+        return value
+
+    return _get_nested
+
+
+def _compile_field(expression: Mapping) -> BodyPredicate:
+    field = expression['field']
+
+    if not isinstance(field, str) or not field:
+        raise FilterSyntaxError("field must be a non-empty string")
+
+    operators = [key for key in expression if key != 'field']
+
+    if len(operators) != 1:
+        raise FilterSyntaxError(
+            "exactly one operator must be specified for field %s" % field
+        )
+
+    name = operators[0]
+    operand = expression[name]
+    get = _compile_getter(field)
+
+    if name == 'changed':
+        if not isinstance(operand, bool):
+            raise FilterSyntaxError("the value of changed must be a boolean")
+
+        def _changed(body, previous):
+            # the update is considered a change if the previous state is
+            # unknown
+            if previous is None:
+                return True
+
+            return get(body) != get(previous)
+
+        if operand:
+            return _changed
+
+        return lambda body, previous: not _changed(body, previous)
+
+    if name == 'exists':
+        if not isinstance(operand, bool):
+            raise FilterSyntaxError("the value of exists must be a boolean")
+
+        return lambda body, previous: (get(body) is not _MISSING) == operand
+
+    compare = COMPARISONS.get(name)
+
+    if compare is None:
+        raise FilterSyntaxError("unknown operator: %s" % name)
+
+    if name == 'in':
+        if not isinstance(operand, list):
+            raise FilterSyntaxError("the value of in must be a list")
+
+        # membership in a list of hashable values is checked in a set
+        if all(isinstance(item, (str, int, float, bool, type(None)))
+               for item in operand):
+            operand = frozenset(operand)
+
+    def _compare(body, previous):
+        value = get(body)
+
+        if value is _MISSING:
+            return False
+
+        try:
+            return bool(compare(value, operand))
+        except TypeError:
+            return False
+
+    return _compare
+
+
+def _compile(expression: Any, depth: int) -> BodyPredicate:
+    if depth > MAX_DEPTH:
+        raise FilterSyntaxError("the expression is nested too deeply")
+
+    if not isinstance(expression, abc.Mapping):
+        raise FilterSyntaxError("an expression must be an object")
+
+    if 'field' in expression:
+        return _compile_field(expression)
+
+    if len(expression) != 1:
+        raise FilterSyntaxError(
+            "an expression must contain either a field or a single one of "
+            "and, or, not"
+        )
+
+    name, operand = next(iter(expression.items()))
+
+    if name == 'not':
+        inner = _compile(operand, depth + 1)
+        return lambda body, previous: not inner(body, previous)
+
+    if name not in ('and', 'or'):
+        raise FilterSyntaxError("unknown logical operator: %s" % name)
+
+    if not isinstance(operand, list) or not operand:
+        raise FilterSyntaxError(
+            "the value of %s must be a non-empty list" % name
+        )
+
+    inner_predicates = tuple(_compile(item, depth + 1) for item in operand)
+
+    if name == 'and':
+        return lambda body, previous: all(
+            predicate(body, previous) for predicate in inner_predicates
+        )
+
+    return lambda body, previous: any(
+        predicate(body, previous) for predicate in inner_predicates
+    )
+
+
+def compile_filter(expression: Any) -> BodyPredicate:
+    """
+    Compiles the filter expression to a predicate. Is called once for each
+    subscription, the compiled predicate is evaluated for each message
+
+    :param expression: a filter expression, parsed from JSON
+    :return: a compiled predicate
+    :raises FilterSyntaxError: if the expression is malformed
+    """
+    return _compile(expression, depth=0)
+
+
+def any_of(*predicates: BodyPredicate) -> BodyPredicate:
+    """
+    Combines several predicates: a message passes the combined predicate if
+    it passes any of them
+
+    :param predicates: predicates to be combined
+    :return: a combined predicate
+    """
+    return lambda body, previous: any(
+        predicate(body, previous) for predicate in predicates
+    )
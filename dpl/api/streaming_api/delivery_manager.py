@@ -3,65 +3,74 @@ This module contains a definition of DeliveryManager - of a class which
 controls delivery of the messages and stores all the undelivered messages
 """
 import asyncio
+import heapq
 import logging
-from typing import Dict, Optional
+from typing import Dict, Optional, Callable, Iterable, List, Set, Tuple
 from collections import OrderedDict
 
 from dpl.model.domain_id import TDomainId
 from .message import Message
+from .pending_queue import (
+    PendingQueue, OverflowPolicy, PendingQueueOverflowError
+)
+from .retained_store import AbsRetainedStore, NullRetainedStore
+from .replay_buffer import ReplayBuffer, ReplayOffsetError
+from .metrics import StreamingMetrics
 
 
 LOGGER = logging.getLogger(__name__)
 
-
-def clear_queue(queue: asyncio.Queue) -> None:
-    """
-    Removes all elements from the specified Queue
-
-    :param queue: a Queue to be cleared
-    :return: None
-    """
-    try:
-        while not queue.empty():
-            queue.get_nowait()
-    except asyncio.QueueEmpty:
-        LOGGER.error("Multitasking issue: something exhausted the queue while "
-                     "queue cleaning was in progress")
+# a callable to be called with an identifier of Session if the client is
+# too slow to consume pending messages and must to be disconnected
+SlowConsumerHandler = Callable[[TDomainId], None]
 
 
 class RescheduledItem(object):
     """
     RescheduledItem is structure data type used for storage of information for
     re-scheduled (i.e. not acknowledged) Tracked Messages. The information to
-    be saved is a message itself, a re-scheduling task and a number of
-    re-schedules already performed.
+    be saved is a message itself, a moment of the next retransmission and a
+    number of re-schedules already performed.
     """
 
     def __init__(
-            self, message: Message,
-            delayed_reschedule: Optional[asyncio.Future] = None,
-            number_of_reschedules: int = 0
+            self, message: Message, retransmit_at: float,
+            number_of_reschedules: int = 0, backoff_epoch: int = 0,
+            sent_at: float = 0
     ):
         """
         Constructor. Sets the specified field values
 
         :param message: a message to be sent
-        :param delayed_reschedule: a Task for a coroutine that adds a message
-               back to the queue of pending messages after some delay
+        :param retransmit_at: a moment of time (in terms of event loop time)
+               when the message must to be sent again if its delivery will
+               not be acknowledged
         :param number_of_reschedules: number of re-schedule attempts
                already performed
+        :param backoff_epoch: a value of SessionRetainedStorage.backoff_epoch
+               at the moment of the last re-schedule
+        :param sent_at: a moment of time (in terms of event loop time) when
+               the message was queued to be sent for the last time
         """
         assert message.message_id is not None
         self.message = message
-        self.delayed_reschedule = delayed_reschedule
+        self.retransmit_at = retransmit_at
+        self.sent_at = sent_at
         self.number_of_reschedules = number_of_reschedules
+        self.backoff_epoch = backoff_epoch
+        self.is_in_flight = True
+
+
+# a heap of retransmission timers: pairs of a retransmission moment and of
+# an identifier of a message
+RetransmissionTimers = List[Tuple[float, int]]
 
 
 class SessionRetainedStorage(object):
     """
     A structure that contains information about the list of retained
-    undelivered messages, the number of retransmissions already performed and
-    the Future that is currently handling retransmissions for this Session
+    undelivered messages, their retransmission timers and the Future that is
+    currently handling retransmissions for this Session
     """
     def __init__(self, loop: asyncio.AbstractEventLoop = None):
         """
@@ -71,12 +80,30 @@ class SessionRetainedStorage(object):
         :param loop: an instance of EventLoop to be used for asyncio Lock
                instantiation
         """
-        self.messages = OrderedDict()  # type: OrderedDict[int, Message]
-        self.delay = 1
+        self.messages = OrderedDict()  # type: OrderedDict[int, RescheduledItem]
         self.retransmission_handler = None  # type: Optional[asyncio.Future]
-        self.messages_lock = asyncio.Lock(loop=None)
-        self.last_message_number = 0
-        self.has_retained_event = asyncio.Event(loop=loop)
+        self.messages_lock = asyncio.Lock(loop=loop)
+
+        # is set if retransmission handler must to check timers earlier
+        self.wakeup_event = asyncio.Event(loop=loop)
+
+        # timers of messages which were sent and are waiting for
+        # acknowledgement (i.e. are in flight); timers of acknowledged and
+        # re-scheduled messages are not removed and just ignored
+        self.timers = list()  # type: RetransmissionTimers
+        self.in_flight = 0
+
+        # identifiers of messages which timers expired and which are waiting
+        # for a free space in the retransmission window
+        self.ready = OrderedDict()  # type: OrderedDict[int, None]
+
+        # is incremented on each acknowledgement; a change of epoch resets
+        # the backoff of retransmission delays for all messages
+        self.backoff_epoch = 0
+
+        # identifiers of the latest retained message for each of conflated
+        # topics
+        self.latest_by_topic = dict()  # type: Dict[str, int]
 
 
 # SessionRescheduledRegistry is Mapping of a unique message identifier and
@@ -91,10 +118,27 @@ class DeliveryManager(object):
     control acknowledgements and automatically re-schedules delivery of
     unacknowledged messages if the delivery was not acknowledged by a client
     """
-    MAX_MESSAGE_ID = 65536
     MAX_RETRANSMISSION_DELAY = 14400
+    DEFAULT_MAX_PENDING = 1000
+    DEFAULT_RETRANSMISSION_WINDOW = 32
+    DEFAULT_RETRANSMISSION_TIMEOUT = 1
+    DEFAULT_REPLAY_BUFFER_SIZE = 1000
 
-    def __init__(self, *, loop: asyncio.AbstractEventLoop = None):
+    # the minimum queue depth to be reported in logs as a high-water mark
+    MIN_REPORTED_DEPTH = 64
+
+    def __init__(
+            self, *, loop: asyncio.AbstractEventLoop = None,
+            max_pending_messages: int = DEFAULT_MAX_PENDING,
+            overflow_policy: OverflowPolicy = OverflowPolicy.drop_oldest,
+            slow_consumer_handler: Optional[SlowConsumerHandler] = None,
+            retransmission_window: int = DEFAULT_RETRANSMISSION_WINDOW,
+            retransmission_timeout: float = DEFAULT_RETRANSMISSION_TIMEOUT,
+            retained_store: Optional[AbsRetainedStore] = None,
+            replay_buffer_size: int = DEFAULT_REPLAY_BUFFER_SIZE,
+            metrics: Optional[StreamingMetrics] = None,
+            max_retained_messages: Optional[int] = None
+    ):
         """
         Constructor. Receives an instance of EventLoop that will handle message
         re-scheduling and will be bonded with a queue of pending messages.
@@ -102,16 +146,114 @@ class DeliveryManager(object):
 
         :param loop: an instance of EventLoop that will be used for message
                re-scheduling and that will be associated with a message queue
+        :param max_pending_messages: the maximum number of messages pending
+               on delivery for each Session
+        :param overflow_policy: a policy to be applied if the queue of
+               pending messages is full
+        :param slow_consumer_handler: a callable to be called if a Session
+               must to be disconnected according to the overflow policy
+        :param retransmission_window: the maximum number of retransmitted
+               messages which delivery is not acknowledged yet (i.e. which
+               are in flight) for each Session
+        :param retransmission_timeout: the time to wait for acknowledgement
+               before the first retransmission of a message; is doubled with
+               each retransmission until the progress (any acknowledgement)
+        :param retained_store: a storage to save retained messages to, so
+               they survive restarts; retained messages are kept only in
+               memory if not specified
+        :param replay_buffer_size: the number of the latest data messages
+               to be kept for each Session to be replayed on resumption
+        :param metrics: a collector of delivery metrics; metrics are not
+               collected if not specified
+        :param max_retained_messages: the maximum number of retained
+               messages of all Sessions; if exceeded, then the oldest
+               retained messages are dropped (as if they were acknowledged);
+               not limited if None
         """
-        self._loop = loop
+        if loop is None:
+            self._loop = asyncio.get_event_loop()
+        else:
+            self._loop = loop
+
+        self._retransmission_window = retransmission_window
+        self._retransmission_timeout = retransmission_timeout
+        self._max_pending = max_pending_messages
+        self._overflow_policy = overflow_policy
+        self._slow_consumer_handler = slow_consumer_handler
+
+        if retained_store is None:
+            retained_store = NullRetainedStore()
+
+        self._retained_store = retained_store
+        self._replay_buffer_size = replay_buffer_size
+        self._metrics = metrics
+        self._max_retained = max_retained_messages
 
         # contains a query of ready-to-be-sent messages for each opened session
-        self._pending_messages = dict()  # type: Dict[TDomainId, asyncio.Queue]
+        self._pending_messages = dict()  # type: Dict[TDomainId, PendingQueue]
 
         # contains a per-session registry of unacknowledged messages and
         # related information
         self._retained = dict()  # type: Dict[TDomainId,SessionRetainedStorage]
 
+        # contains a per-session buffer of the latest sent data messages
+        self._replay = dict()  # type: Dict[TDomainId, ReplayBuffer]
+
+        # retained messages of all Sessions from the oldest to the newest
+        # one; is maintained only if the number of them is limited
+        self._retained_order = OrderedDict()  # type: OrderedDict[Tuple[TDomainId, int], None]
+
+    async def open(self) -> None:
+        """
+        Opens the storage of retained messages and restores all the messages
+        which were not acknowledged before the last shutdown. Restored
+        messages are sent again on the next resume_for call for their
+        Sessions. Sequences of messages are continued after the restored
+        ones
+
+        :return: None
+        """
+        await self._retained_store.open()
+
+        records = await self._loop.run_in_executor(
+            None, lambda: list(self._retained_store.load())
+        )
+
+        for session_id, message, conflate in records:
+            session_retained = self._get_retained_storage(session_id)
+            message_id = message.message_id
+            message.seq = message_id
+
+            item = RescheduledItem(message=message, retransmit_at=0)
+            item.is_in_flight = False
+
+            session_retained.messages[message_id] = item
+            session_retained.ready[message_id] = None
+            self._get_replay_buffer(session_id).last_seq = message_id
+
+            if conflate:
+                session_retained.latest_by_topic[message.topic] = message_id
+
+            if self._max_retained is not None:
+                self._retained_order[(session_id, message_id)] = None
+
+        if self._max_retained is not None:
+            self._enforce_retained_limit()
+
+        if records:
+            LOGGER.info(
+                "Restored %d retained messages for %d Sessions",
+                len(records), len(self._retained)
+            )
+
+    async def close(self) -> None:
+        """
+        Saves all the changes of retained messages and closes the storage
+
+        :return: None
+        """
+        await self._retained_store.close()
+
     async def get_message(self, session_id: TDomainId) -> Message:
         """
         Attempts to extract the new message from a queue of pending messages.
@@ -122,22 +264,47 @@ class DeliveryManager(object):
         :return: a new message from a queue of pending message
         :raises KeyError: if a queue for the specified Session can't be found
         """
-        session_queue = self._pending_messages.setdefault(
-            session_id, asyncio.Queue(loop=self._loop)
-        )
+        session_queue = self._get_pending_queue(session_id)
+
+        return await session_queue.get()
 
-        result = await session_queue.get()
-        session_queue.task_done()
-        return result
+    async def get_messages(
+            self, session_id: TDomainId, max_count: int,
+            flush_window: float = 0
+    ) -> List[Message]:
+        """
+        Extracts a batch of messages from a queue of pending messages. Blocks
+        until at least one message is available, then waits for flush_window
+        seconds to collect more messages and returns up to max_count of them
+        in order
+
+        :param session_id: an identifier of Session for which the new
+               messages must to be retrieved
+        :param max_count: the maximum number of messages to be returned
+        :param flush_window: the time to wait for more messages after the
+               first one; if zero, then only already pending messages are
+               returned
+        :return: a list of messages from a queue of pending messages
+        :raises KeyError: if a queue for the specified Session can't be found
+        """
+        session_queue = self._get_pending_queue(session_id)
+        first = await session_queue.get()
+
+        if flush_window > 0 and max_count > 1:
+            await asyncio.sleep(flush_window, loop=self._loop)
+
+        batch = [first]
+        batch.extend(session_queue.drain_nowait(max_count - 1))
+
+        return batch
 
     async def put_message(
             self, session_id: TDomainId, message: Message,
-            ensure_delivery: bool = False
+            ensure_delivery: bool = False, conflate: bool = False
     ) -> None:
         """
         Attempts to put a new message in a queue of pending messages for the
-        specified Session. Blocks if the maximum number of pending messages
-        was reached
+        specified Session. Never blocks; see put_message_nowait for details
 
         :param session_id: an identifier of Session for which the new message
                must to be added to the list of pending messages
@@ -145,60 +312,229 @@ class DeliveryManager(object):
                for this Session
         :param ensure_delivery: if the delivery of this message must to be
                acknowledged by client
+        :param conflate: if this message must to replace an unacknowledged
+               message with the same topic
         :return: None
         """
-        await self._add_to_pending(session_id=session_id, message=message)
+        self.put_message_nowait(
+            session_id=session_id, message=message,
+            ensure_delivery=ensure_delivery, conflate=conflate
+        )
+
+    def put_message_nowait(
+            self, session_id: TDomainId, message: Message,
+            ensure_delivery: bool = False, conflate: bool = False
+    ) -> None:
+        """
+        Puts a new message in a queue of pending messages for the specified
+        Session. If the maximum number of pending messages was reached, then
+        the configured overflow policy is applied. Thus a slow client never
+        blocks delivery of messages to other Sessions.
+
+        Data messages receive the next sequence number of the Session and are
+        saved to be replayed on resumption, so each instance of a data message
+        must to be put only for a single Session
+
+        :param session_id: an identifier of Session for which the new message
+               must to be added to the list of pending messages
+        :param message: a message to be added to the list of pending messages
+               for this Session
+        :param ensure_delivery: if the delivery of this message must to be
+               acknowledged by client
+        :param conflate: if this message must to replace an unacknowledged
+               message with the same topic; makes sense only if the delivery
+               of this message must to be acknowledged
+        :return: None
+        """
+        if message.type == 'data':
+            self._get_replay_buffer(session_id).append(message)
 
         if ensure_delivery:
-            await self._add_to_retained(session_id=session_id, message=message)
+            self._add_to_retained(
+                session_id=session_id, message=message, conflate=conflate
+            )
+
+        self._add_to_pending(session_id=session_id, message=message)
+
+    def record_message(self, session_id: TDomainId, message: Message) -> None:
+        """
+        Assigns the next sequence number of the Session to the data message
+        and saves it to be replayed on resumption, but doesn't send it now.
+        Is used for Sessions which are not connected
+
+        :param session_id: an identifier of Session
+        :param message: a data message to be saved
+        :return: None
+        """
+        assert message.type == 'data'
+        self._get_replay_buffer(session_id).append(message)
 
     async def ack_delivery(
-            self, session_id: TDomainId, message_id: int
-    ) -> None:
+            self, session_id: TDomainId, message_id: Optional[int] = None,
+            *, up_to: Optional[int] = None,
+            ranges: Iterable[Tuple[int, int]] = ()
+    ) -> int:
         """
-        Acknowledges the delivery of a TrackedMessage. Removes the message
-        with the specified ID from the list of rescheduled messages
+        Acknowledges the delivery of TrackedMessages. Removes the specified
+        messages from the list of rescheduled messages. All of the
+        acknowledgements are processed at once, under a single acquisition of
+        the lock
 
-        :param session_id: an identifier of Session for which the message
+        :param session_id: an identifier of Session for which the messages
                must to be acknowledged
         :param message_id: an identifier of a message to be acknowledged
-        :return: None
+        :param up_to: an identifier of a message which must to be
+               acknowledged together with all messages with lesser
+               identifiers (cumulative acknowledgement)
+        :param ranges: pairs of identifiers of the first and the last message
+               in a range of messages to be acknowledged (both inclusive)
+        :return: the number of messages which were acknowledged
         """
         session_retained = self._retained.get(session_id)
 
         if session_retained is None:
             LOGGER.warning(
                 "Acknowledge received for a closed or unopened Session: %s. "
-                "Message #%d", session_id, message_id)
-            return
+                "Message #%s, up to #%s, ranges: %s",
+                session_id, message_id, up_to, list(ranges)
+            )
+            return 0
 
         async with session_retained.messages_lock:
-            if message_id in session_retained.messages:
-                self._remove_retained(message_id, session_retained)
-            else:
-                LOGGER.info(
-                    "Message #%d was already acknowledged, ignored. "
-                    "Session %s.", message_id, session_id
+            acked = list()  # type: List[int]
+
+            if message_id is not None:
+                if message_id in session_retained.messages:
+                    acked.append(message_id)
+                else:
+                    LOGGER.info(
+                        "Message #%d was already acknowledged, ignored. "
+                        "Session %s.", message_id, session_id
+                    )
+
+            if up_to is not None:
+                acked.extend(self._select_up_to(up_to, session_retained))
+
+            for first, last in ranges:
+                acked.extend(
+                    self._select_range(first, last, session_retained)
                 )
 
+            if not acked:
+                return 0
+
+            return self._remove_retained(session_id, acked, session_retained)
+
     @staticmethod
-    def _remove_retained(
+    def _select_up_to(
             message_id: int, session_retained: SessionRetainedStorage
-    ):
+    ) -> List[int]:
+        """
+        Returns identifiers of all retained messages which are not greater
+        than the specified one
+
+        :param message_id: an identifier of the newest message to be selected
+        :param session_retained: a storage of retained messages
+        :return: a list of identifiers of selected messages
+        """
+        selected = list()
+
+        # messages are ordered from the oldest to the newest one
+        for retained_id in session_retained.messages:
+            if retained_id > message_id:
+                break
+
+            selected.append(retained_id)
+
+        return selected
+
+    @staticmethod
+    def _select_range(
+            first: int, last: int, session_retained: SessionRetainedStorage
+    ) -> List[int]:
+        """
+        Returns identifiers of all retained messages in the specified range
+
+        :param first: an identifier of the first message in the range
+        :param last: an identifier of the last message in the range
+        :param session_retained: a storage of retained messages
+        :return: a list of identifiers of selected messages
+        """
+        messages = session_retained.messages
+
+        if last - first < len(messages):
+            return [
+                item for item in range(first, last + 1) if item in messages
+            ]
+
+        return [item for item in messages if first <= item <= last]
+
+    def _remove_retained(
+            self, session_id: TDomainId, message_ids: Iterable[int],
+            session_retained: SessionRetainedStorage
+    ) -> int:
         """
-        Removes the message from a list of retained messages. Sets the number
-        of retransmissions to zero and stops the has_retained_event if there
-        is no messages left.
+        Removes the messages from a list of retained messages. Resets the
+        backoff of retransmissions for all the remaining messages and wakes up
+        the retransmission handler, because there is a free space in the
+        retransmission window now.
 
+        :param session_id: an identifier of Session
+        :param message_ids: identifiers of messages to be removed
+        :param session_retained: a storage of retained messages
+        :return: the number of removed messages
+        """
+        removed = list()
+        sent_at = list()  # type: List[float]
+        messages = session_retained.messages
+
+        for message_id in message_ids:
+            if message_id in messages:
+                if self._metrics is not None:
+                    sent_at.append(messages[message_id].sent_at)
+
+                self._drop_retained(session_id, message_id, session_retained)
+                removed.append(message_id)
+
+        if self._metrics is not None:
+            now = self._loop.time()
+            self._metrics.on_acknowledged(
+                session_id, [now - moment for moment in sent_at]
+            )
+
+        self._retained_store.remove(session_id, removed)
+        session_retained.backoff_epoch += 1
+        session_retained.wakeup_event.set()
+
+        return len(removed)
+
+    def _drop_retained(
+            self, session_id: TDomainId, message_id: int,
+            session_retained: SessionRetainedStorage
+    ) -> None:
+        """
+        Removes the message from a list of retained messages and from the
+        retransmission window
+
+        :param session_id: an identifier of Session
         :param message_id: an identifier of a message to be removed
         :param session_retained: a storage of retained messages
         :return: None
         """
-        session_retained.messages.pop(message_id)
-        session_retained.delay = 1
+        item = session_retained.messages.pop(message_id)
 
-        if not session_retained.messages:  # if there is no messages left
-            session_retained.has_retained_event.clear()  # ...stop event
+        if self._max_retained is not None:
+            self._retained_order.pop((session_id, message_id), None)
+
+        if item.is_in_flight:
+            session_retained.in_flight -= 1
+        else:
+            session_retained.ready.pop(message_id, None)
+
+        topic = item.message.topic
+
+        if session_retained.latest_by_topic.get(topic) == message_id:
+            session_retained.latest_by_topic.pop(topic)
 
     async def pause_for(self, session_id: TDomainId) -> None:
         """
@@ -211,29 +547,85 @@ class DeliveryManager(object):
         """
         session_retained = self._retained.get(session_id)
 
-        if session_retained is not None:
-            assert session_retained.retransmission_handler is not None
+        # Sessions restored on open have no retransmission handler until
+        # they are resumed
+        if session_retained is not None and \
+                session_retained.retransmission_handler is not None:
             session_retained.retransmission_handler.cancel()
             # await session_retained.retransmission_handler
 
         queue = self._pending_messages.get(session_id)
 
         if queue is not None:
-            clear_queue(queue)
+            queue.clear()
 
-    async def resume_for(self, session_id: TDomainId) -> None:
+    async def resume_for(
+            self, session_id: TDomainId, resume_from: Optional[int] = None
+    ) -> bool:
         """
-        Adds back all undelivered messages to the queue of pending messages
+        Resumes delivery for the specified Session.
+
+        If an offset to resume from was specified, then all the pending
+        messages are replaced with the data messages which sequence numbers
+        are greater than the offset (i.e. with messages missed by a client),
+        in order. Otherwise all the pending messages are kept.
+
+        All undelivered retained messages are sent again, in order, in
+        portions limited by the retransmission window; the replayed ones are
+        considered as already sent
 
         :param session_id: an identifier of Session for which communication
                must to be resumed
-        :return: None
+        :param resume_from: a sequence number of the last data message
+               received by a client or None
+        :return: False if messages after the specified offset are not
+                 available anymore and the client must to resync its state,
+                 True otherwise
         """
-        session_retained = self._retained.setdefault(
-            session_id, SessionRetainedStorage()
-        )
+        session_retained = self._get_retained_storage(session_id)
+        is_resumed = True
+        replayed_after = None  # type: Optional[int]
+
+        if resume_from is not None:
+            queue = self._get_pending_queue(session_id)
+
+            try:
+                missed = self._get_replay_buffer(session_id).since(
+                    resume_from
+                )
+            except ReplayOffsetError:
+                LOGGER.info(
+                    "Unable to resume %s from #%d, resync is needed",
+                    session_id, resume_from
+                )
+                queue.clear()
+                is_resumed = False
+            else:
+                queue.replace(missed)
+                replayed_after = resume_from
+
+        # all unacknowledged messages are ready to be sent again, except
+        # the just replayed ones
+        session_retained.timers.clear()
+        session_retained.in_flight = 0
+        session_retained.ready = OrderedDict()
+        session_retained.backoff_epoch += 1
+        retransmit_at = self._loop.time() + self._retransmission_timeout
+
+        for message_id, item in session_retained.messages.items():
+            if replayed_after is not None and message_id > replayed_after:
+                item.is_in_flight = True
+                item.sent_at = retransmit_at - self._retransmission_timeout
+                item.retransmit_at = retransmit_at
+                item.number_of_reschedules = 0
+                session_retained.in_flight += 1
+                heapq.heappush(
+                    session_retained.timers, (retransmit_at, message_id)
+                )
+            else:
+                item.is_in_flight = False
+                session_retained.ready[message_id] = None
 
-        session_retained.delay = 1
         old_handler = session_retained.retransmission_handler
 
         if old_handler is not None and not old_handler.done():
@@ -248,6 +640,71 @@ class DeliveryManager(object):
             loop=self._loop
         )
 
+        return is_resumed
+
+    def get_last_seq(self, session_id: TDomainId) -> int:
+        """
+        Returns the sequence number of the latest data message which was
+        put for the specified Session
+
+        :param session_id: an identifier of Session
+        :return: the latest sequence number or zero if there was no messages
+        """
+        replay = self._replay.get(session_id)
+
+        return 0 if replay is None else replay.last_seq
+
+    def list_sessions(self) -> Set[TDomainId]:
+        """
+        Returns identifiers of all Sessions for which any data (pending,
+        retained or replayable messages) is stored
+
+        :return: a set of Session identifiers
+        """
+        return (
+            self._pending_messages.keys() | self._retained.keys() |
+            self._replay.keys()
+        )
+
+    def get_gauges(self) -> Dict[TDomainId, Dict[str, int]]:
+        """
+        Returns the current state of queues of all known Sessions: the number
+        of pending messages and its high-water mark, the number of retained
+        (unacknowledged) messages, the number of them in flight and the
+        number of them waiting for a free space in the retransmission window
+
+        :return: a mapping of Session identifiers to the mapping of gauge
+                 names to their values
+        """
+        gauges = dict()  # type: Dict[TDomainId, Dict[str, int]]
+
+        session_ids = self._pending_messages.keys() | self._retained.keys()
+
+        for session_id in session_ids:
+            queue = self._pending_messages.get(session_id)
+            session_retained = self._retained.get(session_id)
+
+            gauges[session_id] = {
+                'pending': 0 if queue is None else queue.qsize(),
+                'pending_high_water_mark': (
+                    0 if queue is None else queue.high_water_mark
+                ),
+                'retained': (
+                    0 if session_retained is None
+                    else len(session_retained.messages)
+                ),
+                'in_flight': (
+                    0 if session_retained is None
+                    else session_retained.in_flight
+                ),
+                'waiting_retransmission': (
+                    0 if session_retained is None
+                    else len(session_retained.ready)
+                )
+            }
+
+        return gauges
+
     async def discard_for(self, session_id: TDomainId) -> None:
         """
         Stops all retransmissions and discard all stored data for the specified
@@ -262,13 +719,78 @@ class DeliveryManager(object):
             self._pending_messages.pop(session_id)
 
         if session_id in self._retained:
-            self._retained.pop(session_id)
+            session_retained = self._retained.pop(session_id)
+            self._retained_store.discard(session_id)
+
+            if self._max_retained is not None:
+                for message_id in session_retained.messages:
+                    self._retained_order.pop((session_id, message_id), None)
+
+        self._replay.pop(session_id, None)
+
+        if self._metrics is not None:
+            self._metrics.forget(session_id)
+
+    def _get_retained_storage(
+            self, session_id: TDomainId
+    ) -> SessionRetainedStorage:
+        """
+        Returns a storage of retained messages for the specified Session.
+        Creates a new one if needed
+
+        :param session_id: an identifier of Session
+        :return: a storage of retained messages
+        """
+        session_retained = self._retained.get(session_id)
+
+        if session_retained is None:
+            session_retained = SessionRetainedStorage(loop=self._loop)
+            self._retained[session_id] = session_retained
+
+        return session_retained
+
+    def _get_replay_buffer(self, session_id: TDomainId) -> ReplayBuffer:
+        """
+        Returns a buffer of the latest data messages for the specified
+        Session. Creates a new one if needed
+
+        :param session_id: an identifier of Session
+        :return: a buffer of the latest data messages
+        """
+        replay = self._replay.get(session_id)
+
+        if replay is None:
+            replay = ReplayBuffer(max_size=self._replay_buffer_size)
+            self._replay[session_id] = replay
+
+        return replay
 
-    async def _add_to_pending(
-            self, session_id: TDomainId, message: Message
+    def _get_pending_queue(self, session_id: TDomainId) -> PendingQueue:
+        """
+        Returns a queue of pending messages for the specified Session.
+        Creates a new one if needed
+
+        :param session_id: an identifier of Session
+        :return: a queue of pending messages
+        """
+        session_queue = self._pending_messages.get(session_id)
+
+        if session_queue is None:
+            session_queue = PendingQueue(
+                max_size=self._max_pending, policy=self._overflow_policy,
+                loop=self._loop
+            )
+            self._pending_messages[session_id] = session_queue
+
+        return session_queue
+
+    def _add_to_pending(
+            self, session_id: TDomainId, message: Message,
+            is_retransmission: bool = False
     ) -> None:
         """
-        Adds a Message to the list of pending (on delivery) messages
+        Adds a Message to the list of pending (on delivery) messages. Applies
+        the overflow policy if the queue of pending messages is full
 
         :param session_id: an identifier of Session for which the new message
                must to be added to the list of pending messages
@@ -276,31 +798,102 @@ class DeliveryManager(object):
                for this Session
         :return: None
         """
-        session_queue = self._pending_messages.setdefault(
-            session_id, asyncio.Queue(loop=self._loop)
-        )
-        await session_queue.put(message)
+        session_queue = self._get_pending_queue(session_id)
+        old_high_water_mark = session_queue.high_water_mark
+
+        if self._metrics is not None:
+            message.enqueued_at = self._loop.time()
+
+        try:
+            dropped = session_queue.put_nowait(message, is_retransmission)
+        except PendingQueueOverflowError:
+            self._on_slow_consumer(session_id, session_queue)
+            return
+
+        if dropped is not None:
+            if self._metrics is not None:
+                self._metrics.on_dropped(session_id)
+
+            LOGGER.debug(
+                "Pending queue overflow for %s, message on topic %s dropped",
+                session_id, dropped.topic
+            )
+
+        depth = session_queue.high_water_mark
+
+        if depth > old_high_water_mark and self._is_reported_depth(depth):
+            LOGGER.info(
+                "New high-water mark of pending messages for %s: %d of %d",
+                session_id, depth, session_queue.max_size
+            )
+
         LOGGER.debug(
             "Pending %d messages for %s", session_queue.qsize(), session_id
         )
 
-    async def _add_to_retained(
-            self, session_id: TDomainId, message: Message
+    def _is_reported_depth(self, depth: int) -> bool:
+        """
+        Checks if the specified high-water mark of a pending queue must to be
+        logged. Only powers of two and the queue limit are reported to keep
+        logs quiet
+
+        :param depth: a new high-water mark
+        :return: True if the value must to be reported, False otherwise
+        """
+        if depth == self._max_pending:
+            return True
+
+        is_power_of_two = (depth & (depth - 1)) == 0
+
+        return is_power_of_two and depth >= self.MIN_REPORTED_DEPTH
+
+    def _on_slow_consumer(
+            self, session_id: TDomainId, session_queue: PendingQueue
     ) -> None:
         """
-        Adds a Message to the list of retained messages
+        Handles overflow of a pending queue if the slow consumer must to
+        be disconnected
+
+        :param session_id: an identifier of Session which is too slow
+        :param session_queue: a queue of pending messages for this Session
+        :return: None
+        """
+        LOGGER.warning(
+            "Pending queue overflow for %s: %d messages are pending, "
+            "disconnecting the slow consumer",
+            session_id, session_queue.qsize()
+        )
+
+        session_queue.clear()
+
+        if self._slow_consumer_handler is not None:
+            self._slow_consumer_handler(session_id)
+
+    def _add_to_retained(
+            self, session_id: TDomainId, message: Message,
+            conflate: bool = False
+    ) -> None:
+        """
+        Adds a Message to the list of retained messages. If conflation was
+        requested, then the older unacknowledged message with the same topic
+        is dropped, so only the latest value is retained for each topic.
+
+        Doesn't acquire the messages_lock: holders of the lock never yield
+        control inside their critical sections, so the storage is always in
+        a consistent state here
 
         :param session_id: an identifier of Session for which the new message
                must to be added to the list of retained messages
         :param message: a message to be added to the list of retained messages
                for this Session
+        :param conflate: if this message must to replace an unacknowledged
+               message with the same topic
         :return: None
         """
         assert message.message_id is None
+        assert message.seq is not None, "only data messages can be retained"
 
-        session_retained = self._retained.setdefault(
-            session_id, SessionRetainedStorage()
-        )
+        session_retained = self._get_retained_storage(session_id)
 
         if session_retained.retransmission_handler is None:
             session_retained.retransmission_handler = asyncio.ensure_future(
@@ -308,44 +901,204 @@ class DeliveryManager(object):
                 loop=self._loop
             )
 
-        async with session_retained.messages_lock:
-            last_message_id = session_retained.last_message_number
-            message.message_id = (last_message_id + 1) % self.MAX_MESSAGE_ID
-            session_retained.last_message_number = message.message_id
-            session_retained.messages[message.message_id] = message
-            session_retained.has_retained_event.set()
+        # sequence numbers are never reused, so they are used as
+        # identifiers of retained messages
+        message_id = message.seq
+        message.message_id = message_id
+
+        now = self._loop.time()
+        item = RescheduledItem(
+            message=message,
+            retransmit_at=now + self._retransmission_timeout,
+            backoff_epoch=session_retained.backoff_epoch, sent_at=now
+        )
+
+        session_retained.messages[message_id] = item
+        session_retained.in_flight += 1
+        heapq.heappush(session_retained.timers, (item.retransmit_at, message_id))
+
+        if session_retained.timers[0][1] == message_id:
+            # the retransmission handler may sleep without any timer set
+            session_retained.wakeup_event.set()
+
+        self._retained_store.add(session_id, message, conflate)
+
+        if conflate:
+            self._conflate_retained(session_id, session_retained, message)
+
+        if self._max_retained is not None:
+            self._retained_order[(session_id, message_id)] = None
+
+            if len(self._retained_order) > self._max_retained:
+                self._enforce_retained_limit()
+
+    def _enforce_retained_limit(self) -> None:
+        """
+        Drops the oldest retained messages of all Sessions until the number
+        of retained messages fits the limit. Dropped messages are not
+        retransmitted anymore, but are still available for replay on
+        resumption
+
+        :return: None
+        """
+        evicted = dict()  # type: Dict[TDomainId, int]
+
+        while len(self._retained_order) > self._max_retained:
+            session_id, message_id = next(iter(self._retained_order))
+            session_retained = self._retained[session_id]
+
+            self._drop_retained(session_id, message_id, session_retained)
+            self._retained_store.remove(session_id, (message_id, ))
+            # a space in the retransmission window may be freed
+            session_retained.wakeup_event.set()
+
+            evicted[session_id] = evicted.get(session_id, 0) + 1
+
+        for session_id, count in evicted.items():
+            LOGGER.warning(
+                "The limit of retained messages is reached, %d oldest "
+                "messages of %s are dropped", count, session_id
+            )
+
+            if self._metrics is not None:
+                self._metrics.on_evicted(session_id, count)
+
+    def _conflate_retained(
+            self, session_id: TDomainId,
+            session_retained: SessionRetainedStorage, message: Message
+    ) -> None:
+        """
+        Marks the specified message as the latest one for its topic and drops
+        the previous unacknowledged message with the same topic
+
+        :param session_id: an identifier of Session
+        :param session_retained: a storage of retained messages
+        :param message: a just retained message
+        :return: None
+        """
+        previous_id = session_retained.latest_by_topic.get(message.topic)
+        session_retained.latest_by_topic[message.topic] = message.message_id
+
+        if previous_id in session_retained.messages:
+            self._drop_retained(session_id, previous_id, session_retained)
+            self._retained_store.remove(session_id, (previous_id, ))
 
     async def _retransmission_handler(
             self, session_id: TDomainId,
             session_retained: SessionRetainedStorage
     ) -> None:
         """
-        Watches the list of retained messages and adds them to the queue of
-        to-be-sent (pending) messages after some delay. Delay is growing
-        with a number of retransmission attempts already performed
+        Watches retransmission timers of retained messages and adds timed out
+        messages back to the queue of to-be-sent (pending) messages. Up to
+        retransmission_window messages can be in flight at the same time.
+        The delay before the next retransmission of each message is growing
+        with a number of retransmission attempts already performed and is
+        reset on any progress (acknowledgement)
 
         :param session_id: an identifier of Session this handler is assigned to
         :param session_retained: information about retained messages and
                retransmissions performed by this handler
         :return: None
         """
-        session_retained.delay = 1
-
         while True:  # interrupted with future cancellation
-            # block if there is no retained messages in the storage
-            await session_retained.has_retained_event.wait()
+            session_retained.wakeup_event.clear()
 
-            # wait the specified amount of time between retransmissions
-            await asyncio.sleep(session_retained.delay, loop=self._loop)
-
-            # fetch one message (any) and send it to the list of pending
             async with session_retained.messages_lock:
-                for message in session_retained.messages.values():
-                    await self._add_to_pending(session_id, message)
-                    break  # add only one message to the queue at a time
-
-            # increase the delay between retransmissions (2^n growth)
-            session_retained.delay = min(
-                session_retained.delay * 2,
-                self.MAX_RETRANSMISSION_DELAY
+                timeout = self._retransmit_expired(session_id, session_retained)
+
+            # sleep until the next timer expiration or until an
+            # acknowledgement or a new message arrives
+            try:
+                await asyncio.wait_for(
+                    session_retained.wakeup_event.wait(), timeout,
+                    loop=self._loop
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def _retransmit_expired(
+            self, session_id: TDomainId,
+            session_retained: SessionRetainedStorage
+    ) -> Optional[float]:
+        """
+        Performs a single round of retransmissions: moves messages with
+        expired timers to the list of ready ones and retransmits as many ready
+        messages as the retransmission window allows, starting from the
+        oldest ones
+
+        :param session_id: an identifier of Session this handler is assigned to
+        :param session_retained: information about retained messages
+        :return: a time to wait until the next timer expiration or None if
+                 there is no timers set
+        """
+        now = self._loop.time()
+        timers = session_retained.timers
+        messages = session_retained.messages
+
+        while timers and timers[0][0] <= now:
+            retransmit_at, message_id = heapq.heappop(timers)
+            item = messages.get(message_id)
+
+            if item is None or item.retransmit_at != retransmit_at or \
+                    not item.is_in_flight:
+                continue  # the message was acknowledged or re-scheduled
+
+            item.is_in_flight = False
+            session_retained.in_flight -= 1
+            session_retained.ready[message_id] = None
+
+        retransmitted = 0
+
+        while session_retained.ready and \
+                session_retained.in_flight < self._retransmission_window:
+            message_id, _ = session_retained.ready.popitem(last=False)
+            item = messages[message_id]
+
+            self._add_to_pending(
+                session_id, item.message, is_retransmission=True
+            )
+
+            item.sent_at = now
+            item.retransmit_at = now + self._next_retransmission_delay(
+                item, session_retained
             )
+            item.is_in_flight = True
+            session_retained.in_flight += 1
+            heapq.heappush(timers, (item.retransmit_at, message_id))
+            retransmitted += 1
+
+        if retransmitted:
+            if self._metrics is not None:
+                self._metrics.on_retransmitted(session_id, retransmitted)
+
+            LOGGER.debug(
+                "Retransmitted %d messages for %s, %d are waiting",
+                retransmitted, session_id, len(session_retained.ready)
+            )
+
+        if not timers:
+            return None
+
+        return max(timers[0][0] - now, 0)
+
+    def _next_retransmission_delay(
+            self, item: RescheduledItem,
+            session_retained: SessionRetainedStorage
+    ) -> float:
+        """
+        Calculates a delay before the next retransmission of the message.
+        Delay is doubled on each retransmission (2^n growth) and is reset if
+        there was a progress (acknowledgement) after the last retransmission
+
+        :param item: information about the message to be retransmitted
+        :param session_retained: information about retained messages
+        :return: a delay before the next retransmission
+        """
+        if item.backoff_epoch != session_retained.backoff_epoch:
+            item.backoff_epoch = session_retained.backoff_epoch
+            item.number_of_reschedules = 0
+
+        delay = self._retransmission_timeout * (2 ** item.number_of_reschedules)
+        item.number_of_reschedules += 1
+
+        return min(delay, self.MAX_RETRANSMISSION_DELAY)
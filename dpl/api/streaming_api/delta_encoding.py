@@ -0,0 +1,280 @@
+"""
+This module contains a definition of DeltaEncoder - of a component which
+tracks versions of objects and allows to send only changed fields of
+objects to the Sessions which already know the previous version of them
+"""
+from collections import abc
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from dpl.model.domain_id import TDomainId
+from dpl.events.topic import topic_to_list, iterable_to_topic, topic_matches
+from .message import Message
+from .message_json import SharedFrame
+
+
+# the last level of topics of messages which can be sent as deltas
+DELTA_EVENT_TYPE = 'modified'
+
+# the latest version of an object and its DTO (if known)
+ObjectVersion = Tuple[int, Optional[Mapping[str, Any]]]
+
+
+class VersionedFrame(SharedFrame):
+    """
+    VersionedFrame is a SharedFrame of an update of an object. In addition to
+    the original message, it is able to render the update in the versioned
+    form: with the full DTO of the object or with only the changed fields.
+    Both variants are built lazily and are shared between all recipients
+    """
+    __slots__ = (
+        '_object_topic', '_version', '_previous', '_is_delta_allowed',
+        '_full', '_delta'
+    )
+
+    def __init__(
+            self, message: Message, object_topic: str, version: int,
+            previous: Optional[Mapping[str, Any]] = None,
+            is_delta_allowed: bool = True
+    ):
+        """
+        Constructor
+
+        :param message: the original message with the full DTO in the body
+        :param object_topic: a topic of the object, like 'things/L1'
+        :param version: the version of the object after this update
+        :param previous: the DTO of the previous version of the object or
+               None if the previous version is unknown
+        :param is_delta_allowed: if this update can be sent as a delta
+        """
+        super().__init__(message)
+        self._object_topic = object_topic
+        self._version = version
+        self._previous = previous
+        self._is_delta_allowed = is_delta_allowed
+        self._full = None  # type: Optional[SharedFrame]
+        self._delta = None  # type: Optional[SharedFrame]
+
+    @property
+    def object_topic(self) -> str:
+        return self._object_topic
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def previous(self) -> Optional[Mapping[str, Any]]:
+        """
+        Returns the DTO of the previous version of the object
+
+        :return: the previous DTO or None if it is unknown
+        """
+        return self._previous
+
+    def _build(self, body: Mapping[str, Any]) -> SharedFrame:
+        return SharedFrame(Message(
+            timestamp=self.message.timestamp, type_=self.message.type,
+            topic=self.message.topic, body=body
+        ))
+
+    def as_full(self) -> SharedFrame:
+        """
+        Returns a frame with the version and the full DTO of the object
+
+        :return: a frame to be sent
+        """
+        if self._full is None:
+            self._full = self._build(
+                {'version': self._version, 'object': self.message.body}
+            )
+
+        return self._full
+
+    def as_delta(self) -> Optional[SharedFrame]:
+        """
+        Returns a frame with the version and only the changed fields of the
+        object, or None if the previous version is unknown
+
+        :return: a frame to be sent or None
+        """
+        if self._previous is None or not self._is_delta_allowed:
+            return None
+
+        if self._delta is None:
+            current = self.message.body
+            previous = self._previous
+
+            self._delta = self._build({
+                'version': self._version,
+                'base_version': self._version - 1,
+                'changed': {
+                    key: value for key, value in current.items()
+                    if key not in previous or previous[key] != value
+                },
+                'removed': [key for key in previous if key not in current]
+            })
+
+        return self._delta
+
+
+class DeltaEncoder(object):
+    """
+    DeltaEncoder assigns versions to updates of objects (their topics are of
+    '<root>/<id>/<event_type>' format) and remembers which version of each
+    object was sent to each Session. A Session receives a delta only if it
+    knows the previous version of the object, and the full DTO otherwise.
+    If some of the messages were lost (for example, dropped on overflow),
+    then a client detects the mismatch of base_version and requests a resync
+    """
+    def __init__(self):
+        """
+        Constructor. Initializes internal storage
+        """
+        # the latest version and DTO (if known) of each object
+        self._objects = dict()  # type: Dict[str, ObjectVersion]
+        # versions of objects known by each Session
+        self._known = dict()  # type: Dict[TDomainId, Dict[str, int]]
+
+    @staticmethod
+    def _split_topic(topic: str) -> Optional[Tuple[str, str]]:
+        parts = topic_to_list(topic)
+
+        if len(parts) != 3:
+            return None
+
+        return iterable_to_topic(parts[:2]), parts[2]
+
+    def build_frame(self, message: Message) -> SharedFrame:
+        """
+        Builds a frame for the data message and updates the version of the
+        object if the message is an update of the object. Must to be called
+        for all data messages, even if there are no recipients for them
+
+        :param message: a data message
+        :return: a VersionedFrame for updates of objects, a SharedFrame
+                 otherwise
+        """
+        split = self._split_topic(message.topic)
+
+        if split is None or not isinstance(message.body, abc.Mapping):
+            return SharedFrame(message)
+
+        object_topic, event_type = split
+
+        if event_type == 'deleted':
+            self._objects.pop(object_topic, None)
+
+            for known in self._known.values():
+                known.pop(object_topic, None)
+
+            return SharedFrame(message)
+
+        version, previous = self._objects.get(object_topic, (0, None))
+        version += 1
+        self._objects[object_topic] = version, message.body
+
+        return VersionedFrame(
+            message, object_topic=object_topic, version=version,
+            previous=previous,
+            is_delta_allowed=(event_type == DELTA_EVENT_TYPE)
+        )
+
+    def skip_update(self, topic: str) -> None:
+        """
+        Accounts an update of the object which wasn't sent to anybody and
+        which DTO is not known. The version of the object is increased, but
+        the previous DTO is forgotten, so the next update is sent in full
+
+        :param topic: the topic of the skipped data message
+        :return: None
+        """
+        split = self._split_topic(topic)
+
+        if split is None:
+            return
+
+        object_topic, event_type = split
+
+        if event_type == 'deleted':
+            self._objects.pop(object_topic, None)
+
+            for known in self._known.values():
+                known.pop(object_topic, None)
+
+            return
+
+        version, _ = self._objects.get(object_topic, (0, None))
+        self._objects[object_topic] = version + 1, None
+
+    def get_version(self, object_topic: str) -> int:
+        """
+        Returns the latest version of the object
+
+        :param object_topic: a topic of the object, like 'things/L1'
+        :return: the latest version; zero if the object was never updated
+        """
+        return self._objects.get(object_topic, (0, None))[0]
+
+    def select(self, session_id: TDomainId, frame: SharedFrame) -> SharedFrame:
+        """
+        Selects a variant of the frame to be sent to a Session which
+        requested delta encoding and remembers the version sent
+
+        :param session_id: an identifier of the Session
+        :param frame: a frame returned by build_frame
+        :return: a frame to be sent to the Session
+        """
+        if not isinstance(frame, VersionedFrame):
+            return frame
+
+        known = self._known.setdefault(session_id, {})
+        base_version = known.get(frame.object_topic)
+        known[frame.object_topic] = frame.version
+
+        if base_version == frame.version - 1:
+            delta = frame.as_delta()
+
+            if delta is not None:
+                return delta
+
+        return frame.as_full()
+
+    def set_known(
+            self, session_id: TDomainId, object_topic: str, version: int
+    ) -> None:
+        """
+        Remembers that the specified version of the object was sent to the
+        Session by other means (for example, in a snapshot)
+
+        :param session_id: an identifier of the Session
+        :param object_topic: a topic of the object, like 'things/L1'
+        :param version: the version which was sent
+        :return: None
+        """
+        self._known.setdefault(session_id, {})[object_topic] = version
+
+    def forget(self, session_id: TDomainId, pattern: str = None) -> None:
+        """
+        Forgets versions of objects known by the Session, so the next update
+        of each of them will be sent in full
+
+        :param session_id: an identifier of the Session
+        :param pattern: a topic pattern to select objects by their update
+               topics (like 'things/+/modified'); all objects are selected
+               if not specified
+        :return: None
+        """
+        if pattern is None:
+            self._known.pop(session_id, None)
+            return
+
+        known = self._known.get(session_id, {})
+        to_forget = [
+            object_topic for object_topic in known
+            if topic_matches(
+                pattern, iterable_to_topic((object_topic, DELTA_EVENT_TYPE))
+            )
+        ]  # type: List[str]
+
+        for object_topic in to_forget:
+            del known[object_topic]
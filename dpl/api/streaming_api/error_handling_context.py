@@ -15,7 +15,8 @@ from dpl.auth.exceptions import AuthInvalidTokenError
 from dpl.api.api_errors import ERROR_TEMPLATES
 from .error_message_utlis import send_error_message_by_code, send_error_message
 from .message import MessageFormatViolationError
-from .receive_utils import NotTextFrame
+from .message_codec import FrameDecodeError
+from .receive_utils import UnexpectedFrameType
 from .streaming_flow_error import StreamingFlowError
 
 
@@ -99,15 +100,27 @@ async def _(exc_val, exc_tb, ws_con):
     return True
 
 
-@_handle_exception.register(NotTextFrame)
+@_handle_exception.register(UnexpectedFrameType)
 async def _(exc_val, exc_tb, ws_con):
-    await send_error_message_by_code(ws=ws_con, error_code=5001)
+    await send_error_message_by_code(
+        ws=ws_con, error_code=5001, format_params=(exc_val.expected, )
+    )
     return True
 
 
 @_handle_exception.register(json.JSONDecodeError)
 async def _(exc_val, exc_tb, ws_con):
-    await send_error_message_by_code(ws=ws_con, error_code=5002)
+    await send_error_message_by_code(
+        ws=ws_con, error_code=5002, format_params=('JSON', )
+    )
+    return True
+
+
+@_handle_exception.register(FrameDecodeError)
+async def _(exc_val, exc_tb, ws_con):
+    await send_error_message_by_code(
+        ws=ws_con, error_code=5002, format_params=(exc_val.format_name, )
+    )
     return True
 
 
@@ -8,7 +8,7 @@ from aiohttp.web import WebSocketResponse
 from dpl.api.api_errors import ERROR_TEMPLATES
 from .message import Message
 from .message_utils import build_message
-from .message_json import message_dumps
+from .message_codec import send_message
 
 
 def build_error_message(body: Mapping) -> Message:
@@ -49,7 +49,7 @@ async def send_error_message(
         body=error_info
     )
 
-    ws.send_json(message, dumps=message_dumps)
+    send_message(ws, message)
 
 
 async def send_error_message_by_code(
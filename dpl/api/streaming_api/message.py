@@ -101,9 +101,13 @@ class Message(object):
     Message. Defines the structure of a typical message transreceived via
     Streaming API
     """
+    # a moment (in terms of event loop time) when the message was put to the
+    # queue of pending messages; is set only if delivery metrics are enabled
+    enqueued_at = None  # type: Optional[float]
+
     def __init__(
             self, timestamp: float, type_: str, topic: str, body: Mapping,
-            message_id: int = None
+            message_id: int = None, seq: int = None
     ):
         """
         Constructor. Sets values of the properties to the specified values
@@ -115,6 +119,8 @@ class Message(object):
         :param body: the body, payload of the message
         :param message_id: a lifetime identifier of this message; can't
                be changed once set
+        :param seq: a sequence number of this message in a stream of data
+               messages sent to a Session; can't be changed once set
         :raises: MessageFormatViolationError - if there is an issue with one
                  of the specified parameters
         """
@@ -125,6 +131,7 @@ class Message(object):
         self._topic = topic
         self._body = body
         self._message_id = message_id
+        self._seq = seq
 
     @property
     def timestamp(self) -> float:
@@ -184,3 +191,24 @@ class Message(object):
         :raises ValueError: if an identifier was already set
         """
         self._message_id = new_value
+
+    @property
+    def seq(self) -> Optional[int]:
+        """
+        Returns the sequence number of this Message in a stream of data
+        messages sent to a Session (if it was set). Sequence numbers are
+        growing monotonically for each Session and are never reused
+
+        :return: the sequence number if it was set
+        """
+        return self._seq
+
+    @seq.setter
+    def seq(self, new_value: int):
+        """
+        Sets the sequence number for this Message. Can be set only once
+
+        :param new_value: a new value to be set
+        :return: None
+        """
+        self._seq = new_value
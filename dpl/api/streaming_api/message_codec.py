@@ -0,0 +1,489 @@
+"""
+This module contains definitions of MessageCodecs - of classes which encode
+Messages to WebSocket frames and decode frames received from clients. A codec
+is negotiated by a client on authentication; JSON is used by default.
+
+MessagePack and CBOR codecs depend on optional third-party packages (msgpack
+and cbor2 correspondingly) and are available only if such packages are
+installed.
+"""
+import json
+import struct
+import time
+import weakref
+import zlib
+from typing import Callable, Dict, Mapping, Optional, Sequence, Union
+
+from .message import Message
+from .message_json import message_dumps, FramedMessage
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+# the content of a WebSocket frame: str for TEXT frames and bytes for
+# BINARY frames
+FrameData = Union[str, bytes]
+
+# a topic of control messages which contain a batch of other messages
+BATCH_TOPIC = 'batch'
+
+
+class UnsupportedCodecError(Exception):
+    """
+    An exception to be raised if the requested codec or compression method
+    is unknown or is not available in this installation
+    """
+    pass
+
+
+class FrameDecodeError(Exception):
+    """
+    An exception to be raised if the content of a frame can't be decoded by
+    a negotiated codec
+    """
+    def __init__(self, format_name: str):
+        """
+        Constructor
+
+        :param format_name: a human-readable name of the expected format
+        """
+        super().__init__(format_name)
+        self.format_name = format_name
+
+
+class MessageCodec(object):
+    """
+    MessageCodec is a base class for all codecs. Codecs are stateless, so
+    a single instance of each codec is shared between all connections
+    """
+    # a name of the codec used in negotiation
+    name = None  # type: str
+
+    # a human-readable name of the format
+    format_name = None  # type: str
+
+    # if encoded messages must to be sent in BINARY frames
+    is_binary = False
+
+    # a name of the compression method or None if messages are not
+    # compressed
+    compression = None  # type: Optional[str]
+
+    def encode(self, message: Message) -> FrameData:
+        """
+        Encodes the specified Message
+
+        :param message: a Message to be encoded
+        :return: the content of a frame to be sent
+        """
+        raise NotImplementedError()
+
+    def encode_batch(
+            self, timestamp: float, messages: Sequence[Message]
+    ) -> FrameData:
+        """
+        Encodes the specified Messages into a single envelope: a control
+        message with a "batch" topic, which body contains a "messages"
+        field with an array of Messages in the specified order
+
+        :param timestamp: a timestamp of the envelope
+        :param messages: Messages to be encoded
+        :return: the content of a frame to be sent
+        """
+        raise NotImplementedError()
+
+    def decode(self, data: FrameData) -> Mapping:
+        """
+        Decodes the content of a received frame
+
+        :param data: the content of a frame
+        :return: a mapping which represents the received Message
+        :raises FrameDecodeError: if the content can't be decoded
+        """
+        raise NotImplementedError()
+
+
+class JsonCodec(MessageCodec):
+    """
+    Encodes Messages as JSON objects sent in TEXT frames. Is used by default
+    """
+    name = 'json'
+    format_name = 'JSON'
+
+    def encode(self, message: Message) -> FrameData:
+        return message_dumps(message)
+
+    def encode_batch(
+            self, timestamp: float, messages: Sequence[Message]
+    ) -> FrameData:
+        return (
+            '{"timestamp": %s, "type": "control", "topic": "%s", '
+            '"body": {"messages": [%s]}}' % (
+                json.dumps(timestamp), BATCH_TOPIC,
+                ', '.join(message_dumps(message) for message in messages)
+            )
+        )
+
+    def decode(self, data: FrameData) -> Mapping:
+        # json.JSONDecodeError is passed as is to keep error reporting
+        # compatible with older clients
+        return json.loads(data)
+
+
+class _BinaryMapCodec(MessageCodec):
+    """
+    A base class for codecs of binary formats which encode Messages as maps.
+    The content of a FramedMessage is encoded only once and is shared between
+    all recipients: only the header of a map and per-recipient fields (like
+    message_id and seq) are encoded for each of them.
+    """
+    is_binary = True
+
+    def _pack(self, value) -> bytes:
+        """
+        Encodes a single value
+
+        :param value: a value to be encoded
+        :return: encoded value
+        """
+        raise NotImplementedError()
+
+    def _unpack(self, data: bytes):
+        """
+        Decodes a single value
+
+        :param data: encoded value
+        :return: decoded value
+        """
+        raise NotImplementedError()
+
+    def _map_header(self, size: int) -> bytes:
+        """
+        Encodes a header of a map with the specified number of items
+
+        :param size: the number of key-value pairs in the map
+        :return: encoded header
+        """
+        raise NotImplementedError()
+
+    def _array_header(self, size: int) -> bytes:
+        """
+        Encodes a header of an array with the specified number of items
+
+        :param size: the number of items in the array
+        :return: encoded header
+        """
+        raise NotImplementedError()
+
+    def _pack_items(self, items) -> bytes:
+        """
+        Encodes a sequence of key-value pairs of a map
+
+        :param items: key-value pairs to be encoded
+        :return: encoded pairs without a map header
+        """
+        pack = self._pack
+        return b''.join(pack(key) + pack(value) for key, value in items)
+
+    def _pack_content(self, message: Message) -> bytes:
+        return self._pack_items((
+            ('timestamp', message.timestamp),
+            ('type', message.type),
+            ('topic', message.topic),
+            ('body', message.body)
+        ))
+
+    def encode(self, message: Message) -> FrameData:
+        extra = list()
+
+        if message.message_id is not None:
+            extra.append(('message_id', message.message_id))
+
+        if message.seq is not None:
+            extra.append(('seq', message.seq))
+
+        if isinstance(message, FramedMessage):
+            content = message.frame.get_encoded(self.name, self._pack_content)
+        else:
+            content = self._pack_content(message)
+
+        return self._map_header(4 + len(extra)) + content + \
+            self._pack_items(extra)
+
+    def encode_batch(
+            self, timestamp: float, messages: Sequence[Message]
+    ) -> FrameData:
+        # each of the encoded Messages is a complete map, so they are just
+        # concatenated after the header of an array
+        return b''.join((
+            self._map_header(4),
+            self._pack_items((
+                ('timestamp', timestamp),
+                ('type', 'control'),
+                ('topic', BATCH_TOPIC)
+            )),
+            self._pack('body'),
+            self._map_header(1),
+            self._pack('messages'),
+            self._array_header(len(messages)),
+            b''.join(self.encode(message) for message in messages)
+        ))
+
+    def decode(self, data: FrameData) -> Mapping:
+        try:
+            result = self._unpack(data)
+        except Exception:
+            raise FrameDecodeError(self.format_name)
+
+        if not isinstance(result, Mapping):
+            raise FrameDecodeError(self.format_name)
+
+        return result
+
+
+class MsgPackCodec(_BinaryMapCodec):
+    """
+    Encodes Messages as MessagePack maps sent in BINARY frames
+    """
+    name = 'msgpack'
+    format_name = 'MessagePack'
+
+    def _pack(self, value) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def _unpack(self, data: bytes):
+        return msgpack.unpackb(data, raw=False)
+
+    def _map_header(self, size: int) -> bytes:
+        if size < 16:
+            return bytes((0x80 | size, ))
+
+        if size < 0x10000:
+            return struct.pack('!BH', 0xde, size)
+
+        return struct.pack('!BI', 0xdf, size)
+
+    def _array_header(self, size: int) -> bytes:
+        if size < 16:
+            return bytes((0x90 | size, ))
+
+        if size < 0x10000:
+            return struct.pack('!BH', 0xdc, size)
+
+        return struct.pack('!BI', 0xdd, size)
+
+
+class CborCodec(_BinaryMapCodec):
+    """
+    Encodes Messages as CBOR maps sent in BINARY frames
+    """
+    name = 'cbor'
+    format_name = 'CBOR'
+
+    def _pack(self, value) -> bytes:
+        return cbor2.dumps(value)
+
+    def _unpack(self, data: bytes):
+        return cbor2.loads(data)
+
+    def _map_header(self, size: int) -> bytes:
+        if size < 24:
+            return bytes((0xa0 | size, ))
+
+        if size < 0x100:
+            return struct.pack('!BB', 0xb8, size)
+
+        if size < 0x10000:
+            return struct.pack('!BH', 0xb9, size)
+
+        return struct.pack('!BI', 0xba, size)
+
+    def _array_header(self, size: int) -> bytes:
+        if size < 24:
+            return bytes((0x80 | size, ))
+
+        if size < 0x100:
+            return struct.pack('!BB', 0x98, size)
+
+        if size < 0x10000:
+            return struct.pack('!BH', 0x99, size)
+
+        return struct.pack('!BI', 0x9a, size)
+
+
+class ZlibCompressedCodec(MessageCodec):
+    """
+    Compresses the output of another codec with zlib. Compressed Messages are
+    always sent in BINARY frames; frames received from clients must to be
+    compressed too
+    """
+    is_binary = True
+    compression = 'zlib'
+
+    def __init__(self, inner: MessageCodec, level: int = 6):
+        """
+        Constructor
+
+        :param inner: a codec to be used for encoding of Messages
+        :param level: a level of compression, from 1 to 9
+        """
+        self._inner = inner
+        self._level = level
+        self.name = inner.name
+        self.format_name = 'zlib-compressed %s' % inner.format_name
+
+    def encode(self, message: Message) -> FrameData:
+        data = self._inner.encode(message)
+
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        return zlib.compress(data, self._level)
+
+    def encode_batch(
+            self, timestamp: float, messages: Sequence[Message]
+    ) -> FrameData:
+        data = self._inner.encode_batch(timestamp, messages)
+
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        return zlib.compress(data, self._level)
+
+    def decode(self, data: FrameData) -> Mapping:
+        try:
+            data = zlib.decompress(data)
+        except zlib.error:
+            raise FrameDecodeError(self.format_name)
+
+        if not self._inner.is_binary:
+            try:
+                data = data.decode('utf-8')
+            except UnicodeDecodeError:
+                raise FrameDecodeError(self.format_name)
+
+        try:
+            return self._inner.decode(data)
+        except ValueError:  # including json.JSONDecodeError
+            raise FrameDecodeError(self.format_name)
+
+
+JSON_CODEC = JsonCodec()
+
+# codec names mapped to instances of codecs; codecs which dependencies are
+# not installed are not present here
+CODECS = {JSON_CODEC.name: JSON_CODEC}  # type: Dict[str, MessageCodec]
+
+if msgpack is not None:
+    CODECS[MsgPackCodec.name] = MsgPackCodec()
+
+if cbor2 is not None:
+    CODECS[CborCodec.name] = CborCodec()
+
+# compression method names mapped to wrappers of codecs
+COMPRESSIONS = {
+    'zlib': ZlibCompressedCodec
+}  # type: Dict[str, Callable[[MessageCodec], MessageCodec]]
+
+
+def get_codec(
+        name: Optional[str] = None, compression: Optional[str] = None
+) -> MessageCodec:
+    """
+    Returns a codec with the specified name and compression method
+
+    :param name: a name of the codec; JSON is used if not specified
+    :param compression: a name of the compression method or None if
+           the compression is not needed
+    :return: an instance of MessageCodec
+    :raises UnsupportedCodecError: if the codec or the compression method
+            is unknown or is not available
+    """
+    codec = CODECS.get(JSON_CODEC.name if name is None else name)
+
+    if codec is None:
+        raise UnsupportedCodecError(name)
+
+    if compression is None:
+        return codec
+
+    wrapper = COMPRESSIONS.get(compression)
+
+    if wrapper is None:
+        raise UnsupportedCodecError(compression)
+
+    return wrapper(codec)
+
+
+# codecs negotiated for opened WebSocket connections
+_BOUND_CODECS = weakref.WeakKeyDictionary()
+
+
+def bind_codec(ws, codec: MessageCodec) -> None:
+    """
+    Sets the codec to be used for all the following messages sent and
+    received via the specified connection
+
+    :param ws: an instance of WebSocketResponse
+    :param codec: a negotiated codec
+    :return: None
+    """
+    _BOUND_CODECS[ws] = codec
+
+
+def get_bound_codec(ws) -> MessageCodec:
+    """
+    Returns the codec negotiated for the specified connection
+
+    :param ws: an instance of WebSocketResponse
+    :return: the negotiated codec or the JSON codec if nothing was negotiated
+    """
+    return _BOUND_CODECS.get(ws, JSON_CODEC)
+
+
+def send_message(ws, message: Message) -> int:
+    """
+    Encodes the Message with the codec negotiated for the specified connection
+    and sends it in a frame of the corresponding type
+
+    :param ws: an instance of WebSocketResponse
+    :param message: a Message to be sent
+    :return: the size of the sent frame
+    """
+    codec = get_bound_codec(ws)
+    data = codec.encode(message)
+
+    if codec.is_binary:
+        ws.send_bytes(data)
+    else:
+        ws.send_str(data)
+
+    return len(data)
+
+
+def send_batch(ws, messages: Sequence[Message]) -> int:
+    """
+    Sends the specified Messages in a single frame: in an envelope encoded
+    with the codec negotiated for the specified connection
+
+    :param ws: an instance of WebSocketResponse
+    :param messages: Messages to be sent, in order
+    :return: the size of the sent frame
+    """
+    codec = get_bound_codec(ws)
+    data = codec.encode_batch(time.time(), messages)
+
+    if codec.is_binary:
+        ws.send_bytes(data)
+    else:
+        ws.send_str(data)
+
+    return len(data)
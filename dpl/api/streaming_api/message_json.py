@@ -4,7 +4,7 @@ to JSON-serializable objects
 """
 import functools
 from json import JSONEncoder, dumps
-from typing import Mapping
+from typing import Any, Callable, Dict, Mapping, Optional
 
 from .message import Message
 
@@ -30,7 +30,158 @@ class MessageJSONEncoder(JSONEncoder):
         if o.message_id is not None:
             result["message_id"] = o.message_id
 
+        if o.seq is not None:
+            result["seq"] = o.seq
+
+        return result
+
+
+_plain_message_dumps = functools.partial(dumps, cls=MessageJSONEncoder)
+
+
+class SharedFrame(object):
+    """
+    SharedFrame is an immutable pre-encoded representation of a Message which
+    is sent to a lot of recipients at once. The content of the Message is
+    encoded only once, on the first rendering; per-recipient fields (like a
+    message_id of Tracked Messages) are appended to the already encoded
+    content.
+    """
+    __slots__ = ('_message', '_head', '_encoded')
+
+    def __init__(self, message: Message):
+        """
+        Constructor. Saves a template Message to be encoded
+
+        :param message: a Message to be shared between all recipients; must
+               not have a message_id set
+        """
+        assert message.message_id is None
+        self._message = message
+        self._head = None  # type: Optional[str]
+        self._encoded = None  # type: Optional[Dict[str, Any]]
+
+    @property
+    def message(self) -> Message:
+        """
+        Returns a template Message this frame was built for
+
+        :return: a template Message
+        """
+        return self._message
+
+    def render(
+            self, message_id: Optional[int] = None, seq: Optional[int] = None
+    ) -> str:
+        """
+        Returns a JSON-encoded representation of the Message with an optional
+        message identifier and sequence number added
+
+        :param message_id: an identifier of the Tracked Message or None
+        :param seq: a sequence number of the Message or None
+        :return: encoded Message
+        """
+        if self._head is None:
+            # cut off the closing brace of a JSON object to allow additional
+            # fields to be appended
+            self._head = _plain_message_dumps(self._message)[:-1]
+
+        if seq is None:
+            if message_id is None:
+                return self._head + '}'
+
+            return '%s, "message_id": %d}' % (self._head, message_id)
+
+        if message_id is None:
+            return '%s, "seq": %d}' % (self._head, seq)
+
+        return '%s, "message_id": %d, "seq": %d}' % (
+            self._head, message_id, seq
+        )
+
+    def get_encoded(
+            self, key: str, encode: Callable[[Message], Any]
+    ) -> Any:
+        """
+        Returns the content of the Message encoded with the specified
+        function. Encodes the content only on the first call for each key;
+        is used to share the content encoded in formats other than JSON
+
+        :param key: a name of the format
+        :param encode: a function which encodes the Message
+        :return: the encoded content
+        """
+        if self._encoded is None:
+            self._encoded = dict()
+
+        result = self._encoded.get(key)
+
+        if result is None:
+            result = encode(self._message)
+            self._encoded[key] = result
+
         return result
 
 
-message_dumps = functools.partial(dumps, cls=MessageJSONEncoder)
+class FramedMessage(Message):
+    """
+    FramedMessage is a Message which content is stored in a SharedFrame. Only
+    the message_id and seq are stored individually for each instance. Thus
+    such Messages are cheap to be created and don't need to be encoded again
+    for each of recipients.
+    """
+    def __init__(
+            self, frame: SharedFrame, message_id: int = None, seq: int = None
+    ):
+        """
+        Constructor. Saves a reference to the SharedFrame with the content of
+        this Message. The content is not validated again, it was already
+        validated on construction of a template Message for this frame.
+
+        :param frame: a SharedFrame with the content of this Message
+        :param message_id: a lifetime identifier of this message
+        :param seq: a sequence number of this message
+        """
+        # pylint: disable=super-init-not-called
+        self._frame = frame
+        self._message_id = message_id
+        self._seq = seq
+
+    @property
+    def frame(self) -> SharedFrame:
+        """
+        Returns the SharedFrame with the content of this Message
+
+        :return: the SharedFrame with the content of this Message
+        """
+        return self._frame
+
+    @property
+    def timestamp(self) -> float:
+        return self._frame.message.timestamp
+
+    @property
+    def type(self) -> str:
+        return self._frame.message.type
+
+    @property
+    def topic(self) -> str:
+        return self._frame.message.topic
+
+    @property
+    def body(self) -> Mapping:
+        return self._frame.message.body
+
+
+def message_dumps(message: Message) -> str:
+    """
+    Encodes the specified Message to JSON. Reuses already encoded content for
+    instances of FramedMessage
+
+    :param message: a Message to be encoded
+    :return: the JSON-encoded Message
+    """
+    if isinstance(message, FramedMessage):
+        return message.frame.render(message.message_id, message.seq)
+
+    return _plain_message_dumps(message)
@@ -0,0 +1,474 @@
+"""
+This module contains a definition of StreamingMetrics - of a collector of
+counters and histograms of message delivery for each Session and for all of
+them - and functions which render collected metrics for diagnostics
+"""
+import bisect
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Tuple
+
+from dpl.model.domain_id import TDomainId
+
+
+# upper bounds of histogram buckets for latencies, in seconds
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+# a prefix of names of all metrics in the text format
+METRIC_PREFIX = 'everpl_streaming_'
+
+# current values of gauges (like the depth of the pending queue) for each
+# Session; are collected only on request, so they cost nothing in between
+SessionGauges = Mapping[TDomainId, Mapping[str, int]]
+
+
+class Histogram(object):
+    """
+    Histogram counts observed values in buckets with fixed upper bounds, so
+    the observation costs a binary search and quantiles are estimated
+    without storage of the values themselves
+    """
+    __slots__ = ('_bounds', '_counts', '_count', '_sum')
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Constructor
+
+        :param bounds: sorted upper bounds of buckets; values greater than
+               the last of them are counted in an additional bucket
+        """
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def observe(self, value: float) -> None:
+        """
+        Counts the specified value
+
+        :param value: a value to be counted
+        :return: None
+        """
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._count += 1
+        self._sum += value
+
+    def merge(self, other: 'Histogram') -> None:
+        """
+        Adds all values counted by other histogram with the same bounds to
+        this one
+
+        :param other: a histogram to be merged
+        :return: None
+        """
+        assert self._bounds == other._bounds
+
+        for index, count in enumerate(other._counts):
+            self._counts[index] += count
+
+        self._count += other._count
+        self._sum += other._sum
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """
+        Returns upper bounds of buckets with cumulative counts of values,
+        including the last unbounded (infinite) bucket
+
+        :return: a list of pairs of an upper bound and of a number of values
+                 which are less or equal to it
+        """
+        result = list()
+        total = 0
+
+        for bound, count in zip(self._bounds + (float('inf'), ), self._counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the specified quantile with a linear interpolation inside
+        of the bucket which contains it
+
+        :param q: a quantile to be estimated, from 0 to 1
+        :return: an estimated value; zero if nothing was counted
+        """
+        if self._count == 0:
+            return 0.0
+
+        rank = q * self._count
+        lower_bound = 0.0
+        total = 0
+
+        for bound, count in zip(self._bounds, self._counts):
+            if count and total + count >= rank:
+                return lower_bound + (bound - lower_bound) * (
+                    (rank - total) / count
+                )
+
+            total += count
+            lower_bound = bound
+
+        # the value is greater than the last bound; it can't be estimated
+        return self._bounds[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self._count,
+            'sum': self._sum,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99)
+        }
+
+
+class SessionMetrics(object):
+    """
+    Counters and histograms of delivery of messages to a single Session (or
+    to all of them)
+    """
+    __slots__ = (
+        'frames_sent', 'messages_sent', 'bytes_sent', 'retransmissions',
+        'dropped', 'acknowledged', 'evicted', 'ack_latency', 'send_latency'
+    )
+
+    # names of counters in order of their reporting
+    COUNTERS = (
+        'frames_sent', 'messages_sent', 'bytes_sent', 'retransmissions',
+        'dropped', 'acknowledged', 'evicted'
+    )
+
+    def __init__(self):
+        """
+        Constructor. Initializes all counters with zeros
+        """
+        self.frames_sent = 0
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.retransmissions = 0
+        self.dropped = 0
+        self.acknowledged = 0
+        # retained messages dropped because of the global limit
+        self.evicted = 0
+        # the time between sending of a retained message and its
+        # acknowledgement
+        self.ack_latency = Histogram()
+        # the time a message spent in the queue of pending messages
+        self.send_latency = Histogram()
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            name: getattr(self, name) for name in self.COUNTERS
+        }  # type: Dict[str, Any]
+        result['ack_latency'] = self.ack_latency.to_dict()
+        result['send_latency'] = self.send_latency.to_dict()
+
+        return result
+
+
+class StreamingMetrics(object):
+    """
+    StreamingMetrics collects counters and histograms of delivery of
+    messages for each Session. Aggregated values for all Sessions are
+    computed only on request, so each event costs a single update.
+
+    Metrics are collected only if an instance of this class was passed to
+    the components of Streaming API; otherwise instrumented code paths are
+    reduced to a check for None
+    """
+    def __init__(self):
+        """
+        Constructor. Initializes internal storage
+        """
+        self._sessions = dict()  # type: Dict[TDomainId, SessionMetrics]
+
+        # counters of Sessions which were already discarded
+        self._discarded = SessionMetrics()
+
+        # the number of Sessions discarded because of inactivity
+        self.evicted_sessions = 0
+
+    def _get(self, session_id: TDomainId) -> SessionMetrics:
+        session_metrics = self._sessions.get(session_id)
+
+        if session_metrics is None:
+            session_metrics = SessionMetrics()
+            self._sessions[session_id] = session_metrics
+
+        return session_metrics
+
+    def on_sent(
+            self, session_id: TDomainId, messages: int, size: int
+    ) -> None:
+        """
+        Counts a frame sent to the Session
+
+        :param session_id: an identifier of the Session
+        :param messages: the number of messages in the frame
+        :param size: the size of the frame in bytes
+        :return: None
+        """
+        session_metrics = self._get(session_id)
+        session_metrics.frames_sent += 1
+        session_metrics.messages_sent += messages
+        session_metrics.bytes_sent += size
+
+    def on_retransmitted(self, session_id: TDomainId, count: int) -> None:
+        """
+        Counts messages which were queued to be sent again because their
+        delivery was not acknowledged in time
+
+        :param session_id: an identifier of the Session
+        :param count: the number of retransmitted messages
+        :return: None
+        """
+        self._get(session_id).retransmissions += count
+
+    def on_dropped(self, session_id: TDomainId) -> None:
+        """
+        Counts a message which was dropped on overflow of the queue of
+        pending messages
+
+        :param session_id: an identifier of the Session
+        :return: None
+        """
+        self._get(session_id).dropped += 1
+
+    def on_acknowledged(
+            self, session_id: TDomainId, latencies: Iterable[float]
+    ) -> None:
+        """
+        Counts acknowledged messages
+
+        :param session_id: an identifier of the Session
+        :param latencies: the time between the last sending and the
+               acknowledgement of each message, in seconds
+        :return: None
+        """
+        session_metrics = self._get(session_id)
+        observe = session_metrics.ack_latency.observe
+
+        for latency in latencies:
+            observe(latency)
+            session_metrics.acknowledged += 1
+
+    def on_evicted(self, session_id: TDomainId, count: int) -> None:
+        """
+        Counts retained messages which were dropped because the limit of
+        retained messages of all Sessions was reached
+
+        :param session_id: an identifier of the Session
+        :param count: the number of dropped messages
+        :return: None
+        """
+        self._get(session_id).evicted += count
+
+    def on_session_evicted(self) -> None:
+        """
+        Counts a Session which data was discarded because of inactivity
+
+        :return: None
+        """
+        self.evicted_sessions += 1
+
+    def observe_send_latency(
+            self, session_id: TDomainId, latency: float
+    ) -> None:
+        """
+        Counts the time a message spent in the queue of pending messages
+
+        :param session_id: an identifier of the Session
+        :param latency: the time between queueing and sending, in seconds
+        :return: None
+        """
+        self._get(session_id).send_latency.observe(latency)
+
+    def forget(self, session_id: TDomainId) -> None:
+        """
+        Removes metrics of the discarded Session. Its counters are still
+        included in the aggregated values
+
+        :param session_id: an identifier of the Session
+        :return: None
+        """
+        session_metrics = self._sessions.pop(session_id, None)
+
+        if session_metrics is not None:
+            _add_to(self._discarded, session_metrics)
+
+    def sessions(self) -> Iterator[Tuple[TDomainId, SessionMetrics]]:
+        """
+        Returns metrics of all known Sessions
+
+        :return: an iterator over pairs of a Session identifier and of
+                 its metrics
+        """
+        return iter(self._sessions.items())
+
+    def total(self) -> SessionMetrics:
+        """
+        Returns counters and histograms aggregated for all Sessions,
+        including the discarded ones
+
+        :return: aggregated metrics
+        """
+        result = SessionMetrics()
+        _add_to(result, self._discarded)
+
+        for session_metrics in self._sessions.values():
+            _add_to(result, session_metrics)
+
+        return result
+
+
+def _add_to(target: SessionMetrics, source: SessionMetrics) -> None:
+    for name in SessionMetrics.COUNTERS:
+        setattr(target, name, getattr(target, name) + getattr(source, name))
+
+    target.ack_latency.merge(source.ack_latency)
+    target.send_latency.merge(source.send_latency)
+
+
+def _sum_gauges(gauges: SessionGauges) -> Dict[str, int]:
+    result = dict()  # type: Dict[str, int]
+
+    for session_gauges in gauges.values():
+        for name, value in session_gauges.items():
+            result[name] = result.get(name, 0) + value
+
+    return result
+
+
+def build_diagnostics(
+        metrics: StreamingMetrics, gauges: SessionGauges
+) -> Dict[str, Any]:
+    """
+    Builds a JSON-serializable report with metrics of each Session and with
+    aggregated metrics of all of them
+
+    :param metrics: collected counters and histograms
+    :param gauges: current values of gauges of each Session
+    :return: a report
+    """
+    sessions = dict()  # type: Dict[str, Dict[str, Any]]
+
+    for session_id, session_metrics in metrics.sessions():
+        sessions[str(session_id)] = session_metrics.to_dict()
+
+    for session_id, session_gauges in gauges.items():
+        sessions.setdefault(
+            str(session_id), SessionMetrics().to_dict()
+        ).update(session_gauges)
+
+    total = metrics.total().to_dict()
+    total.update(_sum_gauges(gauges))
+    total['sessions'] = len(sessions)
+    total['evicted_sessions'] = metrics.evicted_sessions
+
+    return {'total': total, 'sessions': sessions}
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _render_histogram(
+        lines: List[str], name: str, histogram: Histogram, labels: str
+) -> None:
+    separator = ',' if labels else ''
+
+    for bound, count in histogram.buckets():
+        lines.append('%s_bucket{%s%sle="%s"} %d' % (
+            name, labels, separator, _format_value(bound), count
+        ))
+
+    suffix = '{%s}' % labels if labels else ''
+    lines.append('%s_sum%s %s' % (name, suffix, repr(histogram.sum)))
+    lines.append('%s_count%s %d' % (name, suffix, histogram.count))
+
+
+def render_text(metrics: StreamingMetrics, gauges: SessionGauges) -> str:
+    """
+    Renders metrics in the text exposition format of Prometheus. Aggregated
+    metrics have no labels; metrics of each Session are named with the
+    'session_' infix and are labeled with the Session identifier
+
+    :param metrics: collected counters and histograms
+    :param gauges: current values of gauges of each Session
+    :return: a text to be returned to a scraper
+    """
+    lines = list()  # type: List[str]
+
+    per_session = [
+        ('session="%s"' % _escape_label(str(session_id)), session_metrics)
+        for session_id, session_metrics in metrics.sessions()
+    ]  # type: List[Tuple[str, SessionMetrics]]
+
+    for scope, entries in (
+            ('', [('', metrics.total())]), ('session_', per_session)
+    ):
+        for counter in SessionMetrics.COUNTERS:
+            name = '%s%s%s_total' % (METRIC_PREFIX, scope, counter)
+            lines.append('# TYPE %s counter' % name)
+
+            for labels, session_metrics in entries:
+                suffix = '{%s}' % labels if labels else ''
+                lines.append('%s%s %d' % (
+                    name, suffix, getattr(session_metrics, counter)
+                ))
+
+        for histogram_name in ('ack_latency', 'send_latency'):
+            name = '%s%s%s_seconds' % (METRIC_PREFIX, scope, histogram_name)
+            lines.append('# TYPE %s histogram' % name)
+
+            for labels, session_metrics in entries:
+                _render_histogram(
+                    lines, name, getattr(session_metrics, histogram_name),
+                    labels
+                )
+
+    name = '%sevicted_sessions_total' % METRIC_PREFIX
+    lines.append('# TYPE %s counter' % name)
+    lines.append('%s %d' % (name, metrics.evicted_sessions))
+
+    total_gauges = _sum_gauges(gauges)
+    total_gauges['sessions'] = len(gauges)
+
+    for gauge, value in sorted(total_gauges.items()):
+        name = '%s%s' % (METRIC_PREFIX, gauge)
+        lines.append('# TYPE %s gauge' % name)
+        lines.append('%s %d' % (name, value))
+
+    gauge_names = sorted(
+        {name for session_gauges in gauges.values() for name in session_gauges}
+    )
+
+    for gauge in gauge_names:
+        name = '%ssession_%s' % (METRIC_PREFIX, gauge)
+        lines.append('# TYPE %s gauge' % name)
+
+        for session_id, session_gauges in gauges.items():
+            lines.append('%s{session="%s"} %d' % (
+                name, _escape_label(str(session_id)),
+                session_gauges.get(gauge, 0)
+            ))
+
+    lines.append('')
+
+    return '\n'.join(lines)
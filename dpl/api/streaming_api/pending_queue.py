@@ -0,0 +1,305 @@
+"""
+This module contains a definition of PendingQueue - of a bounded queue of
+messages pending on delivery to a single Session, with priority lanes for
+control messages - and of policies to be applied if a client is too slow to
+consume all of them
+"""
+import asyncio
+from collections import deque
+from enum import Enum
+from typing import Deque, Iterable, List, Optional
+
+from .message import Message
+
+
+# topics of control messages which carry the state of objects and thus must
+# to be delivered in order with data messages
+ORDERED_CONTROL_TOPICS = frozenset(('snapshot',))
+
+
+class OverflowPolicy(Enum):
+    """
+    An enumeration of policies to be applied if the queue of pending messages
+    is full and a new message arrives
+    """
+    # drop the oldest pending data message
+    drop_oldest = 'drop_oldest'
+    # replace the pending data message with the same topic (if any), drop
+    # the oldest pending data message otherwise
+    conflate = 'conflate'
+    # drop all pending messages and disconnect the slow consumer
+    disconnect = 'disconnect'
+
+
+class PendingQueueOverflowError(Exception):
+    """
+    An exception to be raised if the queue of pending messages is full and
+    the slow consumer must to be disconnected
+    """
+    pass
+
+
+class PendingQueue(object):
+    """
+    PendingQueue is a bounded queue of messages pending on delivery. Putting
+    of messages never blocks: if the queue is full, then the configured
+    OverflowPolicy is applied.
+
+    Messages are stored in three FIFO lanes. Control messages (like
+    acknowledgements of subscriptions and errors) are always returned first,
+    so they never wait behind a backlog of data messages. Retransmitted and
+    fresh data messages are returned in a weighted round-robin order while
+    both lanes are not empty: retransmission_weight retransmitted messages
+    for each data_weight fresh ones.
+
+    Control messages with the state of objects (like snapshots) are kept in
+    the lane of fresh data messages instead, so they are never delivered
+    before updates that were queued earlier. Such messages are never dropped
+    while there are data messages to be dropped instead
+    """
+    DEFAULT_RETRANSMISSION_WEIGHT = 1
+    DEFAULT_DATA_WEIGHT = 3
+
+    def __init__(
+            self, max_size: int,
+            policy: OverflowPolicy = OverflowPolicy.drop_oldest,
+            *, loop: asyncio.AbstractEventLoop = None,
+            retransmission_weight: int = DEFAULT_RETRANSMISSION_WEIGHT,
+            data_weight: int = DEFAULT_DATA_WEIGHT
+    ):
+        """
+        Constructor. Initializes an empty queue
+
+        :param max_size: the maximum number of pending messages
+        :param policy: a policy to be applied on queue overflow
+        :param loop: an instance of EventLoop this queue is bound to
+        :param retransmission_weight: the share of retransmitted messages
+               in the output if there are fresh data messages pending too
+        :param data_weight: the share of fresh data messages in the output
+               if there are retransmitted messages pending too
+        """
+        assert max_size > 0
+        assert retransmission_weight > 0 and data_weight > 0
+        self._max_size = max_size
+        self._policy = policy
+        self._control = deque()  # type: Deque[Message]
+        self._retransmissions = deque()  # type: Deque[Message]
+        self._data = deque()  # type: Deque[Message]
+        self._size = 0
+        self._not_empty = asyncio.Event(loop=loop)
+        self._high_water_mark = 0
+
+        # a position in the round-robin cycle of retransmitted and fresh
+        # data messages; the first retransmission_weight positions are
+        # taken by retransmissions
+        self._retransmission_weight = retransmission_weight
+        self._cycle_length = retransmission_weight + data_weight
+        self._turn = 0
+
+    @property
+    def max_size(self) -> int:
+        """
+        Returns the maximum number of pending messages
+
+        :return: the maximum number of pending messages
+        """
+        return self._max_size
+
+    @property
+    def high_water_mark(self) -> int:
+        """
+        Returns the maximum number of messages that were simultaneously
+        pending in this queue
+
+        :return: the maximum observed depth of this queue
+        """
+        return self._high_water_mark
+
+    def qsize(self) -> int:
+        """
+        Returns the number of pending messages
+
+        :return: the number of pending messages
+        """
+        return self._size
+
+    def empty(self) -> bool:
+        """
+        Checks if there is no pending messages
+
+        :return: True if the queue is empty, False otherwise
+        """
+        return self._size == 0
+
+    def put_nowait(
+            self, message: Message, is_retransmission: bool = False
+    ) -> Optional[Message]:
+        """
+        Adds the message to the end of the corresponding lane. Applies the
+        overflow policy if the queue is full
+
+        :param message: a message to be added
+        :param is_retransmission: if the message is a retransmission of an
+               unacknowledged data message
+        :return: a message that was dropped from the queue to free space for
+                 the new one or None if nothing was dropped
+        :raises PendingQueueOverflowError: if the queue is full and the
+                policy requires the consumer to be disconnected
+        """
+        dropped = None
+
+        if self._size >= self._max_size:
+            dropped = self._free_space_for(message)
+
+        if message.type != 'data' and \
+                message.topic not in ORDERED_CONTROL_TOPICS:
+            self._control.append(message)
+        elif is_retransmission:
+            self._retransmissions.append(message)
+        else:
+            self._data.append(message)
+
+        self._size += 1
+        self._not_empty.set()
+
+        if self._size > self._high_water_mark:
+            self._high_water_mark = self._size
+
+        return dropped
+
+    def _free_space_for(self, message: Message) -> Message:
+        """
+        Removes one message from the queue according to the overflow policy.
+        Control messages are dropped only if there is nothing else to drop.
+        Retransmitted messages are dropped before fresh ones because they
+        will be retransmitted again if their delivery is not acknowledged
+
+        :param message: a new message to be added to the queue
+        :return: the removed message
+        :raises PendingQueueOverflowError: if the queue is full and the
+                policy requires the consumer to be disconnected
+        """
+        if self._policy is OverflowPolicy.disconnect:
+            raise PendingQueueOverflowError()
+
+        victim = None
+
+        if self._policy is OverflowPolicy.conflate:
+            for lane in (self._retransmissions, self._data):
+                victim = self._remove_first_data(lane, message.topic)
+
+                if victim is not None:
+                    break
+
+        if victim is None and self._retransmissions:
+            victim = self._retransmissions.popleft()
+
+        if victim is None:
+            victim = self._remove_first_data(self._data)
+
+        if victim is None:
+            lane = self._control or self._data
+            victim = lane.popleft()
+
+        self._size -= 1
+
+        return victim
+
+    @staticmethod
+    def _remove_first_data(
+            lane: Deque[Message], topic: Optional[str] = None
+    ) -> Optional[Message]:
+        """
+        Removes the oldest data message (optionally, with the specified
+        topic) from the lane
+
+        :param lane: a lane to remove the message from
+        :param topic: a topic of the message to be removed; any topic
+               matches if None
+        :return: the removed message or None if nothing was found
+        """
+        for index, item in enumerate(lane):
+            if item.type == 'data' and (topic is None or item.topic == topic):
+                del lane[index]
+                return item
+
+        return None
+
+    def _pop(self) -> Message:
+        """
+        Removes and returns the next message to be sent. The queue must not
+        be empty
+
+        :return: the next message
+        """
+        self._size -= 1
+
+        if self._control:
+            return self._control.popleft()
+
+        if self._retransmissions and self._data:
+            turn = self._turn
+            self._turn = (turn + 1) % self._cycle_length
+
+            if turn < self._retransmission_weight:
+                return self._retransmissions.popleft()
+
+            return self._data.popleft()
+
+        return (self._retransmissions or self._data).popleft()
+
+    async def get(self) -> Message:
+        """
+        Removes and returns the next message from the queue. Blocks if the
+        queue is empty
+
+        :return: the next message from the queue
+        """
+        while not self._size:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        return self._pop()
+
+    def drain_nowait(self, max_count: int) -> List[Message]:
+        """
+        Removes and returns up to max_count next messages from the queue.
+        Never blocks
+
+        :param max_count: the maximum number of messages to be returned
+        :return: a list of removed messages in order of their sending
+        """
+        count = min(max_count, self._size)
+
+        return [self._pop() for _ in range(count)]
+
+    def replace(self, messages: Iterable[Message]) -> None:
+        """
+        Replaces all pending messages with the specified data messages. The
+        overflow policy is not applied: the number of replaced messages is
+        expected to be limited by the caller
+
+        :param messages: messages to be sent instead of pending ones
+        :return: None
+        """
+        self.clear()
+        self._data.extend(messages)
+        self._size = len(self._data)
+
+        if self._size:
+            self._not_empty.set()
+
+        if self._size > self._high_water_mark:
+            self._high_water_mark = self._size
+
+    def clear(self) -> None:
+        """
+        Removes all messages from the queue
+
+        :return: None
+        """
+        self._control.clear()
+        self._retransmissions.clear()
+        self._data.clear()
+        self._size = 0
+        self._not_empty.clear()
@@ -0,0 +1,166 @@
+"""
+This module contains a definition of RateLimiter - of a component which
+limits the rate of data messages sent to a Session for each topic - and of
+modes of such limiting
+"""
+import asyncio
+from enum import Enum
+from typing import Callable, Dict, Optional
+
+from dpl.model.domain_id import TDomainId
+from .message_json import SharedFrame
+
+
+class RateLimitMode(Enum):
+    """
+    An enumeration of modes of rate limiting
+    """
+    # the first message is sent immediately, all the following messages
+    # that arrive during the interval are conflated and the latest of them
+    # is sent at the end of the interval
+    throttle = 'throttle'
+    # a message is sent only if there were no newer messages with the same
+    # topic during the interval
+    debounce = 'debounce'
+
+
+# a callable to be called with an identifier of a Session, a topic and a
+# message frame which must to be delivered to the Session
+DeliveryCallback = Callable[[TDomainId, str, SharedFrame], None]
+
+
+class _Slot(object):
+    """
+    A state of rate limiting of a single topic for a single Session
+    """
+    __slots__ = ('pending', 'timer')
+
+    def __init__(self):
+        self.pending = None  # type: Optional[SharedFrame]
+        self.timer = None  # type: Optional[asyncio.Handle]
+
+
+class RateLimiter(object):
+    """
+    RateLimiter conflates data messages for each pair of a Session and of a
+    topic, so the Session receives at most one message per interval for each
+    topic. Messages are conflated before they are put to the queue of pending
+    messages and before they are encoded, so extra updates cost nothing but
+    a replacement of a reference.
+
+    The state is kept only while the interval is active, so the memory usage
+    depends only on the number of recently updated topics
+    """
+    def __init__(
+            self, loop: asyncio.AbstractEventLoop, deliver: DeliveryCallback
+    ):
+        """
+        Constructor
+
+        :param loop: an event loop to be used for scheduling
+        :param deliver: a callable to be called for each message which
+               passed through the limiter
+        """
+        self._loop = loop
+        self._deliver = deliver
+        self._slots = dict()  # type: Dict[TDomainId, Dict[str, _Slot]]
+
+    def submit(
+            self, session_id: TDomainId, topic: str, frame: SharedFrame,
+            min_interval: float, mode: RateLimitMode
+    ) -> None:
+        """
+        Passes a message to be delivered to the Session through the limiter.
+        The message is delivered immediately, later or is replaced by a newer
+        message with the same topic depending on the mode
+
+        :param session_id: an identifier of the Session
+        :param topic: the topic of the message
+        :param frame: the message to be delivered
+        :param min_interval: the minimal interval (in seconds) between two
+               consecutive messages with this topic
+        :param mode: the mode of rate limiting
+        :return: None
+        """
+        session_slots = self._slots.setdefault(session_id, {})
+        slot = session_slots.get(topic)
+
+        if mode is RateLimitMode.throttle:
+            if slot is not None:
+                slot.pending = frame
+                return
+
+            self._deliver(session_id, topic, frame)
+
+            # an empty slot blocks immediate delivery until the end of the
+            # interval and is removed if nothing has arrived till that moment
+            slot = _Slot()
+            session_slots[topic] = slot
+        else:
+            if slot is None:
+                slot = _Slot()
+                session_slots[topic] = slot
+            else:
+                slot.timer.cancel()
+
+            slot.pending = frame
+
+        slot.timer = self._loop.call_later(
+            min_interval, self._on_interval_end,
+            session_id, topic, min_interval, mode
+        )
+
+    def _on_interval_end(
+            self, session_id: TDomainId, topic: str, min_interval: float,
+            mode: RateLimitMode
+    ) -> None:
+        """
+        Delivers the latest conflated message (if any) at the end of the
+        interval and removes or restarts the slot
+
+        :param session_id: an identifier of the Session
+        :param topic: the topic of messages
+        :param min_interval: the minimal interval between messages
+        :param mode: the mode of rate limiting
+        :return: None
+        """
+        session_slots = self._slots[session_id]
+        slot = session_slots[topic]
+        frame = slot.pending
+
+        if frame is None:
+            del session_slots[topic]
+
+            if not session_slots:
+                del self._slots[session_id]
+
+            return
+
+        slot.pending = None
+
+        if mode is RateLimitMode.throttle:
+            slot.timer = self._loop.call_later(
+                min_interval, self._on_interval_end,
+                session_id, topic, min_interval, mode
+            )
+        else:
+            slot.timer = None
+            del session_slots[topic]
+
+            if not session_slots:
+                del self._slots[session_id]
+
+        self._deliver(session_id, topic, frame)
+
+    def discard_for(self, session_id: TDomainId) -> None:
+        """
+        Drops all conflated messages of the specified Session
+
+        :param session_id: an identifier of the Session
+        :return: None
+        """
+        session_slots = self._slots.pop(session_id, {})
+
+        for slot in session_slots.values():
+            if slot.timer is not None:
+                slot.timer.cancel()
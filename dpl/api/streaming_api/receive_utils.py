@@ -3,16 +3,36 @@ This module contains utility functions and definitions which are useful for
 receiving and processing WebSocket messages
 """
 import json
+from typing import Mapping
 
 from aiohttp.web import WebSocketResponse, WSMsgType
 
+from .message_codec import MessageCodec, get_bound_codec
 
-class NotTextFrame(Exception):
+
+class UnexpectedFrameType(Exception):
+    """
+    A base class for exceptions to be raised if the client sent a frame of
+    unexpected type
+    """
+    # a name of the expected type of frames
+    expected = None  # type: str
+
+
+class NotTextFrame(UnexpectedFrameType):
     """
     An exception to be raised if the client sent a frame that is not a TEXT
     frame
     """
-    pass
+    expected = 'TEXT'
+
+
+class NotBinaryFrame(UnexpectedFrameType):
+    """
+    An exception to be raised if the client sent a frame that is not a BINARY
+    frame while a binary codec was negotiated
+    """
+    expected = 'BINARY'
 
 
 async def own_receive_json(
@@ -37,3 +57,35 @@ async def own_receive_json(
         return loads(frame.data)
     else:
         raise NotTextFrame()
+
+
+async def own_receive_message(
+        ws: WebSocketResponse, *, codec: MessageCodec = None,
+        timeout: int = None
+) -> Mapping:
+    """
+    Receives a frame and decodes it with the specified codec or with the
+    codec negotiated for this connection
+
+    :param ws: an instance of WebSocketResponse used for message receiving
+    :param codec: a codec to be used; the negotiated one if not specified
+    :param timeout: timeout for receive operation.
+    :return: decoded content
+    :raises UnexpectedFrameType: if the type of the frame doesn't match
+            the codec
+    :raises json.JSONDecodeError: if the JSON codec is used and the message
+            is not valid JSON
+    :raises FrameDecodeError: if the message can't be decoded by the codec
+    """
+    if codec is None:
+        codec = get_bound_codec(ws)
+
+    frame = await ws.receive(timeout=timeout)
+
+    if codec.is_binary:
+        if frame.type != WSMsgType.BINARY:
+            raise NotBinaryFrame()
+    elif frame.type != WSMsgType.TEXT:
+        raise NotTextFrame()
+
+    return codec.decode(frame.data)
@@ -0,0 +1,106 @@
+"""
+This module contains a definition of ReplayBuffer - of a bounded buffer of
+the latest data messages sent to a single Session which allows to replay
+messages missed by a client during reconnection
+"""
+from collections import deque
+from itertools import islice
+from typing import Deque, List
+
+from .message import Message
+
+
+class ReplayOffsetError(Exception):
+    """
+    An exception to be raised if messages after the requested offset are
+    not available anymore (or were never sent) and the client must to resync
+    its state
+    """
+    pass
+
+
+class ReplayBuffer(object):
+    """
+    ReplayBuffer assigns monotonically increasing sequence numbers to data
+    messages sent to a Session and keeps the latest max_size of them
+    """
+    def __init__(self, max_size: int, last_seq: int = 0):
+        """
+        Constructor
+
+        :param max_size: the maximum number of messages to be kept
+        :param last_seq: the sequence number of the last message which was
+               sent to the Session before
+        """
+        assert max_size > 0
+        self._messages = deque(maxlen=max_size)  # type: Deque[Message]
+        self._last_seq = last_seq
+
+    @property
+    def last_seq(self) -> int:
+        """
+        Returns the sequence number of the latest message
+
+        :return: the sequence number of the latest message or zero if no
+                 messages were sent yet
+        """
+        return self._last_seq
+
+    @last_seq.setter
+    def last_seq(self, value: int) -> None:
+        """
+        Moves the sequence forward. Is used to restore the sequence after
+        restart, drops all buffered messages
+
+        :param value: the sequence number of the latest sent message
+        :return: None
+        """
+        assert value >= self._last_seq
+        self._messages.clear()
+        self._last_seq = value
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def append(self, message: Message) -> int:
+        """
+        Assigns the next sequence number to the message and saves it.
+        The oldest message is dropped if the buffer is full
+
+        :param message: a message to be saved
+        :return: the assigned sequence number
+        """
+        assert message.seq is None
+        self._last_seq += 1
+        message.seq = self._last_seq
+        self._messages.append(message)
+
+        return self._last_seq
+
+    def since(self, offset: int) -> List[Message]:
+        """
+        Returns all messages with sequence numbers greater than the specified
+        offset in order of their sequence numbers
+
+        :param offset: the sequence number of the last message which was
+               received by a client
+        :return: a list of messages missed by the client
+        :raises ReplayOffsetError: if some of the messages after the offset
+                were dropped already or if the offset is in the future
+        """
+        first_available = self._last_seq - len(self._messages) + 1
+
+        if offset < first_available - 1 or offset > self._last_seq:
+            raise ReplayOffsetError()
+
+        return list(islice(
+            self._messages, offset - first_available + 1, None
+        ))
+
+    def clear(self) -> None:
+        """
+        Removes all saved messages. The sequence is not reset
+
+        :return: None
+        """
+        self._messages.clear()
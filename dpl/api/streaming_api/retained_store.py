@@ -0,0 +1,110 @@
+"""
+This module contains a definition of AbsRetainedStore - of an interface of
+persistent storages of retained (tracked) messages - and its simplest
+implementation, NullRetainedStore, which doesn't persist anything
+"""
+from typing import Iterable, Tuple
+
+from dpl.model.domain_id import TDomainId
+from .message import Message
+
+
+# a retained message restored from the storage: an identifier of Session,
+# a message itself and if the message was added with conflation
+RetainedRecord = Tuple[TDomainId, Message, bool]
+
+
+class AbsRetainedStore(object):
+    """
+    AbsRetainedStore is an interface of storages that save retained messages
+    to survive restarts of the platform. All of the modification methods are
+    called in the hot path of message delivery, so they must not block:
+    implementations are expected to buffer changes and to persist them in
+    background
+    """
+    async def open(self) -> None:
+        """
+        Prepares the storage to work and starts background activities
+
+        :return: None
+        """
+        raise NotImplementedError()
+
+    async def close(self) -> None:
+        """
+        Persists all buffered changes and stops background activities
+
+        :return: None
+        """
+        raise NotImplementedError()
+
+    def load(self) -> Iterable[RetainedRecord]:
+        """
+        Loads all retained messages which were not removed yet, in order
+        of their addition. Is a blocking call
+
+        :return: an iterable of restored messages
+        """
+        raise NotImplementedError()
+
+    def add(
+            self, session_id: TDomainId, message: Message, conflate: bool
+    ) -> None:
+        """
+        Saves a new retained message
+
+        :param session_id: an identifier of Session the message belongs to
+        :param message: a message to be saved; must have message_id set
+        :param conflate: if the message was added with conflation
+        :return: None
+        """
+        raise NotImplementedError()
+
+    def remove(
+            self, session_id: TDomainId, message_ids: Iterable[int]
+    ) -> None:
+        """
+        Removes the specified messages (i.e. acknowledged or replaced ones)
+
+        :param session_id: an identifier of Session the messages belong to
+        :param message_ids: identifiers of messages to be removed
+        :return: None
+        """
+        raise NotImplementedError()
+
+    def discard(self, session_id: TDomainId) -> None:
+        """
+        Removes all messages of the specified Session
+
+        :param session_id: an identifier of Session to be forgotten
+        :return: None
+        """
+        raise NotImplementedError()
+
+
+class NullRetainedStore(AbsRetainedStore):
+    """
+    An implementation of AbsRetainedStore which doesn't save anything. Is
+    used if persistence of retained messages is disabled
+    """
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def load(self) -> Iterable[RetainedRecord]:
+        return ()
+
+    def add(
+            self, session_id: TDomainId, message: Message, conflate: bool
+    ) -> None:
+        pass
+
+    def remove(
+            self, session_id: TDomainId, message_ids: Iterable[int]
+    ) -> None:
+        pass
+
+    def discard(self, session_id: TDomainId) -> None:
+        pass
@@ -0,0 +1,273 @@
+"""
+This module contains a definition of SegmentLogRetainedStore - of a storage
+of retained messages which is based on an append-only SegmentLog
+"""
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from dpl.model.domain_id import TDomainId
+from dpl.utils.segment_log import SegmentLog
+from .message import Message
+from .message_json import message_dumps
+from .message_utils import parse_message
+from .retained_store import AbsRetainedStore, RetainedRecord
+
+
+LOGGER = logging.getLogger(__name__)
+
+# a key of a live message in the log: an identifier of Session and an
+# identifier of a message
+_LiveKey = Tuple[TDomainId, int]
+
+
+class _LiveRecords(object):
+    """
+    Replays operations stored in the log and keeps payloads of add operations
+    which were not cancelled by the following remove or discard operations
+    """
+    def __init__(self):
+        self.records = OrderedDict()  # type: OrderedDict[_LiveKey, bytes]
+        self._by_session = dict()  # type: Dict[TDomainId, Set[_LiveKey]]
+
+    def replay(self, payloads: Iterable[bytes]) -> '_LiveRecords':
+        """
+        Applies all the specified operations
+
+        :param payloads: payloads of the log records
+        :return: self
+        """
+        for payload in payloads:
+            # payloads may be memoryviews of a mapped segment which are
+            # invalidated after the segment is closed, so they are copied
+            payload = bytes(payload)
+            record = json.loads(payload.decode('utf-8'))
+            operation = record['op']
+            session_id = record['session_id']
+
+            if operation == 'add':
+                key = (session_id, record['message']['message_id'])
+                self.records[key] = payload
+                self._by_session.setdefault(session_id, set()).add(key)
+
+            elif operation == 'remove':
+                for message_id in record['message_ids']:
+                    self._drop((session_id, message_id))
+
+            elif operation == 'discard':
+                for key in self._by_session.pop(session_id, ()):
+                    self.records.pop(key, None)
+
+        return self
+
+    def _drop(self, key: _LiveKey) -> None:
+        self.records.pop(key, None)
+        session_keys = self._by_session.get(key[0])
+
+        if session_keys is not None:
+            session_keys.discard(key)
+
+
+class SegmentLogRetainedStore(AbsRetainedStore):
+    """
+    SegmentLogRetainedStore saves all changes of retained messages as JSON
+    records in an append-only SegmentLog. Changes are buffered in memory and
+    are written to the disk by a background task in groups (group commit), so
+    the delivery of messages is never blocked by disk writes. The log is
+    compacted in background when it contains much more removed messages
+    than live ones.
+
+    Note that messages which were added or removed less than flush_interval
+    seconds before a crash may be lost or delivered again after restart.
+    """
+    DEFAULT_FLUSH_INTERVAL = 0.05
+    DEFAULT_COMPACTION_THRESHOLD = 10000
+
+    def __init__(
+            self, path: str, *, loop: asyncio.AbstractEventLoop = None,
+            flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+            compaction_threshold: int = DEFAULT_COMPACTION_THRESHOLD
+    ):
+        """
+        Constructor
+
+        :param path: a path to the directory with log segments
+        :param loop: an instance of EventLoop to be used for background tasks
+        :param flush_interval: a maximum time (in seconds) between the change
+               and its write to the disk
+        :param compaction_threshold: the minimal number of removed messages
+               stored in the log to start compaction
+        """
+        if loop is None:
+            self._loop = asyncio.get_event_loop()
+        else:
+            self._loop = loop
+
+        self._path = path
+        self._flush_interval = flush_interval
+        self._compaction_threshold = compaction_threshold
+
+        self._log = None  # type: Optional[SegmentLog]
+        self._flusher = None  # type: Optional[asyncio.Future]
+        self._is_dirty = False
+
+        # approximate numbers of live and removed messages stored in the log
+        self._live_count = 0
+        self._dead_count = 0
+        # approximate numbers of live messages of each Session
+        self._session_counts = dict()  # type: Dict[TDomainId, int]
+
+    async def open(self) -> None:
+        """
+        Opens the log and starts a background flusher
+
+        :return: None
+        """
+        assert self._log is None
+        self._log = await self._loop.run_in_executor(
+            None, SegmentLog, self._path
+        )
+        self._flusher = asyncio.ensure_future(
+            self._flush_periodically(), loop=self._loop
+        )
+
+    async def close(self) -> None:
+        """
+        Stops the background flusher, writes all buffered changes and
+        closes the log
+
+        :return: None
+        """
+        if self._log is None:
+            return
+
+        self._flusher.cancel()
+
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+
+        await self._loop.run_in_executor(None, self._log.close)
+        self._log = None
+
+    def load(self) -> Iterator[RetainedRecord]:
+        """
+        Reads the log and returns all messages that were not removed yet
+
+        :return: an iterator over restored messages
+        """
+        live = _LiveRecords().replay(self._log.read_all())
+
+        self._live_count = len(live.records)
+        self._dead_count = 0
+        self._session_counts.clear()
+
+        for (session_id, message_id), payload in live.records.items():
+            self._session_counts[session_id] = \
+                self._session_counts.get(session_id, 0) + 1
+            record = json.loads(payload.decode('utf-8'))
+            message = parse_message(record['message'])
+            message.message_id = message_id
+
+            yield session_id, message, record['conflate']
+
+    def add(
+            self, session_id: TDomainId, message: Message, conflate: bool
+    ) -> None:
+        assert message.message_id is not None
+
+        self._append(
+            '{"op": "add", "session_id": %s, "conflate": %s, "message": %s}' % (
+                json.dumps(session_id), json.dumps(conflate),
+                message_dumps(message)
+            )
+        )
+        self._live_count += 1
+        self._session_counts[session_id] = \
+            self._session_counts.get(session_id, 0) + 1
+
+    def remove(
+            self, session_id: TDomainId, message_ids: Iterable[int]
+    ) -> None:
+        message_ids = list(message_ids)
+
+        if not message_ids:
+            return
+
+        self._append(json.dumps({
+            'op': 'remove', 'session_id': session_id,
+            'message_ids': message_ids
+        }))
+        self._live_count -= len(message_ids)
+        self._dead_count += len(message_ids)
+        self._session_counts[session_id] = \
+            self._session_counts.get(session_id, 0) - len(message_ids)
+
+    def discard(self, session_id: TDomainId) -> None:
+        self._append(json.dumps({'op': 'discard', 'session_id': session_id}))
+
+        # all live messages of the Session are removed at once
+        discarded = max(self._session_counts.pop(session_id, 0), 0)
+        self._live_count -= discarded
+        self._dead_count += discarded
+
+    def _append(self, record: str) -> None:
+        """
+        Buffers the specified record to be written by the background flusher
+
+        :param record: a JSON-encoded record
+        :return: None
+        """
+        self._log.append(record.encode('utf-8'))
+        self._is_dirty = True
+
+    def _needs_compaction(self) -> bool:
+        return self._dead_count >= self._compaction_threshold and \
+            self._dead_count > self._live_count
+
+    async def _flush_periodically(self) -> None:
+        """
+        Writes buffered changes to the disk every flush_interval seconds and
+        compacts the log if needed. Disk operations are performed in the
+        default executor, so the event loop is never blocked by them
+
+        :return: None
+        """
+        while True:  # interrupted with future cancellation
+            await asyncio.sleep(self._flush_interval, loop=self._loop)
+
+            try:
+                if self._is_dirty:
+                    self._is_dirty = False
+                    await self._loop.run_in_executor(None, self._log.flush)
+
+                if self._needs_compaction():
+                    await self._compact()
+            except OSError as e:
+                LOGGER.error(
+                    "Failed to save retained messages to %s: %s",
+                    self._path, e
+                )
+
+    async def _compact(self) -> None:
+        """
+        Removes records of acknowledged and discarded messages from the log
+
+        :return: None
+        """
+        LOGGER.debug(
+            "Compacting the log of retained messages: %d live, %d removed",
+            self._live_count, self._dead_count
+        )
+
+        # the counters are reset before compaction, so changes performed
+        # while compaction is in progress are accounted for the next one
+        self._dead_count = 0
+
+        def _select_live(payloads: Iterable[bytes]) -> Iterable[bytes]:
+            return _LiveRecords().replay(payloads).records.values()
+
+        await self._loop.run_in_executor(None, self._log.compact, _select_live)
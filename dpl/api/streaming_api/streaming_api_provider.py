@@ -5,10 +5,14 @@ import asyncio
 import logging
 import weakref
 import functools
-from typing import Mapping, Dict, Tuple
+from typing import (
+    Any, Mapping, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+)
 
 from aiohttp import WSCloseCode
-from aiohttp.web import Request, WebSocketResponse, UrlDispatcher, Application
+from aiohttp.web import (
+    Request, Response, WebSocketResponse, UrlDispatcher, Application
+)
 
 from dpl.model.domain_id import TDomainId
 from dpl.api.http_api_provider import HttpApiProvider
@@ -17,29 +21,82 @@ from dpl.auth.auth_context import AuthContext
 from dpl.auth.auth_service import (
     AbsAuthService, AuthInvalidTokenError, ServiceEntityResolutionError
 )
+from dpl.auth.exceptions import AuthInsufficientPrivilegesError
+from dpl.services.abs_entity_service import AbsEntityService
+from dpl.services.abs_placement_service import AbsPlacementService
+from dpl.services.abs_thing_service import AbsThingService
+from dpl.services.service_exceptions import (
+    ServiceTypeError, ServiceInvalidArgumentsError,
+    ServiceUnsupportedCommandError
+)
 from dpl.events.event import Event
 from dpl.events.object_related_event import ObjectRelatedEvent
 from dpl.events.event_hub import EventHub
+from dpl.events.topic import (
+    topic_to_list, iterable_to_topic, topic_matches, is_valid_pattern
+)
 from dpl.api.api_errors import ERROR_TEMPLATES
-from .receive_utils import own_receive_json
+from dpl.api.rest_api.common import make_json_response
+from .receive_utils import own_receive_json, own_receive_message
 from .message import Message
-from .message_json import message_dumps
+from .message_json import SharedFrame, FramedMessage
+from .message_codec import (
+    MessageCodec, UnsupportedCodecError, JSON_CODEC,
+    get_codec, bind_codec, send_message, send_batch
+)
 from .message_utils import (
     build_message, parse_message
 )
 from .error_message_utlis import (
     send_error_message_by_code
 )
-from .subscription_storage import SubscriptionStorage
+from .subscription_storage import (
+    SubscriptionStorage, SubscriptionParams, SubscribersMapping
+)
 from .delivery_manager import DeliveryManager
+from .metrics import StreamingMetrics, build_diagnostics, render_text
+from .retained_store import AbsRetainedStore
+from .pending_queue import OverflowPolicy
+from .rate_limiter import RateLimiter, RateLimitMode
+from .delta_encoding import DeltaEncoder, VersionedFrame
+from .body_filter import BodyPredicate, FilterSyntaxError, compile_filter
 from .streaming_flow_error import StreamingFlowError
 from .error_handling_context import ErrorHandler
 
 StreamingSessionData = Tuple[WebSocketResponse, asyncio.Task]
 ActiveSessionsRegistry = Dict[TDomainId, StreamingSessionData]
 
+# pairs of a root topic of objects and of a service which provides their DTOs
+SnapshotSources = Sequence[Tuple[str, AbsEntityService]]
+
 LOGGER = logging.getLogger(__name__)
 
+# optional protocol features supported by this server; are advertised to
+# clients in the body of auth_ack message
+CAPABILITIES = (
+    'cumulative_ack',  # delivery_ack accepts the up_to field
+    'range_ack',  # delivery_ack accepts the ranges field
+    'resume',  # auth accepts the resume_from field
+    'batching',  # auth accepts the batching field
+    'snapshot',  # subscribe accepts the with_snapshot field
+    'rate_limit',  # subscribe accepts max_rate, min_interval and rate_mode
+    'delta',  # subscribe accepts the delta field; delta_resync is supported
+    'filter',  # subscribe accepts the filter field
+    'execute',  # commands can be sent with execute messages
+)
+
+# the last level of topics to be used for objects in snapshots; a snapshot
+# contains all objects for which such topic matches the subscription
+SNAPSHOT_EVENT_TYPE = 'modified'
+
+# parameters of a connection requested by a client in the auth message
+AuthRequest = NamedTuple('AuthRequest', [
+    ('access_token', str),
+    ('resume_from', Optional[int]),
+    ('codec', MessageCodec),
+    ('is_batching', bool)
+])
+
 
 async def streaming_connection_handler(request: Request) -> WebSocketResponse:
     """
@@ -68,16 +125,73 @@ async def streaming_connection_handler(request: Request) -> WebSocketResponse:
     return ws
 
 
+async def diagnostics_handler(request: Request) -> Response:
+    """
+    A handler for GET requests for the diagnostics path. Returns a JSON
+    report with delivery metrics of each Session and of all of them
+
+    :param request: a request to be handled
+    :return: a response to request
+    """
+    api_provider = request.app['api_provider']  # type: StreamingApiProvider
+    error_response = api_provider.check_diagnostics_access(request)
+
+    if error_response is not None:
+        return error_response
+
+    return make_json_response(api_provider.build_diagnostics())
+
+
+async def metrics_handler(request: Request) -> Response:
+    """
+    A handler for GET requests for the metrics path. Returns delivery
+    metrics in the text exposition format of Prometheus
+
+    :param request: a request to be handled
+    :return: a response to request
+    """
+    api_provider = request.app['api_provider']  # type: StreamingApiProvider
+    error_response = api_provider.check_diagnostics_access(request)
+
+    if error_response is not None:
+        return error_response
+
+    return Response(
+        text=api_provider.render_metrics(),
+        content_type='text/plain', charset='utf-8',
+        headers={'Cache-Control': 'no-store'}
+    )
+
+
 class StreamingApiProvider(HttpApiProvider, Observer):
     """
     StreamingApiProvider implements handling of Streaming API logic. It handles
     attempts to establish WebSocket connection, Authentication flow, handling
     of incoming messages and sending system-side events
     """
+    # the maximum interval between checks for expired inactive Sessions
+    EVICTION_CHECK_INTERVAL = 60
+
     def __init__(
             self, auth_context: AuthContext, auth_service: AbsAuthService,
             api_root: str = '/',
-            loop: asyncio.AbstractEventLoop = None
+            loop: asyncio.AbstractEventLoop = None,
+            max_pending_messages: int = DeliveryManager.DEFAULT_MAX_PENDING,
+            overflow_policy: str = OverflowPolicy.drop_oldest.value,
+            retransmission_window: int = (
+                DeliveryManager.DEFAULT_RETRANSMISSION_WINDOW
+            ),
+            retained_store: AbsRetainedStore = None,
+            replay_buffer_size: int = (
+                DeliveryManager.DEFAULT_REPLAY_BUFFER_SIZE
+            ),
+            batch_flush_window: float = 0,
+            max_batch_size: int = 100,
+            thing_service: AbsThingService = None,
+            placement_service: AbsPlacementService = None,
+            collect_metrics: bool = False,
+            session_ttl: float = None,
+            max_retained_messages: int = None
     ):
         """
         Constructor. Initializes internal data structures and saves references
@@ -89,6 +203,40 @@ class StreamingApiProvider(HttpApiProvider, Observer):
                access rights for different information in the system
         :param api_root: a path for the API root
         :param loop: event tool to be used for this provider
+        :param max_pending_messages: the maximum number of messages pending
+               on delivery for each Session
+        :param overflow_policy: the name of a policy to be applied if a
+               client is too slow to consume pending messages: one of
+               'drop_oldest', 'conflate' or 'disconnect'
+        :param retransmission_window: the maximum number of unacknowledged
+               retransmitted messages in flight for each Session
+        :param retained_store: a storage to save unacknowledged messages to,
+               so they survive restarts; such messages are kept only in
+               memory if not specified
+        :param replay_buffer_size: the number of the latest data messages to
+               be kept for each Session to be replayed on resumption
+        :param batch_flush_window: the time (in seconds) to collect messages
+               into a single frame for clients which requested batching; if
+               zero, then only already pending messages are batched
+        :param max_batch_size: the maximum number of messages in a single
+               frame for clients which requested batching
+        :param thing_service: a service to fetch the current state of Things
+               from on subscription with a snapshot and to send commands to;
+               snapshots of Things are not sent and commands are not
+               accepted if not specified
+        :param placement_service: a service to fetch the current state of
+               Placements from on subscription with a snapshot; snapshots of
+               Placements are not sent if not specified
+        :param collect_metrics: if delivery metrics must to be collected and
+               exposed on the 'diagnostics' (JSON) and 'metrics' (text
+               format of Prometheus) paths under the API root
+        :param session_ttl: the time (in seconds) after which all the data
+               of a disconnected Session (subscriptions, pending, retained
+               and replayable messages) is discarded; is kept until the
+               Session is invalidated if None
+        :param max_retained_messages: the maximum number of retained
+               messages of all Sessions; if exceeded, then the oldest
+               retained messages are dropped; not limited if None
         """
         super().__init__(loop=loop)
 
@@ -100,11 +248,86 @@ class StreamingApiProvider(HttpApiProvider, Observer):
         self._subs_storage = SubscriptionStorage()
         self._active_sessions = dict()  # type: ActiveSessionsRegistry
         self._active_sessions_lock = asyncio.Lock(loop=self._loop)
-        self._delivery_manager = DeliveryManager(loop=self._loop)
+        self._batch_flush_window = batch_flush_window
+        self._max_batch_size = max_batch_size
+        self._thing_service = thing_service
+        self._snapshot_sources = tuple(
+            (root_topic, service) for root_topic, service in (
+                ('things', thing_service),
+                ('placements', placement_service)
+            )
+            if service is not None
+        )  # type: SnapshotSources
+        self._metrics = (
+            StreamingMetrics() if collect_metrics else None
+        )  # type: Optional[StreamingMetrics]
+        self._delivery_manager = DeliveryManager(
+            loop=self._loop,
+            max_pending_messages=max_pending_messages,
+            overflow_policy=OverflowPolicy(overflow_policy),
+            slow_consumer_handler=self._disconnect_slow_consumer,
+            retransmission_window=retransmission_window,
+            retained_store=retained_store,
+            replay_buffer_size=replay_buffer_size,
+            metrics=self._metrics,
+            max_retained_messages=max_retained_messages
+        )
+        self._rate_limiter = RateLimiter(
+            loop=self._loop, deliver=self._on_rate_limited_frame
+        )
+        self._delta_encoder = DeltaEncoder()
+
+        self._session_ttl = session_ttl
+        # moments (in terms of event loop time) of disconnection of Sessions
+        # which are not connected now
+        self._inactive_since = dict()  # type: Dict[TDomainId, float]
+        # identifiers of evicted Sessions; such Sessions can't be resumed
+        # and their clients must to resync their state on reconnection
+        self._evicted_sessions = set()  # type: Set[TDomainId]
+        self._eviction_task = None  # type: Optional[asyncio.Task]
 
         router = self._app.router  # type: UrlDispatcher
         router.add_get(path=api_root, handler=streaming_connection_handler)
 
+        if collect_metrics:
+            router.add_get(
+                path=api_root + 'diagnostics', handler=diagnostics_handler
+            )
+            router.add_get(path=api_root + 'metrics', handler=metrics_handler)
+
+    async def start(self) -> None:
+        """
+        Restores messages which delivery was not acknowledged before the
+        last shutdown. Must to be called before any client is connected
+
+        :return: None
+        """
+        await self._delivery_manager.open()
+
+        # Sessions with restored messages are inactive until they reconnect
+        now = self._loop.time()
+
+        for session_id in self._delivery_manager.list_sessions():
+            self._inactive_since.setdefault(session_id, now)
+
+        if self._session_ttl is not None:
+            self._eviction_task = asyncio.ensure_future(
+                self._evict_inactive_sessions_periodically(), loop=self._loop
+            )
+
+    async def stop(self) -> None:
+        """
+        Saves all unacknowledged messages. Must to be called after all
+        clients are disconnected
+
+        :return: None
+        """
+        if self._eviction_task is not None:
+            self._eviction_task.cancel()
+            self._eviction_task = None
+
+        await self._delivery_manager.close()
+
     async def on_shutdown(self, app: Application) -> None:
         """
         Closes all opened sessions
@@ -118,6 +341,86 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             await ws.close(code=WSCloseCode.GOING_AWAY)
             await task
 
+    def check_diagnostics_access(self, request: Request) -> Optional[Response]:
+        """
+        Checks if the access token specified in the request permits viewing
+        of delivery metrics
+
+        :param request: a request to the diagnostics or metrics path
+        :return: None if the access is permitted; an error response
+                 otherwise
+        """
+        token = request.headers.get('Authorization')
+
+        if token is None:
+            return make_json_response(
+                status=401, content=ERROR_TEMPLATES[2100].to_dict()
+            )
+
+        try:
+            self._auth_service.check_permission(
+                access_token=token, in_domain='streaming_api',
+                to_execute='view_diagnostics'
+            )
+        except AuthInvalidTokenError:
+            return make_json_response(
+                status=401, content=ERROR_TEMPLATES[2101].to_dict()
+            )
+        except AuthInsufficientPrivilegesError:
+            error_dict = ERROR_TEMPLATES[2110].to_dict()
+            error_dict["user_message"] = error_dict["user_message"].format(
+                action="viewing of Streaming API diagnostics"
+            )
+
+            return make_json_response(status=403, content=error_dict)
+
+        return None
+
+    def _collect_gauges(self) -> Dict[TDomainId, Dict[str, int]]:
+        """
+        Collects the current state of queues and subscriptions of all known
+        Sessions
+
+        :return: a mapping of Session identifiers to the mapping of gauge
+                 names to their values
+        """
+        gauges = self._delivery_manager.get_gauges()
+
+        for session_id in self._subs_storage.list_sessions():
+            gauges.setdefault(session_id, {})
+
+        for session_id, session_gauges in gauges.items():
+            session_gauges['subscriptions'] = self._subs_storage.count_for(
+                session_id
+            )
+            session_gauges['connected'] = int(
+                session_id in self._active_sessions
+            )
+
+        return gauges
+
+    def build_diagnostics(self) -> Dict[str, Any]:
+        """
+        Builds a report with delivery metrics of each Session and of all of
+        them. Must to be called only if metrics are collected
+
+        :return: a JSON-serializable report
+        """
+        assert self._metrics is not None
+
+        return build_diagnostics(self._metrics, self._collect_gauges())
+
+    def render_metrics(self) -> str:
+        """
+        Renders delivery metrics in the text exposition format of
+        Prometheus. Must to be called only if metrics are collected
+
+        :return: rendered metrics
+        """
+        assert self._metrics is not None
+
+        return render_text(self._metrics, self._collect_gauges())
+
     async def invalidate_session(self, session_id: TDomainId) -> None:
         """
         Removes all session-related data from the internal storage and
@@ -134,8 +437,86 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             await ws.close()
             await task
 
-        await self._subs_storage.remove_all_for(session_id)
+        await self._discard_session_data(session_id)
+        self._evicted_sessions.discard(session_id)
+
+    async def _discard_session_data(self, session_id: TDomainId) -> None:
+        """
+        Removes subscriptions and all stored messages of the Session. Stored
+        messages are removed first, so the Session is still known if their
+        removal fails
+
+        :param session_id: an identifier of Session to be forgotten
+        :return: None
+        """
         await self._delivery_manager.discard_for(session_id)
+        self._inactive_since.pop(session_id, None)
+        self._subs_storage.remove_all_for(session_id)
+        self._rate_limiter.discard_for(session_id)
+        self._delta_encoder.forget(session_id)
+
+    async def _evict_inactive_sessions_periodically(self) -> None:
+        """
+        Periodically discards the data of Sessions which were disconnected
+        for longer than the session_ttl. Thus Sessions of clients which will
+        never return (like uninstalled applications) don't hold memory
+        forever
+
+        :return: None
+        """
+        interval = min(self._session_ttl, self.EVICTION_CHECK_INTERVAL)
+
+        while True:  # interrupted with task cancellation
+            await asyncio.sleep(interval, loop=self._loop)
+
+            try:
+                await self._evict_inactive_sessions()
+            except Exception as e:
+                LOGGER.exception(
+                    "Failed to evict inactive Streaming Sessions: %s", e
+                )
+
+    async def _evict_inactive_sessions(self) -> int:
+        """
+        Discards the data of Sessions which were disconnected for longer
+        than the session_ttl
+
+        :return: the number of evicted Sessions
+        """
+        expire_before = self._loop.time() - self._session_ttl
+        evicted = 0
+
+        async with self._active_sessions_lock:
+            expired = [
+                session_id
+                for session_id, since in self._inactive_since.items()
+                if since <= expire_before and
+                session_id not in self._active_sessions
+            ]  # type: List[TDomainId]
+
+            for session_id in expired:
+                LOGGER.info(
+                    "Streaming Session %s is inactive for more than %s "
+                    "seconds, its data is discarded",
+                    session_id, self._session_ttl
+                )
+
+                try:
+                    await self._discard_session_data(session_id)
+                except Exception as e:
+                    LOGGER.exception(
+                        "Failed to evict Streaming Session %s: %s",
+                        session_id, e
+                    )
+                    continue
+
+                self._evicted_sessions.add(session_id)
+                evicted += 1
+
+                if self._metrics is not None:
+                    self._metrics.on_session_evicted()
+
+        return evicted
 
     async def handle_established_connection(self, ws: WebSocketResponse):
         """
@@ -149,30 +530,60 @@ class StreamingApiProvider(HttpApiProvider, Observer):
         :raises AuthInvalidTokenError: if the specified access token was
                 revoked or is not valid for some other reason
         """
-        token = await self._handle_auth_flow(ws=ws)
+        request = await self._handle_auth_flow(ws=ws)
 
         try:
             session = self._auth_service.view_current_session(
-                access_token=token
+                access_token=request.access_token
             )
         except ServiceEntityResolutionError:
             raise AuthInvalidTokenError()
 
         session_id = session['domain_id']
 
-        await self._register_session(session_id=session_id, ws=ws)
+        is_resumed = await self._register_session(
+            session_id=session_id, ws=ws, resume_from=request.resume_from
+        )
 
         auth_ack_message = build_message(
             type_="control",
             topic="auth_ack",
-            body={}
+            body={
+                'capabilities': list(CAPABILITIES),
+                'codec': request.codec.name,
+                'compression': request.codec.compression,
+                'batching': request.is_batching
+            }
         )
 
         # FIXME: CC41: Open the session explicitly in DeliveryManager
 
         try:
-            ws.send_json(auth_ack_message, dumps=message_dumps)
-            await self._message_loop(ws, session_id)
+            # auth_ack is always sent in JSON, all the following messages
+            # are encoded with the negotiated codec
+            send_message(ws, auth_ack_message)
+            bind_codec(ws, request.codec)
+
+            if not is_resumed:
+                # missed messages can't be replayed, the client must to
+                # fetch the current state of all objects again
+                self._delta_encoder.forget(session_id)
+                send_message(ws, build_message(
+                    type_="control",
+                    topic="resync",
+                    body={
+                        'last_seq': self._delivery_manager.get_last_seq(
+                            session_id
+                        )
+                    }
+                ))
+
+            # requests to services (like fetching of snapshots) are
+            # performed on behalf of the client
+            with self._auth_context(token=request.access_token):
+                await self._message_loop(
+                    ws, session_id, is_batching=request.is_batching
+                )
         finally:
             await self._cancel_session(session_id=session_id)
 
@@ -186,44 +597,136 @@ class StreamingApiProvider(HttpApiProvider, Observer):
         event = kwargs.get('event', args[0])  # type: Event
         assert isinstance(event, Event)
 
+        subscribers = self._subs_storage.resolve_subscribers(
+            topic=event.topic
+        )
+
+        if not subscribers:
+            # the body of the event (which may be built lazily) is not
+            # needed, but the update of the object must to be accounted
+            self._delta_encoder.skip_update(event.topic)
+            return
+
         if isinstance(event, ObjectRelatedEvent):
             message_body = event.object_dto
         else:
             message_body = {}
 
-        asyncio.ensure_future(
-            self._send_data_to_all(event.timestamp, event.topic, message_body),
-            loop=self._loop
+        self._send_data_to_all(
+            event.timestamp, event.topic, message_body, subscribers
         )
 
-    async def _send_data_to_all(
-            self, timestamp: float, topic: str, body: Mapping
+    def _send_data_to_all(
+            self, timestamp: float, topic: str, body: Mapping,
+            subscribers: SubscribersMapping
     ) -> None:
         """
-        Constructs the data message and sends it to all corresponding Clients
+        Constructs the data message and sends it to all corresponding Clients.
+        Never blocks: messages are added to the queues of pending messages
+        without waiting, so a slow client can't delay delivery to other ones
 
         :param timestamp: the time moment of message formation to be set
         :param topic: the topic of the message
         :param body: the content (payload) of the message
+        :param subscribers: Sessions subscribed to the topic and parameters
+               of their subscriptions
         :return: None
         """
-        for session_id in self._subs_storage.list_sessions():
-            is_retained = self._subs_storage.resolve_subscription_params(
-                session_id=session_id, topic=topic
+        # the content of the message is encoded only once and shared
+        # between all recipients; each of them receives its own sequence
+        # number (and message_id for Tracked Messages)
+        frame = self._delta_encoder.build_frame(
+            Message(timestamp=timestamp, type_="data", topic=topic, body=body)
+        )
+
+        if isinstance(frame, VersionedFrame):
+            previous = frame.previous
+        else:
+            previous = None
+
+        for session_id, params in subscribers.items():
+            # messages without a body (like notifications about deleted
+            # objects) are never filtered out
+            if params.body_filter is not None and body and \
+                    not params.body_filter(body, previous):
+                continue
+
+            if params.min_interval > 0:
+                self._rate_limiter.submit(
+                    session_id=session_id, topic=topic, frame=frame,
+                    min_interval=params.min_interval, mode=params.rate_mode
+                )
+            else:
+                self._send_frame(session_id, frame, params)
+
+    def _send_frame(
+            self, session_id: TDomainId, frame: SharedFrame,
+            params: SubscriptionParams
+    ) -> None:
+        """
+        Puts a data message to the queue of pending messages of a Session
+
+        :param session_id: an identifier of the Session
+        :param frame: the content of the message
+        :param params: parameters of subscription of the Session
+        :return: None
+        """
+        if params.is_delta:
+            frame = self._delta_encoder.select(session_id, frame)
+
+        message = FramedMessage(frame)
+
+        if not params.is_retained and session_id not in self._active_sessions:
+            # is kept only to be replayed if the Session will be resumed
+            self._delivery_manager.record_message(
+                session_id=session_id, message=message
             )
+            return
 
-            if is_retained is None:
-                continue  # this Session is not subscribed to this message
+        self._delivery_manager.put_message_nowait(
+            session_id=session_id, message=message,
+            ensure_delivery=params.is_retained,
+            conflate=params.is_conflated
+        )
 
-            if is_retained or session_id in self._active_sessions:
-                message = Message(
-                    timestamp=timestamp, type_="data", topic=topic, body=body
-                )
+    def _on_rate_limited_frame(
+            self, session_id: TDomainId, topic: str, frame: SharedFrame
+    ) -> None:
+        """
+        Sends a data message which passed through the RateLimiter. The
+        message is dropped if the Session has unsubscribed from the topic
+        while the message was delayed
 
-                await self._delivery_manager.put_message(
-                    session_id=session_id, message=message,
-                    ensure_delivery=is_retained
-                )
+        :param session_id: an identifier of the Session
+        :param topic: the topic of the message
+        :param frame: the content of the message
+        :return: None
+        """
+        params = self._subs_storage.resolve_subscription_params(
+            session_id=session_id, topic=topic
+        )
+
+        if params is not None:
+            self._send_frame(session_id, frame, params)
+
+    def _disconnect_slow_consumer(self, session_id: TDomainId) -> None:
+        """
+        Closes a connection with a client which is too slow to consume all
+        the messages sent to it
+
+        :param session_id: an identifier of the Session to be disconnected
+        :return: None
+        """
+        session_data = self._active_sessions.get(session_id)
+
+        if session_data is None:
+            return  # the client is already disconnected
+
+        ws, task = session_data
+
+        asyncio.ensure_future(
+            ws.close(code=WSCloseCode.TRY_AGAIN_LATER), loop=self._loop
+        )
 
     async def _handle_old_session(
             self, session_id: TDomainId,
@@ -266,16 +769,19 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             await old_task
 
     async def _register_session(
-            self, session_id: TDomainId, ws: WebSocketResponse
-    ) -> None:
+            self, session_id: TDomainId, ws: WebSocketResponse,
+            resume_from: Optional[int] = None
+    ) -> bool:
         """
-        Removes Session from the registry of opened sessions
+        Adds Session to the registry of opened sessions and resumes delivery
+        of messages to it
 
         :param session_id: an identifier of a Session to be registered
         :param ws: an instance of WebSocketResponse which represents WebSocket
                connection
-        :return: None
-        :raises
+        :param resume_from: a sequence number of the last data message
+               received by a client or None
+        :return: False if the client must to resync its state, True otherwise
         """
         LOGGER.debug("Starting new streaming session: %s", session_id)
 
@@ -288,11 +794,22 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             await self._handle_old_session(session_id, old_session_data)
 
         async with self._active_sessions_lock:
-            await self._delivery_manager.resume_for(session_id)
+            is_resumed = await self._delivery_manager.resume_for(
+                session_id, resume_from=resume_from
+            )
             self._active_sessions[session_id] = ws, current_task
+            self._inactive_since.pop(session_id, None)
+
+            if session_id in self._evicted_sessions:
+                # all the data of the Session was discarded, so the client
+                # must to resync even if it didn't ask for resumption
+                self._evicted_sessions.discard(session_id)
+                is_resumed = False
 
         LOGGER.debug("Streaming session started: %s", session_id)
 
+        return is_resumed
+
     async def _cancel_session(
             self, session_id: TDomainId, code: int = 1000
     ) -> None:
@@ -317,6 +834,7 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             ws, current_task = self._active_sessions[session_id]
             await ws.close(code=code)
             self._active_sessions.pop(session_id)
+            self._inactive_since[session_id] = self._loop.time()
 
     async def _handle_subscription_message(
             self, message: Message, session_id: TDomainId
@@ -332,10 +850,17 @@ class StreamingApiProvider(HttpApiProvider, Observer):
         """
         target_topic = message.body.get('target_topic')
         retain_messages = message.body.get('retain_messages', False)
+        conflate_messages = message.body.get('conflate_messages', False)
+        with_snapshot = message.body.get('with_snapshot', False)
+        min_interval = self._parse_min_interval(message.body)
+        rate_mode = message.body.get('rate_mode', RateLimitMode.throttle.value)
+        is_delta = message.body.get('delta', False)
+        body_filter = self._parse_body_filter(message.body)
 
         LOGGER.debug(
-            "Subscription request from %s: %s %s", session_id,
-            target_topic, retain_messages
+            "Subscription request from %s: %s %s %s %s %s %s %s", session_id,
+            target_topic, retain_messages, conflate_messages, with_snapshot,
+            min_interval, rate_mode, is_delta
         )
 
         if not isinstance(target_topic, str):
@@ -345,6 +870,13 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             )
             raise StreamingFlowError(error_info=error)
 
+        if not is_valid_pattern(target_topic):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "'#' is allowed only as the last level of target_topic"
+            )
+            raise StreamingFlowError(error_info=error)
+
         if not isinstance(retain_messages, bool):
             error = ERROR_TEMPLATES[5030].to_dict()
             error['devel_message'] %= (
@@ -352,22 +884,215 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             )
             raise StreamingFlowError(error_info=error)
 
-        async with self._subs_lock:
-            self._subs_storage.add_subscription(
-                session_id=session_id,
-                topic=target_topic, is_retained=retain_messages
+        if not isinstance(conflate_messages, bool):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "conflate_messages is not a boolean"
             )
+            raise StreamingFlowError(error_info=error)
 
-        message = build_message(
+        if not isinstance(with_snapshot, bool):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "with_snapshot is not a boolean"
+            )
+            raise StreamingFlowError(error_info=error)
+
+        if not isinstance(is_delta, bool):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "delta is not a boolean"
+            )
+            raise StreamingFlowError(error_info=error)
+
+        try:
+            rate_mode = RateLimitMode(rate_mode)
+        except ValueError:
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "rate_mode must be one of: %s" % ", ".join(
+                    mode.value for mode in RateLimitMode
+                )
+            )
+            raise StreamingFlowError(error_info=error)
+
+        ack_message = build_message(
             type_="control",
             topic="subscribe_ack",
             body={"target_topic": target_topic}
         )
 
-        await self._delivery_manager.put_message(
-            session_id=session_id, message=message
+        async with self._subs_lock:
+            # the snapshot is taken, the subscription is added and both
+            # messages are queued without yielding to the event loop, so
+            # no update can be lost or be delivered before the snapshot
+            if with_snapshot:
+                snapshot_message = self._build_snapshot_message(
+                    session_id, target_topic, is_delta=is_delta,
+                    body_filter=body_filter
+                )
+            else:
+                snapshot_message = None
+
+            self._subs_storage.add_subscription(
+                session_id=session_id,
+                topic=target_topic, is_retained=retain_messages,
+                is_conflated=conflate_messages, min_interval=min_interval,
+                rate_mode=rate_mode, is_delta=is_delta,
+                body_filter=body_filter
+            )
+
+            self._delivery_manager.put_message_nowait(
+                session_id=session_id, message=ack_message
+            )
+
+            if snapshot_message is not None:
+                self._delivery_manager.put_message_nowait(
+                    session_id=session_id, message=snapshot_message
+                )
+
+    @staticmethod
+    def _parse_min_interval(body: Mapping) -> float:
+        """
+        Extracts the minimal interval between messages from the body of
+        subscribe message. The interval may be specified directly
+        (min_interval, in seconds) or as the maximal rate (max_rate, in
+        messages per second)
+
+        :param body: the body of subscribe message
+        :return: the minimal interval between messages with the same topic;
+                 zero if the rate is not limited
+        :raises StreamingFlowError: if client violated the format of
+                message body
+        """
+        min_interval = body.get('min_interval')
+        max_rate = body.get('max_rate')
+
+        for name, value in (('min_interval', min_interval),
+                            ('max_rate', max_rate)):
+            if value is not None and (
+                    isinstance(value, bool) or
+                    not isinstance(value, (int, float)) or value < 0
+            ):
+                error = ERROR_TEMPLATES[5030].to_dict()
+                error['devel_message'] %= (
+                    "%s is not a non-negative number" % name
+                )
+                raise StreamingFlowError(error_info=error)
+
+        if min_interval is not None and max_rate is not None:
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "only one of min_interval and max_rate can be specified"
+            )
+            raise StreamingFlowError(error_info=error)
+
+        if max_rate:
+            return 1 / max_rate
+
+        return min_interval or 0
+
+    @staticmethod
+    def _parse_body_filter(body: Mapping) -> Optional[BodyPredicate]:
+        """
+        Extracts and compiles a filter expression from the body of subscribe
+        message
+
+        :param body: the body of subscribe message
+        :return: a compiled filter or None if the filter wasn't specified
+        :raises StreamingFlowError: if client violated the format of
+                message body
+        """
+        expression = body.get('filter')
+
+        if expression is None:
+            return None
+
+        try:
+            return compile_filter(expression)
+        except FilterSyntaxError as e:
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= ("invalid filter: %s" % e)
+            raise StreamingFlowError(error_info=error)
+
+    def _build_snapshot_message(
+            self, session_id: TDomainId, target_topic: str, is_delta: bool,
+            body_filter: BodyPredicate = None
+    ) -> Message:
+        """
+        Builds a snapshot message with the current state of all objects that
+        correspond to the specified topic. If the snapshot is sent to a
+        subscription with delta encoding, then the following updates of
+        these objects will be sent as deltas against the snapshot
+
+        :param session_id: an identifier of the current Session
+        :param target_topic: a topic (or a topic pattern) of subscription
+        :param is_delta: if delta encoding was requested by the subscription
+        :param body_filter: a filter of objects requested by the subscription
+        :return: a message to be sent
+        """
+        objects = self._take_snapshot(target_topic)
+
+        if body_filter is not None:
+            objects = [
+                item for item in objects if body_filter(item["body"], None)
+            ]
+
+        if is_delta:
+            self._delta_encoder.forget(session_id, target_topic)
+
+            for item in objects:
+                object_topic = item["topic"].rsplit('/', 1)[0]
+                self._delta_encoder.set_known(
+                    session_id, object_topic, item["version"]
+                )
+
+        return build_message(
+            type_="control",
+            topic="snapshot",
+            body={"target_topic": target_topic, "objects": objects}
         )
 
+    def _take_snapshot(self, target_topic: str) -> List[Dict[str, Any]]:
+        """
+        Fetches the current state of all objects that correspond to the
+        specified topic. Must to be called in the Authentication Context of
+        the client. Objects which the client is not allowed to view are
+        skipped
+
+        :param target_topic: a topic (or a topic pattern) of subscription
+        :return: a list of objects, each of them with a topic of the object,
+                 its DTO in the body and its current version
+        """
+        objects = list()  # type: List[Dict[str, Any]]
+        first_level = topic_to_list(target_topic)[0]
+
+        for root_topic, service in self._snapshot_sources:
+            if first_level not in (root_topic, '+', '#'):
+                continue
+
+            try:
+                dtos = service.view_all()
+            except AuthInsufficientPrivilegesError:
+                LOGGER.debug(
+                    "Snapshot of %s is not permitted, skipped", root_topic
+                )
+                continue
+
+            for dto in dtos:
+                object_topic = iterable_to_topic((root_topic, dto['id']))
+                topic = iterable_to_topic((object_topic, SNAPSHOT_EVENT_TYPE))
+
+                if topic_matches(target_topic, topic):
+                    objects.append({
+                        "topic": topic, "body": dto,
+                        "version": self._delta_encoder.get_version(
+                            object_topic
+                        )
+                    })
+
+        return objects
+
     async def _handle_unsubscription_message(
             self, message: Message, session_id: TDomainId
     ) -> None:
@@ -404,16 +1129,157 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             body={"target_topic": target_topic}
         )
 
-        await self._delivery_manager.put_message(
+        self._delivery_manager.put_message_nowait(
             session_id=session_id, message=message
         )
 
+    async def _handle_delta_resync(
+            self, message: Message, session_id: TDomainId
+    ) -> None:
+        """
+        Handles a request of the full state of objects sent by a client
+        which detected a mismatch of versions of delta-encoded updates.
+        Responds with a snapshot of the requested objects
+
+        :param message: a message to be handled
+        :param session_id: an identifier of the current Session
+        :return: None
+        :raises StreamingFlowError: if client violated the format of
+                message body
+        """
+        target_topic = message.body.get('target_topic')
+
+        LOGGER.debug(
+            "Delta resync request from %s: %s", session_id, target_topic
+        )
+
+        if not isinstance(target_topic, str):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "target_topic is not a string"
+            )
+            raise StreamingFlowError(error_info=error)
+
+        async with self._subs_lock:
+            self._delivery_manager.put_message_nowait(
+                session_id=session_id,
+                message=self._build_snapshot_message(
+                    session_id, target_topic, is_delta=True
+                )
+            )
+
+    async def _handle_execute_message(
+            self, message: Message, session_id: TDomainId
+    ) -> None:
+        """
+        Handles a request on execution of a command by a Thing. The command
+        is sent on behalf of the client and the result is reported with an
+        execute_ack or execute_error message with the correlation_id
+        specified by the client. Clients don't need to wait for the result
+        of one command to send the next one
+
+        :param message: a message to be handled
+        :param session_id: an identifier of the current Session
+        :return: None
+        :raises StreamingFlowError: if client violated the format of
+                message body
+        """
+        correlation_id = message.body.get('correlation_id')
+        thing_id = message.body.get('thing_id')
+        command = message.body.get('command')
+        command_args = message.body.get('command_args')
+
+        if isinstance(correlation_id, bool) or \
+                not isinstance(correlation_id, (str, int)):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "correlation_id is missing or is not a string or an integer"
+            )
+            raise StreamingFlowError(error_info=error)
+
+        if not isinstance(thing_id, str):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "thing_id is missing or is not a string"
+            )
+            raise StreamingFlowError(error_info=error)
+
+        error_code = self._execute_command(thing_id, command, command_args)
+
+        if error_code is None:
+            reply = build_message(
+                type_="control",
+                topic="execute_ack",
+                body={"correlation_id": correlation_id}
+            )
+        else:
+            error = ERROR_TEMPLATES[error_code].to_dict()
+
+            if error_code == 2110:
+                error["user_message"] = error["user_message"].format(
+                    action="sending commands to Actuators"
+                )
+
+            reply = build_message(
+                type_="control",
+                topic="execute_error",
+                body={"correlation_id": correlation_id, "error": error}
+            )
+
+        self._delivery_manager.put_message_nowait(
+            session_id=session_id, message=reply
+        )
+
+    def _execute_command(
+            self, thing_id: TDomainId, command: Any, command_args: Any
+    ) -> Optional[int]:
+        """
+        Sends the command to a Thing. Must to be called in the Authentication
+        Context of the client
+
+        :param thing_id: an identifier of the Thing
+        :param command: a name of the command
+        :param command_args: arguments of the command
+        :return: None on success, a code of the error otherwise
+        """
+        if not isinstance(command, str):
+            return 3101
+
+        if not isinstance(command_args, Mapping):
+            return 3102
+
+        if self._thing_service is None:
+            return 1005
+
+        try:
+            self._thing_service.send_command(
+                to_actuator_id=thing_id,
+                command=command,
+                command_args=command_args
+            )
+        except ServiceEntityResolutionError:
+            return 1005
+        except AuthInsufficientPrivilegesError:
+            return 2110
+        except ServiceTypeError:
+            return 3100
+        except ServiceInvalidArgumentsError:
+            return 3103
+        except ServiceUnsupportedCommandError:
+            return 3110
+
+        return None
+
     async def _handle_delivery_ack(
             self, message: Message, session_id: TDomainId
     ) -> None:
         """
         Analyzes the received delivery_ack message and removes the
-        corresponding message from the list of undelivered
+        corresponding messages from the list of undelivered. A single
+        acknowledgement may contain an identifier of a message (message_id),
+        an identifier of the last message in a contiguous sequence of
+        delivered messages (up_to) and a list of ranges of delivered
+        messages (ranges) in any combination
 
         :param message: a received message
         :param session_id: an identifier of the current Session
@@ -421,17 +1287,41 @@ class StreamingApiProvider(HttpApiProvider, Observer):
         :raises StreamingFlowError: if client violated the format of
                 message body
         """
-        message_id = message.body['message_id']
+        message_id = message.body.get('message_id')
+        up_to = message.body.get('up_to')
+        ranges = message.body.get('ranges', [])
 
-        if not isinstance(message_id, int):
+        if message_id is None and up_to is None and not ranges:
             error = ERROR_TEMPLATES[5030].to_dict()
             error['devel_message'] %= (
-                "message_id is missing or is not an integer"
+                "at least one of message_id, up_to or ranges must be specified"
+            )
+            raise StreamingFlowError(error_info=error)
+
+        if message_id is not None and not isinstance(message_id, int):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= ("message_id is not an integer")
+            raise StreamingFlowError(error_info=error)
+
+        if up_to is not None and not isinstance(up_to, int):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= ("up_to is not an integer")
+            raise StreamingFlowError(error_info=error)
+
+        if not isinstance(ranges, list) or not all(
+                isinstance(item, list) and len(item) == 2 and
+                all(isinstance(bound, int) for bound in item)
+                for item in ranges
+        ):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= (
+                "ranges must be a list of [first, last] integer pairs"
             )
             raise StreamingFlowError(error_info=error)
 
         await self._delivery_manager.ack_delivery(
-            session_id=session_id, message_id=message_id
+            session_id=session_id, message_id=message_id,
+            up_to=up_to, ranges=ranges
         )
 
     async def _handle_control_message(
@@ -453,6 +1343,10 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             await self._handle_unsubscription_message(message, session_id)
         elif message.topic == "delivery_ack":
             await self._handle_delivery_ack(message, session_id)
+        elif message.topic == "delta_resync":
+            await self._handle_delta_resync(message, session_id)
+        elif message.topic == "execute":
+            await self._handle_execute_message(message, session_id)
         else:
             LOGGER.warning(
                 "Unhandled control message from %s, ignored:\n"
@@ -484,7 +1378,8 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             )
 
     async def _handle_outcoming_message(
-            self, ws: WebSocketResponse, message: Message
+            self, ws: WebSocketResponse, message: Message,
+            session_id: TDomainId = None
     ) -> None:
         """
         Analyses the new message to be sent to a client and sends it if it's
@@ -494,10 +1389,68 @@ class StreamingApiProvider(HttpApiProvider, Observer):
         :param ws: an instance of WebSocketResponse which represents WebSocket
                connection
         :param message: a message to be sent to the client
+        :param session_id: an identifier of the Session the message is sent
+               to; is used for collection of metrics
         :return: None
         """
         # FIXME: Check access rights here
-        ws.send_json(data=message, dumps=message_dumps)
+        size = send_message(ws, message)
+
+        if self._metrics is not None:
+            self._record_sent(session_id, (message, ), size)
+
+    async def _handle_outcoming_batch(
+            self, ws: WebSocketResponse, messages: List[Message],
+            session_id: TDomainId = None
+    ) -> None:
+        """
+        Sends a batch of messages to a client in a single frame. A batch of
+        a single message is sent as is, without an envelope
+
+        :param ws: an instance of WebSocketResponse which represents WebSocket
+               connection
+        :param messages: messages to be sent to the client, in order
+        :param session_id: an identifier of the Session the messages are
+               sent to; is used for collection of metrics
+        :return: None
+        """
+        if len(messages) == 1:
+            await self._handle_outcoming_message(
+                ws=ws, message=messages[0], session_id=session_id
+            )
+            return
+
+        # FIXME: Check access rights here
+        size = send_batch(ws, messages)
+
+        if self._metrics is not None:
+            self._record_sent(session_id, messages, size)
+
+    def _record_sent(
+            self, session_id: TDomainId, messages: Sequence[Message],
+            size: int
+    ) -> None:
+        """
+        Updates delivery metrics after sending of a frame
+
+        :param session_id: an identifier of the Session
+        :param messages: messages which were sent in the frame
+        :param size: the size of the frame
+        :return: None
+        """
+        metrics = self._metrics
+        now = self._loop.time()
+
+        for message in messages:
+            enqueued_at = message.enqueued_at
+
+            # messages replayed on resumption were not queued by
+            # DeliveryManager and have no mark
+            if enqueued_at is not None:
+                metrics.observe_send_latency(session_id, now - enqueued_at)
+                message.enqueued_at = None
+
+        metrics.on_sent(session_id, len(messages), size)
 
     async def _on_incoming_waiter_finished(
             self, task: asyncio.Task, session_id: TDomainId
@@ -523,7 +1476,8 @@ class StreamingApiProvider(HttpApiProvider, Observer):
         )
 
     async def _on_outcoming_waiter_finished(
-            self, ws: WebSocketResponse, task: asyncio.Task
+            self, ws: WebSocketResponse, task: asyncio.Task,
+            is_batching: bool = False, session_id: TDomainId = None
     ) -> None:
         """
         A method to be executed if outcoming_waiter_task finished its execution
@@ -531,6 +1485,9 @@ class StreamingApiProvider(HttpApiProvider, Observer):
         :param ws: an instance of WebSocketResponse which represents WebSocket
                connection
         :param task: an instance of outcoming_waiter_task
+        :param is_batching: if the task returned a batch of messages instead
+               of a single message
+        :param session_id: an identifier of the current Streaming Session
         :return: None
         """
         exception = task.exception()
@@ -540,12 +1497,18 @@ class StreamingApiProvider(HttpApiProvider, Observer):
 
         result = task.result()
 
-        await self._handle_outcoming_message(
-            ws=ws, message=result
-        )
+        if is_batching:
+            await self._handle_outcoming_batch(
+                ws=ws, messages=result, session_id=session_id
+            )
+        else:
+            await self._handle_outcoming_message(
+                ws=ws, message=result, session_id=session_id
+            )
 
     async def _message_loop(
-            self, ws: WebSocketResponse, session_id: TDomainId
+            self, ws: WebSocketResponse, session_id: TDomainId,
+            is_batching: bool = False
     ) -> None:
         """
         Is responsible for handling of all incoming messages from client and
@@ -555,17 +1518,28 @@ class StreamingApiProvider(HttpApiProvider, Observer):
         :param ws: an instance of WebSocketResponse which represents WebSocket
                connection
         :param session_id: an identifier of the current session
+        :param is_batching: if all the pending messages (up to the
+               max_batch_size) must to be sent in a single frame
         :return: None
         """
         start_task = functools.partial(
             asyncio.ensure_future, loop=self._loop
         )
-        get_message = functools.partial(
-            self._delivery_manager.get_message,
-            session_id=session_id
-        )
 
-        incoming_waiter_task = start_task(own_receive_json(ws))
+        if is_batching:
+            get_message = functools.partial(
+                self._delivery_manager.get_messages,
+                session_id=session_id,
+                max_count=self._max_batch_size,
+                flush_window=self._batch_flush_window
+            )
+        else:
+            get_message = functools.partial(
+                self._delivery_manager.get_message,
+                session_id=session_id
+            )
+
+        incoming_waiter_task = start_task(own_receive_message(ws))
         outcoming_waiter_task = start_task(get_message())
 
         try:
@@ -581,11 +1555,12 @@ class StreamingApiProvider(HttpApiProvider, Observer):
                         task=incoming_waiter_task, session_id=session_id
                     )
 
-                    incoming_waiter_task = start_task(own_receive_json(ws))
+                    incoming_waiter_task = start_task(own_receive_message(ws))
 
                 if outcoming_waiter_task in done:
                     await self._on_outcoming_waiter_finished(
-                        ws=ws, task=outcoming_waiter_task
+                        ws=ws, task=outcoming_waiter_task,
+                        is_batching=is_batching, session_id=session_id
                     )
 
                     outcoming_waiter_task = start_task(get_message())
@@ -594,18 +1569,20 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             incoming_waiter_task.cancel()
             outcoming_waiter_task.cancel()
 
-    async def _handle_auth_flow(self, ws: WebSocketResponse) -> str:
+    async def _handle_auth_flow(self, ws: WebSocketResponse) -> AuthRequest:
         """
         This method handles client authentication flow:
 
         - waits for an "auth" message from client;
         - checks message validity;
-        - extracts auth token;
-        - returns authentication toke to the caller
+        - extracts auth token and an optional offset to resume from;
+        - negotiates a codec and batching for the following messages;
+        - returns authentication toke and connection parameters to the caller
 
         :param ws: an instance of WebSocketResponse which represents WebSocket
                connection
-        :return: an extracted authentication token
+        :return: an extracted authentication token and parameters of the
+                 connection requested by a client
         :raises StreamingFlowError: if the content of a message was different
                 from expected
         """
@@ -632,4 +1609,56 @@ class StreamingApiProvider(HttpApiProvider, Observer):
             )
             raise StreamingFlowError(error_info=error)
 
-        return token
+        resume_from = parsed_message.body.get('resume_from')
+
+        if resume_from is not None and not isinstance(resume_from, int):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= ("resume_from is not an integer")
+            raise StreamingFlowError(error_info=error)
+
+        codec = self._negotiate_codec(
+            parsed_message.body.get('codec'),
+            parsed_message.body.get('compression')
+        )
+
+        is_batching = parsed_message.body.get('batching', False)
+
+        if not isinstance(is_batching, bool):
+            error = ERROR_TEMPLATES[5030].to_dict()
+            error['devel_message'] %= ("batching is not a boolean")
+            raise StreamingFlowError(error_info=error)
+
+        return AuthRequest(
+            access_token=token, resume_from=resume_from, codec=codec,
+            is_batching=is_batching
+        )
+
+    @staticmethod
+    def _negotiate_codec(
+            codec_name: Optional[str], compression: Optional[str]
+    ) -> MessageCodec:
+        """
+        Returns the codec requested by a client. Falls back to uncompressed
+        JSON if the requested codec or compression is not available, so
+        clients must to check the codec reported in auth_ack message
+
+        :param codec_name: a name of the requested codec or None
+        :param compression: a name of the requested compression or None
+        :return: a codec to be used
+        :raises StreamingFlowError: if client violated the format of
+                message body
+        """
+        for name, value in (('codec', codec_name),
+                            ('compression', compression)):
+            if value is not None and not isinstance(value, str):
+                error = ERROR_TEMPLATES[5030].to_dict()
+                error['devel_message'] %= ("%s is not a string" % name)
+                raise StreamingFlowError(error_info=error)
+
+        try:
+            return get_codec(codec_name, compression)
+        except UnsupportedCodecError as e:
+            LOGGER.info(
+                "Unsupported codec requested: %s, JSON will be used", e
+            )
+            return JSON_CODEC
@@ -2,24 +2,150 @@
 This module contains a definition of SubscriptionStorage
 """
 
-from typing import Dict, Set, List, Tuple, Optional, KeysView
+from collections import OrderedDict
+from typing import Dict, Set, Optional, KeysView
 
 from dpl.model.domain_id import TDomainId
-from dpl.events.topic import topic_to_list
+from dpl.events.topic_tree import TopicTree
+from .rate_limiter import RateLimitMode
+from .body_filter import BodyPredicate, any_of
+
+
+class SubscriptionParams(object):
+    """
+    A structure that contains parameters of a subscription: if the messages
+    must to be retained until their delivery is acknowledged, if only the
+    latest unacknowledged message must to be retained for each topic, how
+    often messages with the same topic can be sent, if updates of objects
+    must to be sent as deltas and which of messages must to be sent at all
+    """
+    __slots__ = (
+        'is_retained', 'is_conflated', 'min_interval', 'rate_mode', 'is_delta',
+        'body_filter'
+    )
+
+    def __init__(
+            self, is_retained: bool = False, is_conflated: bool = False,
+            min_interval: float = 0,
+            rate_mode: RateLimitMode = RateLimitMode.throttle,
+            is_delta: bool = False,
+            body_filter: Optional[BodyPredicate] = None
+    ):
+        """
+        Constructor. Sets the specified field values
+
+        :param is_retained: are messages must to be retained for this topic
+        :param is_conflated: if a new retained message must to replace an
+               older unacknowledged message with the same topic
+        :param min_interval: the minimal interval (in seconds) between two
+               messages with the same topic; not limited if zero
+        :param rate_mode: the mode of rate limiting
+        :param is_delta: if updates of objects must to be sent as deltas;
+               is ignored for conflated subscriptions, because conflation
+               breaks the chain of versions
+        :param body_filter: a compiled filter of message bodies; all
+               messages are sent if None
+        """
+        self.is_retained = is_retained
+        self.is_conflated = is_retained and is_conflated
+        self.min_interval = min_interval
+        self.rate_mode = rate_mode
+        self.is_delta = is_delta and not self.is_conflated
+        self.body_filter = body_filter
+
+    def merge(self, other: 'SubscriptionParams') -> 'SubscriptionParams':
+        """
+        Combines parameters of two subscriptions that match the same topic.
+        Messages are retained if any of subscriptions requested retention and
+        are conflated only if all of retained subscriptions allow this. The
+        rate of messages is limited by the least restrictive subscription.
+        Deltas are sent only if all subscriptions requested them. A message
+        is sent if it passes a filter of any of subscriptions
+
+        :param other: parameters of another subscription
+        :return: combined parameters
+        """
+        if not other.is_retained:
+            is_conflated = self.is_conflated
+        elif not self.is_retained:
+            is_conflated = other.is_conflated
+        else:
+            is_conflated = self.is_conflated and other.is_conflated
+
+        if self.min_interval < other.min_interval:
+            rate_source = self
+        elif other.min_interval < self.min_interval:
+            rate_source = other
+        elif other.rate_mode is RateLimitMode.throttle:
+            # debounce may delay messages infinitely, throttle wins
+            rate_source = other
+        else:
+            rate_source = self
+
+        return SubscriptionParams(
+            is_retained=self.is_retained or other.is_retained,
+            is_conflated=is_conflated,
+            min_interval=rate_source.min_interval,
+            rate_mode=rate_source.rate_mode,
+            is_delta=self.is_delta and other.is_delta,
+            body_filter=(
+                None if self.body_filter is None or other.body_filter is None
+                else any_of(self.body_filter, other.body_filter)
+            )
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SubscriptionParams):
+            return NotImplemented
+
+        return (
+            self.is_retained == other.is_retained and
+            self.is_conflated == other.is_conflated and
+            self.min_interval == other.min_interval and
+            self.rate_mode is other.rate_mode and
+            self.is_delta == other.is_delta and
+            self.body_filter is other.body_filter
+        )
+
+    def __repr__(self) -> str:
+        return (
+            "SubscriptionParams(is_retained=%r, is_conflated=%r, "
+            "min_interval=%r, rate_mode=%s, is_delta=%r, body_filter=%r)" % (
+                self.is_retained, self.is_conflated, self.min_interval,
+                self.rate_mode, self.is_delta, self.body_filter
+            )
+        )
+
+
+# a mapping of Session identifiers to parameters of their subscription
+SubscribersMapping = Dict[TDomainId, SubscriptionParams]
 
 
 class SubscriptionStorage(object):
     """
     This object is responsible for storage of subscriptions and their
     management. Allows to add, remove and check subscriptions for the
-    specified sessions
+    specified sessions.
+
+    Subscriptions of all Sessions are stored in a single TopicTree, so the
+    time of lookup depends on the depth of the topic and not on the number
+    of Sessions. Resolved subscribers of the most recently used topics are
+    cached; the cache is invalidated on any change of subscriptions
     """
-    def __init__(self):
+    DEFAULT_CACHE_SIZE = 1024
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
         """
         Constructor. Initializes internal storage
+
+        :param cache_size: the maximum number of topics for which resolved
+               subscribers are cached; caching is disabled if zero
         """
-        self._subs_tree = {}  # type: Dict[TDomainId, Dict]
         self._plain_subs = {}  # type: Dict[TDomainId, Set[str]]
+        self._subs_index = TopicTree()  # type: TopicTree[TDomainId, SubscriptionParams]
+
+        self._cache_size = cache_size
+        self._cache = OrderedDict()  # type: OrderedDict[str, SubscribersMapping]
 
     def list_sessions(self) -> KeysView[TDomainId]:
         """
@@ -29,46 +155,49 @@ class SubscriptionStorage(object):
         """
         return self._plain_subs.keys()
 
+    def count_for(self, session_id: TDomainId) -> int:
+        """
+        Returns the number of topics the specified Session is subscribed to
+
+        :param session_id: an identifier of Session
+        :return: the number of subscriptions
+        """
+        return len(self._plain_subs.get(session_id, ()))
+
     def add_subscription(
-            self, session_id: TDomainId, topic: str, is_retained: bool = False
+            self, session_id: TDomainId, topic: str, is_retained: bool = False,
+            is_conflated: bool = False, min_interval: float = 0,
+            rate_mode: RateLimitMode = RateLimitMode.throttle,
+            is_delta: bool = False, body_filter: BodyPredicate = None
     ) -> None:
         """
-        Adds a new subscription for the specified Session
+        Adds a new subscription for the specified Session. Replaces parameters
+        of subscription if the Session is already subscribed to this topic
 
         :param session_id: a unique identifier of Session
         :param topic: a topic this Session is subscribed to
         :param is_retained: are messages must to be retained for this topic
+        :param is_conflated: if only the latest unacknowledged message must
+               to be retained for each topic
+        :param min_interval: the minimal interval (in seconds) between two
+               messages with the same topic; not limited if zero
+        :param rate_mode: the mode of rate limiting
+        :param is_delta: if updates of objects must to be sent as deltas
+        :param body_filter: a compiled filter of message bodies; all
+               messages are sent if None
         :return: None
         """
-        subs_for_session = self._plain_subs.setdefault(session_id, set())
-
-        if topic in subs_for_session:
-            return
+        params = SubscriptionParams(
+            is_retained=is_retained, is_conflated=is_conflated,
+            min_interval=min_interval, rate_mode=rate_mode, is_delta=is_delta,
+            body_filter=body_filter
+        )
 
+        subs_for_session = self._plain_subs.setdefault(session_id, set())
         subs_for_session.add(topic)
-        topic_parts = topic_to_list(topic)
-
-        p_current = self._subs_tree.setdefault(session_id, dict())
 
-        for part in topic_parts:
-            p_current = p_current.setdefault(part, {})
-
-        p_current[None] = is_retained
-
-    @staticmethod
-    def _remove_empty_nodes(chain: List[Tuple[Dict, str]]) -> None:
-        """
-        Removes all nodes without children from the chain of nodes, starting
-        from the last node in the chain
-
-        :param chain: a list of nodes to be cleaned
-        :return: None
-        """
-        for container, value in reversed(chain):
-            sub_container = container[value]
-
-            if not sub_container:  # if sub-container is empty...
-                container.pop(value)  # ...remove container
+        self._subs_index.add(topic, session_id, params)
+        self._cache.clear()
 
     def remove_subscription(self, session_id: TDomainId, topic: str) -> None:
         """
@@ -83,21 +212,8 @@ class SubscriptionStorage(object):
         if topic not in subs_for_session:
             return
 
-        topic_parts = topic_to_list(topic)
-
-        # this list contains a chain of subscription tree nodes,
-        # will be used for backward traversal and node removal
-        chain = list()  # type: List[Tuple[Dict, str]]
-
-        p_current = self._subs_tree.setdefault(session_id, dict())
-
-        for part in topic_parts:
-            chain.append((p_current, part))
-            p_current = p_current[part]
-
-        del p_current[None]
-
-        self._remove_empty_nodes(chain=chain)
+        self._subs_index.remove(topic, session_id)
+        self._cache.clear()
 
         subs_for_session.remove(topic)
 
@@ -109,12 +225,55 @@ class SubscriptionStorage(object):
                be removed
         :return: None
         """
-        self._plain_subs.pop(session_id)
-        self._subs_tree.pop(session_id)
+        subs_for_session = self._plain_subs.pop(session_id, set())
+
+        for topic in subs_for_session:
+            self._subs_index.remove(topic, session_id)
+
+        if subs_for_session:
+            self._cache.clear()
+
+    def resolve_subscribers(self, topic: str) -> SubscribersMapping:
+        """
+        Finds all Sessions that have a subscription corresponding to the
+        specified Message topic.
+
+        If several subscriptions of the same Session are matching the topic,
+        then their parameters are combined with SubscriptionParams.merge.
+
+        :param topic: a topic of the message
+        :return: a mapping of identifiers of subscribed Sessions to the
+                 parameters of their subscription; the mapping may be
+                 shared with other callers and must not be modified
+        """
+        cache = self._cache
+        result = cache.get(topic)
+
+        if result is not None:
+            cache.move_to_end(topic)
+            return result
+
+        result = dict()
+
+        for session_id, params in self._subs_index.match(topic):
+            existing = result.get(session_id)
+
+            if existing is None:
+                result[session_id] = params
+            else:
+                result[session_id] = existing.merge(params)
+
+        if self._cache_size > 0:
+            cache[topic] = result
+
+            if len(cache) > self._cache_size:
+                cache.popitem(last=False)
+
+        return result
 
     def resolve_subscription_params(
             self, session_id: TDomainId, topic: str
-    ) -> Optional[bool]:
+    ) -> Optional[SubscriptionParams]:
         """
         Attempts to find parameters of subscription corresponding to the
         specified Message topic
@@ -122,27 +281,10 @@ class SubscriptionStorage(object):
         :param session_id: an identifier of the session for which subscription
                will be checked
         :param topic: a topic of the message
-        :return: None if the corresponding subscription wasn't found; True if
-                 message retention was activated for this topic,
-                 False otherwise
-        """
-        topic_parts = topic_to_list(topic)
-        session_subs = self._subs_tree.get(session_id)
-
-        p_current = session_subs
-
-        for part in topic_parts:
-            if part in p_current:
-                p_current = p_current[part]
-            elif '+' in p_current:
-                p_current = p_current['+']
-            elif '#' in p_current:
-                p_current = p_current['#']
-                break
-            else:
-                return None
-
-        return p_current[None]
+        :return: None if the corresponding subscription wasn't found;
+                 combined parameters of all matching subscriptions otherwise
+        """
+        return self.resolve_subscribers(topic).get(session_id)
 
     def is_subscribed(self, session_id: TDomainId, topic: str) -> bool:
         """
@@ -37,6 +37,7 @@ from dpl.auth.auth_aspect import AuthAspect
 from dpl.utils.simple_interceptor import SimpleInterceptor
 
 from dpl.events.event_hub import EventHub
+from dpl.events.event_journal import EventJournal
 from dpl.events.build_object_related_event import build_object_related_event
 
 from dpl.api.rest_api.things_subapp import build_things_subapp
@@ -45,6 +46,9 @@ from dpl.api.http_api_provider import HttpApiProvider
 from dpl.api.rest_api.rest_api_provider import RestApiProvider
 
 from dpl.api.streaming_api.streaming_api_provider import StreamingApiProvider
+from dpl.api.streaming_api.segment_log_retained_store import (
+    SegmentLogRetainedStore
+)
 
 
 module_logger = logging.getLogger(__name__)
@@ -163,16 +167,31 @@ class Controller(object):
 
         api_context_data = {'auth_context': self._auth_context}
 
-        self._event_hub = EventHub()
+        self._event_hub = EventHub(
+            async_dispatch=self._core_config.get(
+                'async_event_dispatch', False
+            ),
+            workers=self._core_config.get('event_dispatch_workers', 1),
+            coalesce_window=self._core_config.get('event_coalescing_window')
+        )
         self._setup_event_hub(self._event_hub)
 
         self._user_service_raw.subscribe(self._event_hub)
         self._placement_service_raw.subscribe(self._event_hub)
         self._thing_service_raw.subscribe(self._event_hub)
 
+        # None will indicate that the history of Things is not saved
+        self._event_journal = None
+
+        event_journal_path = self._core_config.get('event_journal_path')
+
+        if event_journal_path is not None:
+            self._init_event_journal(event_journal_path)
+
         self._rest_api_things = build_things_subapp(
             thing_service=self._thing_service,
-            additional_data=api_context_data
+            additional_data=api_context_data,
+            event_journal=self._event_journal
         )
 
         self._rest_api_placements = build_placements_subapp(
@@ -207,6 +226,24 @@ class Controller(object):
         if 'local_announce' in self._apis_config['enabled_apis']:
             self._initialize_local_announcement()
 
+    def _init_event_journal(self, path: str) -> None:
+        """
+        Initializes an EventJournal which saves the history of Things
+
+        :param path: a path to the directory of the journal; is resolved
+               against the configuration directory if relative
+        :return: None
+        """
+        self._event_journal = EventJournal(
+            path=os.path.join(self._config_dir, path),
+            retention_period=self._core_config.get('event_journal_retention')
+        )
+
+        # the history must to contain all the intermediate states
+        self._event_hub.subscribe(
+            self._event_journal, every_transition=True, topics=('things/#',)
+        )
+
     def _init_streaming_api(self) -> None:
         """
         Initializes and sets up an Streaming API instance
@@ -226,10 +263,31 @@ class Controller(object):
         else:
             api_root = '/'
 
+        streaming_options = {
+            key: streaming_api_config[key]
+            for key in (
+                'max_pending_messages', 'overflow_policy',
+                'retransmission_window', 'replay_buffer_size',
+                'batch_flush_window', 'max_batch_size', 'collect_metrics',
+                'session_ttl', 'max_retained_messages'
+            )
+            if streaming_api_config.get(key) is not None
+        }
+
+        retained_store_path = streaming_api_config.get('retained_store_path')
+
+        if retained_store_path is not None:
+            streaming_options['retained_store'] = SegmentLogRetainedStore(
+                path=os.path.join(self._config_dir, retained_store_path)
+            )
+
         self._streaming_api_provider = StreamingApiProvider(
             auth_context=self._auth_context,
             auth_service=self._auth_service,
-            api_root=api_root
+            api_root=api_root,
+            thing_service=self._thing_service,
+            placement_service=self._placement_service,
+            **streaming_options
         )
 
         if not self._separate_streaming:
@@ -379,8 +437,16 @@ class Controller(object):
             self._user_service_raw.create_user("admin", "admin")
             self._db_session_manager.get_session().commit()
 
+        if self._event_journal is not None:
+            await self._event_journal.open()
+
+        await self._event_hub.start()
+
         self._thing_service_raw.enable_all()
 
+        if self._streaming_api_provider is not None:
+            await self._streaming_api_provider.start()
+
         is_api_enabled = self._core_config['is_api_enabled']
 
         if is_api_enabled:
@@ -486,4 +552,14 @@ class Controller(object):
             await self._streaming_api_provider.shutdown_server()
 
         await self._http_api.shutdown_server()
+
+        # deliver all already emitted events before the stop of consumers
+        await self._event_hub.stop()
+
+        if self._event_journal is not None:
+            await self._event_journal.close()
+
+        if self._streaming_api_provider is not None:
+            await self._streaming_api_provider.stop()
+
         self._thing_service_raw.disable_all()
@@ -2,7 +2,7 @@
 This module contains functions for construction of ObjectRelatedEvents based on
 on a data sent by ObservableServices
 """
-from typing import Optional
+from typing import Callable, Optional
 
 from dpl.model.domain_id import TDomainId
 from dpl.dtos.base_dto import BaseDto
@@ -14,9 +14,10 @@ from .object_related_event import ObjectRelatedEvent
 def build_object_related_event(
         source: ObservableService,
         object_id: TDomainId, event_type: ServiceEventType,
-        object_dto: Optional[BaseDto],
+        object_dto: Optional[BaseDto] = None,
         *,
-        target_root_topic: str
+        target_root_topic: str,
+        dto_builder: Optional[Callable[[], Optional[BaseDto]]] = None
 ) -> ObjectRelatedEvent:
     """
     Builds an instance of ObjectRelatedEvent based on data received from
@@ -27,6 +28,8 @@ def build_object_related_event(
     :param event_type: enum value, specifies what happened to the object
     :param object_dto: a DTO of the altered object or None if it was deleted
     :param target_root_topic: a root topic to be used for construction
+    :param dto_builder: a callable to build the DTO of the altered object
+           on demand; is used instead of object_dto if specified
     :return: an instance of ObjectRelatedEvent
     """
     assert isinstance(source, ObservableService)
@@ -37,7 +40,8 @@ def build_object_related_event(
 
     event = ObjectRelatedEvent(
         topic=topic,
-        object_dto=object_dto
+        object_dto=object_dto,
+        dto_builder=dto_builder
     )
 
     return event
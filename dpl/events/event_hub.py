@@ -2,13 +2,31 @@
 This module contains a definition of EventHub - a central place for processing
 of all events in the system
 """
+import asyncio
 import functools
+import logging
+import threading
 import warnings
-from typing import Type, MutableSet, Callable
+from collections import OrderedDict
+from typing import (
+    Type, MutableSet, MutableMapping, AbstractSet, Callable, Dict, Iterable,
+    List, Optional, Tuple
+)
 
 from dpl.utils.observer import Observer
 from dpl.utils.observable import Observable
 from dpl.events.event import Event
+from dpl.events.object_related_event import ObjectRelatedEvent
+from dpl.events.topic_tree import TopicTree
+
+
+LOGGER = logging.getLogger(__name__)
+
+# a suffix of topics of events which may be coalesced
+MODIFIED_SUFFIX = '/modified'
+
+CoalescedEvents = MutableMapping[str, Tuple[Observable, Event]]
+ObserverPatterns = Dict[Observer, Tuple[str, ...]]
 
 
 def _convert_to_event(source: Observable, *args, **kwargs) -> Event:
@@ -31,15 +49,130 @@ class EventHub(Observer, Observable):
     EventHub is a central place for all events in the system. It's responsible
     for pre-processing of events, coming from all the services, APIs and other
     sources, and their distribution to other subscribers (like services, APIs,
-    loggers and other interested parties
+    loggers and other interested parties.
+
+    By default, events are dispatched synchronously, right in the call of
+    the ``update`` method. In the asynchronous dispatch mode, events are
+    only converted and enqueued in the ``update`` method, which is safe to be
+    called from any thread, and dispatched to observers later by worker
+    tasks running in the event loop. Observers may define ``update`` as
+    a coroutine in such mode. Events of the same source are always handled
+    by the same worker, so they are dispatched in order of their emission
+    (if the source emits them from a single thread).
+
+    If coalescing is enabled, then all the ``modified`` events with the same
+    topic received during one iteration of the event loop (or during the
+    specified time window) are replaced with the last one, which carries
+    the final state of an object. Observers which need every intermediate
+    state must to subscribe with the ``every_transition`` flag set. Any other
+    event causes an immediate dispatch of all coalesced ones, so the order
+    of events related to the same object is preserved.
+
+    Observers may subscribe to events with specific topics only, using topic
+    patterns with '+' and '#' wildcards. Such Observers are indexed by
+    patterns, so an event is sent only to the matching ones and the cost of
+    dispatch doesn't depend on the number of Observers interested in other
+    topics. Observers subscribed without patterns receive all events. Events
+    which match no Observers are dropped right after their conversion
     """
-    def __init__(self):
+    def __init__(
+            self, *, loop: asyncio.AbstractEventLoop = None,
+            async_dispatch: bool = False, workers: int = 1,
+            coalesce_window: Optional[float] = None
+    ):
         """
         Constructor. Initializes internal variables
+
+        :param loop: an event loop to be used for asynchronous dispatch and
+               for scheduling of coroutine observers
+        :param async_dispatch: if events must to be dispatched by worker
+               tasks instead of dispatching in the call of ``update``
+        :param workers: the number of worker tasks for asynchronous
+               dispatch; events of different sources are dispatched
+               concurrently if more than one
+        :param coalesce_window: the time (in seconds) to collect ``modified``
+               events to be coalesced; zero means one iteration of the event
+               loop; None disables coalescing
         """
+        assert workers > 0
+        # observers which receive all events
         self._observers = set()  # type: MutableSet[Observer]
+        # observers which receive events with matching topics only
+        self._topic_index = TopicTree()  # type: TopicTree[Observer, None]
+        self._observer_patterns = dict()  # type: ObserverPatterns
+        self._transition_observers = set()  # type: MutableSet[Observer]
         self._converter = functools.singledispatch(_convert_to_event)
 
+        self._loop = loop
+        self._async_dispatch = async_dispatch
+        self._queues = list()  # type: List[asyncio.Queue]
+        self._workers = list()  # type: List[asyncio.Task]
+        # an identifier of a thread running the event loop, is known only
+        # after the start of dispatching
+        self._loop_thread_id = None  # type: Optional[int]
+
+        self._coalesce_window = coalesce_window
+        # the last events for each coalesced topic and their sources
+        self._coalesced = OrderedDict()  # type: CoalescedEvents
+        self._coalesced_lock = threading.Lock()
+        # a sequence number of the current batch of coalesced events and
+        # a timer of its dispatch; the batch may be dispatched before the
+        # end of the window, so timers of previous batches are ignored
+        self._batch_number = 0
+        self._flush_timer = None  # type: Optional[asyncio.TimerHandle]
+
+        if self._loop is None and (
+                async_dispatch or coalesce_window is not None
+        ):
+            self._loop = asyncio.get_event_loop()
+
+        if async_dispatch:
+            self._queues = [
+                asyncio.Queue(loop=self._loop) for _ in range(workers)
+            ]
+
+    async def start(self) -> None:
+        """
+        Starts worker tasks if the asynchronous dispatch is enabled. Events
+        received before the start are dispatched after it. Must to be called
+        from the thread running the event loop
+
+        :return: None
+        """
+        if not self._async_dispatch or self._workers:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._workers = [
+            asyncio.ensure_future(
+                self._dispatch_forever(queue), loop=self._loop
+            )
+            for queue in self._queues
+        ]
+
+    async def stop(self) -> None:
+        """
+        Dispatches all coalesced events, waits until all already enqueued
+        events are dispatched and stops worker tasks
+
+        :return: None
+        """
+        self._flush_coalesced()
+
+        if not self._workers:
+            return
+
+        for queue in self._queues:
+            await queue.join()
+
+        for worker in self._workers:
+            worker.cancel()
+
+        await asyncio.gather(
+            *self._workers, loop=self._loop, return_exceptions=True
+        )
+        self._workers = list()
+
     def update(self, source: Observable, *args, **kwargs) -> None:
         """
         A method to be called by event sources if any event was generated.
@@ -54,16 +187,53 @@ class EventHub(Observer, Observable):
         :return: None
         """
         event = self._converter(source, *args, **kwargs)
-        self._notify(event)
+        observers = self._match(event.topic)
+
+        if not observers:
+            return  # nobody needs this event, so its DTO is never built
+
+        if self._coalesce_window is None:
+            self._dispatch(source, event, observers)
+        elif event.topic.endswith(MODIFIED_SUFFIX):
+            if self._transition_observers:
+                self._dispatch(
+                    source, event, observers & self._transition_observers
+                )
 
-    def subscribe(self, observer: Observer) -> None:
+            self._coalesce(source, event)
+        else:
+            self._flush_coalesced()
+            self._dispatch(source, event, observers)
+
+    def subscribe(
+            self, observer: Observer, every_transition: bool = False,
+            topics: Optional[Iterable[str]] = None
+    ) -> None:
         """
-        Adds the specified Observer to the list of subscribers
+        Adds the specified Observer to the list of subscribers. Replaces the
+        previous subscription of this Observer if any
 
         :param observer: an instance of Observer to be added
+        :param every_transition: if the Observer must to receive all the
+               ``modified`` events, even if they are coalesced for other
+               Observers
+        :param topics: patterns of topics of events to be sent to the
+               Observer; all events are sent if None
         :return: None
         """
-        self._observers.add(observer)
+        self.unsubscribe(observer)
+
+        if topics is None:
+            self._observers.add(observer)
+        else:
+            patterns = tuple(topics)
+            self._observer_patterns[observer] = patterns
+
+            for pattern in patterns:
+                self._topic_index.add(pattern, observer, None)
+
+        if every_transition:
+            self._transition_observers.add(observer)
 
     def unsubscribe(self, observer: Observer) -> None:
         """
@@ -73,16 +243,207 @@ class EventHub(Observer, Observable):
         :return: None
         """
         self._observers.discard(observer)
+        self._transition_observers.discard(observer)
+
+        for pattern in self._observer_patterns.pop(observer, ()):
+            self._topic_index.remove(pattern, observer)
 
-    def _notify(self, event: Event) -> None:
+    def _match(self, topic: str) -> AbstractSet[Observer]:
         """
-        Sends the specified event to all subscribers of EventHub
+        Returns all Observers subscribed to events with the specified topic
+
+        :param topic: a topic of an event
+        :return: a set of Observers to receive the event
+        """
+        if not self._topic_index:
+            return self._observers
+
+        observers = set(self._observers)
+        observers.update(
+            observer for observer, _ in self._topic_index.match(topic)
+        )
+
+        return observers
+
+    def _coalesce(self, source: Observable, event: Event) -> None:
+        """
+        Saves the specified event to be dispatched later instead of all the
+        previous events with the same topic. Schedules the dispatch if it
+        wasn't scheduled yet
+
+        :param source: a source of the event
+        :param event: an event to be coalesced
+        :return: None
+        """
+        with self._coalesced_lock:
+            is_scheduled = bool(self._coalesced)
+            # the position of the first coalesced event is preserved
+            self._coalesced[event.topic] = (source, event)
+            batch_number = self._batch_number
+
+        if not is_scheduled:
+            self._loop.call_soon_threadsafe(
+                self._schedule_flush, batch_number
+            )
+
+    def _schedule_flush(self, batch_number: int) -> None:
+        """
+        Schedules the dispatch of coalesced events after the end of the
+        coalescing window
+
+        :param batch_number: a sequence number of the batch to be dispatched
+        :return: None
+        """
+        if not self._coalesce_window:
+            self._flush_coalesced(batch_number)
+            return
+
+        with self._coalesced_lock:
+            if batch_number != self._batch_number:
+                return  # the batch was already dispatched
+
+            self._flush_timer = self._loop.call_later(
+                self._coalesce_window, self._flush_coalesced, batch_number
+            )
+
+    def _flush_coalesced(self, batch_number: Optional[int] = None) -> None:
+        """
+        Dispatches all coalesced events to matching Observers, except of ones
+        which already received them as transitions. Cancels the scheduled
+        dispatch of the batch if any
+
+        :param batch_number: a sequence number of the batch to be dispatched;
+               nothing is dispatched if the batch was already dispatched;
+               the current batch is dispatched if None
+        :return: None
+        """
+        with self._coalesced_lock:
+            if batch_number is not None and batch_number != self._batch_number:
+                return
+
+            coalesced = self._coalesced
+            self._coalesced = OrderedDict()
+            self._batch_number += 1
+            flush_timer = self._flush_timer
+            self._flush_timer = None
+
+        if flush_timer is not None:
+            flush_timer.cancel()
+
+        if not coalesced:
+            return
+
+        for source, event in coalesced.values():
+            observers = self._match(event.topic) - self._transition_observers
+            self._dispatch(source, event, observers)
+
+    def _dispatch(
+            self, source: Observable, event: Event,
+            observers: AbstractSet[Observer]
+    ) -> None:
+        """
+        Sends the specified event to the specified observers, either
+        immediately or with the help of worker tasks
+
+        :param source: a source of the event
+        :param event: an event to be dispatched
+        :param observers: observers to receive the event
+        :return: None
+        """
+        if not observers:
+            return
+
+        if self._async_dispatch:
+            self._enqueue(source, event, observers)
+        else:
+            self._notify(event, observers)
+
+    def _notify(
+            self, event: Event, observers: AbstractSet[Observer]
+    ) -> None:
+        """
+        Sends the specified event to the specified subscribers of EventHub.
+        Coroutines returned by observers are scheduled for execution, but
+        not awaited
+
+        :param event: an event to be broadcasted
+        :param observers: observers to receive the event
+        :return: None
+        """
+        for observer in observers:
+            result = observer.update(self, event)
+
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result, loop=self._loop)
+
+    def _enqueue(
+            self, source: Observable, event: Event,
+            observers: AbstractSet[Observer]
+    ) -> None:
+        """
+        Adds the specified event to the queue of a worker responsible for
+        the specified source. Asyncio queues are not thread-safe, so events
+        from other threads are passed to the event loop thread first
+
+        :param source: a source of the event
+        :param event: an event to be dispatched
+        :param observers: observers to receive the event
+        :return: None
+        """
+        # a lazily built DTO must reflect the state of an object at the
+        # moment of the event, so it's built before the handover
+        if isinstance(event, ObjectRelatedEvent):
+            event.materialize()
+
+        queue = self._queues[hash(source) % len(self._queues)]
+        item = (event, observers)
+
+        if threading.get_ident() == self._loop_thread_id:
+            queue.put_nowait(item)
+        else:
+            self._loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    async def _dispatch_forever(self, queue: asyncio.Queue) -> None:
+        """
+        Dispatches events from the specified queue one by one
+
+        :param queue: a queue of events to be dispatched
+        :return: None
+        """
+        while True:  # interrupted with task cancellation
+            event, observers = await queue.get()
+
+            try:
+                await self._notify_async(event, observers)
+            finally:
+                queue.task_done()
+
+    async def _notify_async(
+            self, event: Event, observers: AbstractSet[Observer]
+    ) -> None:
+        """
+        Sends the specified event to the specified subscribers of EventHub
+        and awaits for coroutines returned by them. Failure of one observer
+        doesn't affect other ones
 
         :param event: an event to be broadcasted
+        :param observers: observers to receive the event
         :return: None
         """
-        for observer in self._observers:
-            observer.update(self, event)
+        # observers may be added or removed while a coroutine is awaited
+        for observer in tuple(observers):
+            try:
+                result = observer.update(self, event)
+
+                if asyncio.iscoroutine(result):
+                    await result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.exception(
+                    "Observer %s failed to handle an event with topic %s: %s",
+                    observer, event.topic, e
+                )
 
     def register_handler(self, source_type: Type, handler: Callable) -> None:
         """
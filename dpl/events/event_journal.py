@@ -0,0 +1,420 @@
+"""
+This module contains a definition of EventJournal - of an observer of
+EventHub which saves events to an on-disk log and allows to read the
+history of events for a specified time range
+"""
+import asyncio
+import itertools
+import json
+import logging
+import struct
+import threading
+import time
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from dpl.utils.observer import Observer
+from dpl.utils.segment_log import SegmentLog
+from dpl.utils.json_enum_encoder import JsonEnumEncoder
+from .event import Event
+from .object_related_event import ObjectRelatedEvent
+
+
+LOGGER = logging.getLogger(__name__)
+
+# a header of a saved event: a timestamp and a length of the topic
+_EVENT_HEADER = struct.Struct('!dH')
+
+# a timestamp, a topic and a JSON-encoded body of a saved event
+JournalRecord = Tuple[float, str, bytes]
+
+
+def encode_event(timestamp: float, topic: str, body: bytes) -> bytes:
+    """
+    Encodes an event to be saved in the log. A timestamp and a topic are
+    stored before the body, so they can be checked without decoding of the
+    body
+
+    :param timestamp: the moment of the event in UNIX time format
+    :param topic: a topic of the event
+    :param body: a JSON-encoded body of the event
+    :return: an encoded event
+    """
+    encoded_topic = topic.encode('utf-8')
+
+    return _EVENT_HEADER.pack(timestamp, len(encoded_topic)) + \
+        encoded_topic + body
+
+
+def decode_event(payload: bytes) -> JournalRecord:
+    """
+    Decodes an event encoded with encode_event
+
+    :param payload: an encoded event
+    :return: a timestamp, a topic and a JSON-encoded body of the event
+    """
+    timestamp, topic_length = _EVENT_HEADER.unpack_from(payload)
+    body_offset = _EVENT_HEADER.size + topic_length
+    topic = bytes(payload[_EVENT_HEADER.size:body_offset]).decode('utf-8')
+
+    return timestamp, topic, bytes(payload[body_offset:])
+
+
+def object_key(topic: str) -> str:
+    """
+    Returns a part of the topic which identifies an object (like
+    ``things/L1`` for ``things/L1/modified``)
+
+    :param topic: a topic of an event
+    :return: a key of the object the event is related to
+    """
+    return topic.rpartition('/')[0]
+
+
+class _SegmentSummary(object):
+    """
+    An index entry of a closed segment: the time range of events stored in
+    the segment and keys of objects mentioned in them
+    """
+    __slots__ = ('min_timestamp', 'max_timestamp', 'objects')
+
+    def __init__(
+            self, min_timestamp: float, max_timestamp: float,
+            objects: FrozenSet[str]
+    ):
+        self.min_timestamp = min_timestamp
+        self.max_timestamp = max_timestamp
+        self.objects = objects
+
+    def may_contain(
+            self, key: Optional[str], since: float, until: float
+    ) -> bool:
+        if self.max_timestamp < since or self.min_timestamp > until:
+            return False
+
+        return key is None or key in self.objects
+
+
+class JournalCursor(object):
+    """
+    JournalCursor allows to read the result of a history query in chunks.
+    Segments are read in the default executor, so the event loop is never
+    blocked by disk reads. Reads and closing of the cursor are serialized,
+    so the cursor may be closed even if a fetch is still in progress (for
+    example, if the fetching task was cancelled)
+    """
+    def __init__(
+            self, records: Iterator[JournalRecord],
+            loop: asyncio.AbstractEventLoop
+    ):
+        """
+        Constructor
+
+        :param records: an iterator over records to be read
+        :param loop: an event loop to be used
+        """
+        self._records = records
+        self._loop = loop
+        self._lock = threading.Lock()
+
+    async def fetch(self, count: int) -> List[JournalRecord]:
+        """
+        Reads up to count next records
+
+        :param count: the maximum number of records to be read
+        :return: a list of records; empty if there is no records left or
+                 the cursor was closed
+        """
+        return await self._loop.run_in_executor(None, self._take, count)
+
+    async def close(self) -> None:
+        """
+        Releases all resources used by this cursor. Waits for the completion
+        of a fetch in progress (if any) first
+
+        :return: None
+        """
+        await self._loop.run_in_executor(None, self._close)
+
+    def _take(self, count: int) -> List[JournalRecord]:
+        with self._lock:
+            return list(itertools.islice(self._records, count))
+
+    def _close(self) -> None:
+        with self._lock:
+            self._records.close()
+
+
+class EventJournal(Observer):
+    """
+    EventJournal saves all received events in an append-only SegmentLog.
+    Events are buffered in memory and are written to the disk by a background
+    task in groups, so event dispatching is never blocked by disk writes.
+
+    Closed segments are indexed by the time range of their events and by the
+    objects mentioned in them, so history queries read only the segments
+    which may contain matching events. Segments which are older than the
+    retention period or exceed the maximum number of segments are removed.
+
+    Note that events received less than flush_interval seconds before a
+    crash may be lost.
+    """
+    DEFAULT_FLUSH_INTERVAL = 1.0
+    DEFAULT_SEGMENT_SIZE = 4 * 1024 * 1024
+    RETENTION_CHECK_INTERVAL = 60
+
+    def __init__(
+            self, path: str, *, loop: asyncio.AbstractEventLoop = None,
+            flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+            segment_size: int = DEFAULT_SEGMENT_SIZE,
+            retention_period: Optional[float] = None,
+            max_segments: Optional[int] = None
+    ):
+        """
+        Constructor
+
+        :param path: a path to the directory with log segments
+        :param loop: an instance of EventLoop to be used for background tasks
+        :param flush_interval: a maximum time (in seconds) between the event
+               and its write to the disk
+        :param segment_size: a size of a segment (in bytes); events are
+               removed by segments
+        :param retention_period: the time (in seconds) to keep events for;
+               not limited if None
+        :param max_segments: the maximum number of segments to be kept; not
+               limited if None
+        """
+        if loop is None:
+            self._loop = asyncio.get_event_loop()
+        else:
+            self._loop = loop
+
+        self._path = path
+        self._flush_interval = flush_interval
+        self._segment_size = segment_size
+        self._retention_period = retention_period
+        self._max_segments = max_segments
+
+        self._log = None  # type: Optional[SegmentLog]
+        self._flusher = None  # type: Optional[asyncio.Future]
+        self._is_dirty = False
+
+        # summaries of closed segments, are computed on demand
+        self._summaries = dict()  # type: Dict[int, _SegmentSummary]
+        self._summaries_lock = threading.Lock()
+
+    async def open(self) -> None:
+        """
+        Opens the log, removes expired segments and starts a background
+        flusher
+
+        :return: None
+        """
+        assert self._log is None
+        self._log = await self._loop.run_in_executor(
+            None, SegmentLog, self._path, self._segment_size
+        )
+        await self._loop.run_in_executor(None, self._enforce_retention)
+        self._flusher = asyncio.ensure_future(
+            self._flush_periodically(), loop=self._loop
+        )
+
+    async def close(self) -> None:
+        """
+        Stops the background flusher, writes all buffered events and closes
+        the log
+
+        :return: None
+        """
+        if self._log is None:
+            return
+
+        self._flusher.cancel()
+
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+
+        await self._loop.run_in_executor(None, self._log.close)
+        self._log = None
+
+    def update(self, source, *args, **kwargs) -> None:
+        """
+        Saves the received event. Events received before the log was opened
+        are ignored
+
+        :param source: a source of the event
+        :param args: positional arguments, must contain an Event
+        :param kwargs: keyword arguments, may contain an Event
+        :return: None
+        """
+        event = kwargs.get('event', args[0])  # type: Event
+        assert isinstance(event, Event)
+
+        if self._log is None:
+            return
+
+        if isinstance(event, ObjectRelatedEvent):
+            body = event.object_dto
+        else:
+            body = None
+
+        self._log.append(encode_event(
+            event.timestamp, event.topic,
+            json.dumps(body, cls=JsonEnumEncoder).encode('utf-8')
+        ))
+        self._is_dirty = True
+
+    def open_cursor(
+            self, key: Optional[str] = None, since: float = 0.0,
+            until: float = float('inf')
+    ) -> JournalCursor:
+        """
+        Starts a history query. Events are read lazily, while the cursor is
+        fetched
+
+        :param key: a key of an object (like ``things/L1``) to read events
+               of; events of all objects are read if None
+        :param since: the earliest moment of events to be read (inclusive)
+        :param until: the latest moment of events to be read (inclusive)
+        :return: a cursor to read matching events from
+        """
+        assert self._log is not None
+
+        return JournalCursor(self._scan(key, since, until), self._loop)
+
+    def _scan(
+            self, key: Optional[str], since: float, until: float
+    ) -> Iterator[JournalRecord]:
+        """
+        Iterates over all stored events that match the query, from the
+        oldest to the newest one. Buffered events are flushed first
+
+        :param key: a key of an object to read events of; all if None
+        :param since: the earliest moment of events to be read
+        :param until: the latest moment of events to be read
+        :return: an iterator over matching records
+        """
+        log = self._log
+        log.flush()
+        active = log.active_segment
+
+        for number in log.list_segments():
+            if number < active:
+                summary = self._summarize(number)
+
+                if not summary.may_contain(key, since, until):
+                    continue
+
+            for payload in log.read_segment(number):
+                record = decode_event(payload)
+                timestamp, topic, _ = record
+
+                if since <= timestamp <= until and (
+                        key is None or object_key(topic) == key
+                ):
+                    yield record
+
+    def _summarize(self, number: int) -> _SegmentSummary:
+        """
+        Returns the summary of a closed segment. Reads the whole segment
+        only on the first call for each segment
+
+        :param number: a sequence number of a closed segment
+        :return: a summary of the segment
+        """
+        with self._summaries_lock:
+            summary = self._summaries.get(number)
+
+        if summary is not None:
+            return summary
+
+        min_timestamp = float('inf')
+        max_timestamp = float('-inf')
+        objects = set()
+
+        for payload in self._log.read_segment(number):
+            timestamp, topic, _ = decode_event(payload)
+            min_timestamp = min(min_timestamp, timestamp)
+            max_timestamp = max(max_timestamp, timestamp)
+            objects.add(object_key(topic))
+
+        summary = _SegmentSummary(
+            min_timestamp, max_timestamp, frozenset(objects)
+        )
+
+        with self._summaries_lock:
+            self._summaries[number] = summary
+
+        return summary
+
+    def _enforce_retention(self) -> None:
+        """
+        Removes the oldest closed segments that are either expired or exceed
+        the maximum number of segments
+
+        :return: None
+        """
+        if self._retention_period is None and self._max_segments is None:
+            return
+
+        log = self._log
+        numbers = log.list_segments()
+        active = log.active_segment
+        closed = [number for number in numbers if number < active]
+        victims = list()
+
+        if self._max_segments is not None:
+            excess = len(numbers) - self._max_segments
+            victims.extend(closed[:max(excess, 0)])
+
+        if self._retention_period is not None:
+            expire_before = time.time() - self._retention_period
+
+            # segments are ordered by time, so the check is stopped on the
+            # first segment which is not expired yet
+            for number in closed[len(victims):]:
+                if self._summarize(number).max_timestamp >= expire_before:
+                    break
+
+                victims.append(number)
+
+        for number in victims:
+            log.remove_segment(number)
+
+            with self._summaries_lock:
+                self._summaries.pop(number, None)
+
+        if victims:
+            LOGGER.debug(
+                "Removed %d old segments of the event journal", len(victims)
+            )
+
+    async def _flush_periodically(self) -> None:
+        """
+        Writes buffered events to the disk every flush_interval seconds and
+        removes old segments. Disk operations are performed in the default
+        executor, so the event loop is never blocked by them
+
+        :return: None
+        """
+        next_retention_check = self._loop.time()
+
+        while True:  # interrupted with future cancellation
+            await asyncio.sleep(self._flush_interval, loop=self._loop)
+
+            try:
+                if self._is_dirty:
+                    self._is_dirty = False
+                    await self._loop.run_in_executor(None, self._log.flush)
+
+                if self._loop.time() >= next_retention_check:
+                    next_retention_check = \
+                        self._loop.time() + self.RETENTION_CHECK_INTERVAL
+                    await self._loop.run_in_executor(
+                        None, self._enforce_retention
+                    )
+            except OSError as e:
+                LOGGER.error(
+                    "Failed to save events to %s: %s", self._path, e
+                )
@@ -3,7 +3,7 @@ This module contains a definition of ObjectRelatedEvent - a class for events
 that are related to some objects (i.e. to their creation, deletion or
 modification).
 """
-from typing import Optional
+from typing import Callable, Optional
 
 from dpl.dtos.base_dto import BaseDto
 from .event import Event
@@ -11,9 +11,16 @@ from .event import Event
 
 class ObjectRelatedEvent(Event):
     """
-    Contains information about an event that happened with some object
+    Contains information about an event that happened with some object.
+
+    Building of DTOs may be expensive, so a DTO may be built lazily: only on
+    the first access to the ``object_dto`` property. The built DTO is saved
+    and reused by all the following accesses
     """
-    def __init__(self, topic: str, object_dto: Optional[BaseDto]):
+    def __init__(
+            self, topic: str, object_dto: Optional[BaseDto] = None, *,
+            dto_builder: Optional[Callable[[], Optional[BaseDto]]] = None
+    ):
         """
         Constructor. Receives information about a topic of event (constructed
         like ``object_category/object_id/what_changed`` and an object DTO -
@@ -22,17 +29,33 @@ class ObjectRelatedEvent(Event):
         :param topic: a topic (category) of this Event
         :param object_dto: a current state of an object or None if it was
                deleted
+        :param dto_builder: a callable which returns the current state of
+               an object; if specified, then it's called on the first access
+               to the object_dto instead of usage of the object_dto value
         """
         super().__init__(topic)
         self._object_dto = object_dto
+        self._dto_builder = dto_builder
+
+    def materialize(self) -> None:
+        """
+        Builds the DTO of the object if it wasn't built yet
+
+        :return: None
+        """
+        if self._dto_builder is not None:
+            self._object_dto = self._dto_builder()
+            self._dto_builder = None
 
     @property
     def object_dto(self) -> Optional[BaseDto]:
         """
         Returns the current DTO (representation) of the object this Event is
-        related to
+        related to. Builds the DTO on the first access if it wasn't built yet
 
         :return: the current DTO (representation) of the object this Event is
                  related to
         """
+        self.materialize()
+
         return self._object_dto
@@ -23,3 +23,41 @@ def iterable_to_topic(iterable: typing.Iterable[str]) -> str:
     :return: topic as a string
     """
     return '/'.join(iterable)
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """
+    Checks if the specified topic matches the specified pattern. A pattern
+    may contain wildcards: '+' matches exactly one level of a topic and '#'
+    (allowed only as the last level of a pattern) matches any number of
+    levels, including the parent level
+
+    :param pattern: a pattern (topic filter) to be checked
+    :param topic: a topic to be checked
+    :return: True if the topic matches the pattern, False otherwise
+    """
+    pattern_parts = topic_to_list(pattern)
+    topic_parts = topic_to_list(topic)
+
+    for index, part in enumerate(pattern_parts):
+        if part == '#':
+            return True
+
+        if index >= len(topic_parts):
+            return False
+
+        if part != '+' and part != topic_parts[index]:
+            return False
+
+    return len(pattern_parts) == len(topic_parts)
+
+
+def is_valid_pattern(pattern: str) -> bool:
+    """
+    Checks if the specified pattern is well-formed: the '#' wildcard may be
+    used only as the last level of a pattern
+
+    :param pattern: a pattern (topic filter) to be checked
+    :return: True if the pattern is valid, False otherwise
+    """
+    return '#' not in topic_to_list(pattern)[:-1]
@@ -0,0 +1,176 @@
+"""
+This module contains a definition of TopicTree - an index of topic patterns
+which allows to find all patterns matching a concrete topic
+"""
+from typing import Dict, Generic, Iterator, List, Optional, Tuple, TypeVar
+
+from .topic import topic_to_list
+
+
+TKey = TypeVar('TKey')
+TValue = TypeVar('TValue')
+
+
+class _Node(object):
+    """
+    A node of TopicTree. Wildcard children are kept separately from the
+    regular ones, so they are not looked up in a dictionary on matching
+    """
+    __slots__ = ('children', 'single', 'multi', 'values')
+
+    def __init__(self):
+        self.children = {}  # type: Dict[str, _Node]
+        self.single = None  # type: Optional[_Node]
+        self.multi = None  # type: Optional[_Node]
+        self.values = {}  # type: Dict
+
+    def get_child(self, part: str) -> Optional['_Node']:
+        if part == '+':
+            return self.single
+
+        if part == '#':
+            return self.multi
+
+        return self.children.get(part)
+
+    def set_child(self, part: str, child: Optional['_Node']) -> None:
+        if part == '+':
+            self.single = child
+        elif part == '#':
+            self.multi = child
+        elif child is None:
+            del self.children[part]
+        else:
+            self.children[part] = child
+
+    def is_empty(self) -> bool:
+        return not (
+            self.values or self.children or
+            self.single is not None or self.multi is not None
+        )
+
+
+class TopicTree(Generic[TKey, TValue]):
+    """
+    TopicTree stores topic patterns, each of them with a mapping of keys
+    (for example, identifiers of subscribers) to values (for example,
+    parameters of subscription).
+
+    Patterns may contain wildcards: '+' matches exactly one level of a topic
+    and '#' (allowed only as the last level of a pattern) matches any number
+    of levels, including the parent one. The time of matching depends on the
+    depth of a topic and on the number of wildcards in stored patterns, but
+    not on the total number of patterns.
+    """
+    def __init__(self):
+        """
+        Constructor. Initializes an empty tree
+        """
+        self._root = _Node()
+        self._len = 0
+
+    def __len__(self) -> int:
+        """
+        Returns the total number of stored key and pattern pairs
+
+        :return: the number of stored entries
+        """
+        return self._len
+
+    def add(self, pattern: str, key: TKey, value: TValue) -> None:
+        """
+        Associates a key and a value with the specified pattern. Replaces
+        the value if the key is already associated with this pattern
+
+        :param pattern: a topic pattern
+        :param key: a key to be saved
+        :param value: a value to be saved for this key
+        :return: None
+        """
+        node = self._root
+
+        for part in topic_to_list(pattern):
+            child = node.get_child(part)
+
+            if child is None:
+                child = _Node()
+                node.set_child(part, child)
+
+            node = child
+
+        if key not in node.values:
+            self._len += 1
+
+        node.values[key] = value
+
+    def remove(self, pattern: str, key: TKey) -> bool:
+        """
+        Removes an association of the key with the specified pattern. Removes
+        all nodes of the tree which became empty
+
+        :param pattern: a topic pattern
+        :param key: a key to be removed
+        :return: True if the key was associated with the pattern, False
+                 otherwise
+        """
+        # a chain of nodes and topic parts which lead to their children,
+        # will be used for backward traversal and node removal
+        chain = list()  # type: List[Tuple[_Node, str]]
+        node = self._root
+
+        for part in topic_to_list(pattern):
+            child = node.get_child(part)
+
+            if child is None:
+                return False
+
+            chain.append((node, part))
+            node = child
+
+        if key not in node.values:
+            return False
+
+        del node.values[key]
+        self._len -= 1
+
+        for parent, part in reversed(chain):
+            if not parent.get_child(part).is_empty():
+                break
+
+            parent.set_child(part, None)
+
+        return True
+
+    def match(self, topic: str) -> Iterator[Tuple[TKey, TValue]]:
+        """
+        Finds all patterns that match the specified concrete topic. All
+        alternatives (exact match, '+' and '#' wildcards) are checked on
+        each level of the topic
+
+        :param topic: a topic to be matched
+        :return: an iterator over (key, value) pairs of all matching
+                 patterns; the same key is returned several times if it is
+                 associated with several matching patterns
+        """
+        parts = topic_to_list(topic)
+        depth = len(parts)
+        stack = [(self._root, 0)]  # type: List[Tuple[_Node, int]]
+
+        while stack:
+            node, index = stack.pop()
+
+            # '#' matches the rest of a topic, including the parent level
+            if node.multi is not None:
+                yield from node.multi.values.items()
+
+            if index == depth:
+                yield from node.values.items()
+                continue
+
+            if node.single is not None:
+                stack.append((node.single, index + 1))
+
+            exact = node.children.get(parts[index])
+
+            if exact is not None:
+                stack.append((exact, index + 1))
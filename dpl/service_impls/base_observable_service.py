@@ -1,5 +1,5 @@
 import weakref
-from typing import TypeVar, MutableSet, Optional, Generic
+from typing import TypeVar, MutableSet, Optional, Generic, Callable
 
 from dpl.utils.observer import Observer
 from dpl.dtos.base_dto import BaseDto
@@ -49,7 +49,8 @@ class BaseObservableService(
 
     def _notify(
             self, object_id: TDomainId, event_type: ServiceEventType,
-            object_dto: Optional[TEntityDto]
+            object_dto: Optional[TEntityDto] = None,
+            dto_builder: Optional[Callable[[], Optional[TEntityDto]]] = None
     ) -> None:
         """
         Notifies all of the subscribers that an object, controlled by this
@@ -59,6 +60,9 @@ class BaseObservableService(
         :param event_type: enum value, specifies what happened to the object
         :param object_dto: a DTO of the altered object or None if it was
                deleted
+        :param dto_builder: a callable to build the DTO of the altered
+               object on demand; if specified, then subscribers must to use
+               it instead of the object_dto value
         :return: None
         """
         for o in self._observers:
@@ -66,5 +70,6 @@ class BaseObservableService(
                 source=self._weak_self,
                 event_type=event_type,
                 object_id=object_id,
-                object_dto=object_dto
+                object_dto=object_dto,
+                dto_builder=dto_builder
             )
@@ -1,3 +1,4 @@
+import functools
 import weakref
 from typing import Optional, Mapping, Any, Callable
 
@@ -91,14 +92,15 @@ class ThingService(BaseObservableService[Thing, ThingDto], AbsThingService):
         service_event_type = ServiceEventType(event_type.value)
 
         if service_event_type is ServiceEventType.deleted:
-            thing_dto = None
+            dto_builder = None
         else:
-            thing_dto = build_dto(object_ref)
+            # the DTO is built only if some subscriber will need it
+            dto_builder = functools.partial(build_dto, object_ref)
 
         self._notify(
             object_id=object_id,
             event_type=service_event_type,
-            object_dto=thing_dto
+            dto_builder=dto_builder
         )
 
     def view(self, domain_id: TDomainId) -> ThingDto:
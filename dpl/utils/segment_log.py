@@ -0,0 +1,366 @@
+"""
+This module contains a definition of SegmentLog - of a simple append-only
+log of binary records, stored on a local disk in a set of segment files.
+
+Each record is stored as a header followed by a payload. The header contains
+the length of the payload and its CRC32 checksum (both are unsigned 32-bit
+integers in a network byte order). Thus a torn write at the end of the last
+segment is detected and ignored on reading.
+
+Segment files are named by their sequence number (like
+``00000000000000000001.seg``) and are read in the order of their numbers.
+A compacted segment is saved under a temporary name first and then is
+marked as complete (committed) by renaming; a committed compaction which
+was interrupted is finished on the next opening of the log.
+Appended records are buffered in memory and are written to the disk (and
+fsync'ed) only by an explicit call of the ``flush`` method, which allows to
+group many records into a single disk write.
+"""
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Iterable, Iterator, List, Callable
+
+
+SEGMENT_SUFFIX = '.seg'
+TEMP_SUFFIX = '.tmp'
+COMPACTED_SUFFIX = '.compacted'
+
+_HEADER = struct.Struct('!II')
+
+
+def _segment_name(number: int) -> str:
+    """
+    Returns the file name of a segment with the specified number
+
+    :param number: a sequence number of a segment
+    :return: the name of the segment file
+    """
+    return '%020d%s' % (number, SEGMENT_SUFFIX)
+
+
+def encode_record(payload: bytes) -> bytes:
+    """
+    Adds a header to the specified payload
+
+    :param payload: a content of the record
+    :return: the record ready to be written to the disk
+    """
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def iter_records(data) -> Iterator[bytes]:
+    """
+    Iterates over payloads of records stored in the specified buffer. Stops
+    on the first truncated or corrupted record
+
+    :param data: a bytes-like object (like mmap) with records
+    :return: an iterator over payloads of records
+    """
+    offset = 0
+    end = len(data)
+
+    while offset + _HEADER.size <= end:
+        length, checksum = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+
+        if start + length > end:
+            return  # a truncated record at the end of a segment
+
+        payload = data[start:start + length]
+
+        if zlib.crc32(payload) != checksum:
+            return  # a corrupted (torn) record
+
+        yield payload
+        offset = start + length
+
+
+class SegmentLog(object):
+    """
+    SegmentLog is an append-only log of binary records split into segment
+    files of a limited size. Appending is cheap and never touches the disk;
+    buffered records are written with a single write and fsync call on
+    flush. All methods are thread-safe, so flushing and compaction can be
+    performed in a background thread.
+    """
+    DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, path: str, segment_size: int = DEFAULT_SEGMENT_SIZE):
+        """
+        Constructor. Opens the log stored in the specified directory. Creates
+        the directory if it doesn't exist yet
+
+        :param path: a path to the directory with segment files
+        :param segment_size: a size of a segment (in bytes) after which a new
+               segment will be started
+        """
+        self._path = path
+        self._segment_size = segment_size
+        self._lock = threading.Lock()
+        self._buffer = list()  # type: List[bytes]
+
+        os.makedirs(path, exist_ok=True)
+        self._remove_temp_files()
+        self._finish_compaction()
+
+        numbers = self._list_segments()
+        self._active_number = numbers[-1] if numbers else 1
+        self._active = open(self._segment_path(self._active_number), 'ab')
+
+    @property
+    def path(self) -> str:
+        """
+        Returns a path to the directory with segment files
+
+        :return: a path to the directory with segment files
+        """
+        return self._path
+
+    @property
+    def active_segment(self) -> int:
+        """
+        Returns a sequence number of the active segment - of the segment the
+        next flushed records will be written to
+
+        :return: a sequence number of the active segment
+        """
+        with self._lock:
+            return self._active_number
+
+    def list_segments(self) -> List[int]:
+        """
+        Returns sorted sequence numbers of all segments, including the active
+        one
+
+        :return: a sorted list of sequence numbers
+        """
+        with self._lock:
+            return self._list_segments()
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self._path, _segment_name(number))
+
+    def _list_segments(self) -> List[int]:
+        """
+        Returns sorted sequence numbers of all segments present on the disk
+
+        :return: a sorted list of sequence numbers
+        """
+        numbers = list()
+
+        for name in os.listdir(self._path):
+            if name.endswith(SEGMENT_SUFFIX):
+                numbers.append(int(name[:-len(SEGMENT_SUFFIX)]))
+
+        return sorted(numbers)
+
+    def _remove_temp_files(self) -> None:
+        """
+        Removes leftovers of an interrupted compaction
+
+        :return: None
+        """
+        for name in os.listdir(self._path):
+            if name.endswith(TEMP_SUFFIX):
+                os.remove(os.path.join(self._path, name))
+
+    def _finish_compaction(self) -> None:
+        """
+        Finishes a compaction which was committed, but was interrupted before
+        the replacement of compacted segments
+
+        :return: None
+        """
+        for name in os.listdir(self._path):
+            if not name.endswith(COMPACTED_SUFFIX):
+                continue
+
+            target_name = name[:-len(COMPACTED_SUFFIX)]
+            target_number = int(target_name[:-len(SEGMENT_SUFFIX)])
+            self._replace_compacted(target_number)
+
+    def _replace_compacted(self, target_number: int) -> None:
+        """
+        Removes all segments older than the target one and replaces the
+        target segment with the committed result of compaction
+
+        :param target_number: a sequence number of the last compacted segment
+        :return: None
+        """
+        target_path = self._segment_path(target_number)
+
+        for number in self._list_segments():
+            if number < target_number:
+                os.remove(self._segment_path(number))
+
+        os.replace(target_path + COMPACTED_SUFFIX, target_path)
+
+    def append(self, payload: bytes) -> None:
+        """
+        Adds a new record to the log. The record is buffered in memory until
+        the next call of flush
+
+        :param payload: a content of the record
+        :return: None
+        """
+        record = encode_record(payload)
+
+        with self._lock:
+            self._buffer.append(record)
+
+    def flush(self) -> None:
+        """
+        Writes all buffered records to the active segment and waits until
+        they are stored on the disk. Starts a new segment if the size limit
+        of the active one was reached
+
+        :return: None
+        """
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._buffer:
+            data = b''.join(self._buffer)
+            self._buffer.clear()
+
+            self._active.write(data)
+            self._active.flush()
+            os.fsync(self._active.fileno())
+
+        if self._active.tell() >= self._segment_size:
+            self._roll_locked()
+
+    def _roll_locked(self) -> None:
+        """
+        Closes the active segment and starts a new one
+
+        :return: None
+        """
+        self._active.close()
+        self._active_number += 1
+        self._active = open(self._segment_path(self._active_number), 'ab')
+
+    def read_all(self) -> Iterator[bytes]:
+        """
+        Iterates over payloads of all records stored on the disk, from the
+        oldest to the newest one. Buffered records are flushed first.
+        Segments are read through mmap, so they are not loaded into memory
+        at once
+
+        :return: an iterator over payloads of records
+        """
+        with self._lock:
+            self._flush_locked()
+            numbers = self._list_segments()
+
+        for number in numbers:
+            yield from self._read_segment(number)
+
+    def read_segment(self, number: int) -> Iterator[bytes]:
+        """
+        Iterates over payloads of records stored on the disk in a single
+        segment. Buffered records are not flushed
+
+        :param number: a sequence number of a segment
+        :return: an iterator over payloads of records
+        """
+        return self._read_segment(number)
+
+    def remove_segment(self, number: int) -> None:
+        """
+        Removes a closed segment with all its records
+
+        :param number: a sequence number of a segment to be removed
+        :return: None
+        """
+        with self._lock:
+            if number >= self._active_number:
+                raise ValueError("The active segment can't be removed")
+
+            try:
+                os.remove(self._segment_path(number))
+            except FileNotFoundError:
+                pass
+
+    def _read_segment(self, number: int) -> Iterator[bytes]:
+        """
+        Iterates over payloads of records stored in a single segment
+
+        :param number: a sequence number of a segment
+        :return: an iterator over payloads of records
+        """
+        try:
+            segment = open(self._segment_path(number), 'rb')
+        except FileNotFoundError:
+            return  # the segment was removed by compaction
+
+        with segment:
+            if os.fstat(segment.fileno()).st_size == 0:
+                return  # empty files can't be mapped
+
+            with mmap.mmap(
+                segment.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                yield from iter_records(data)
+
+    def compact(
+            self, select_live: Callable[[Iterable[bytes]], Iterable[bytes]]
+    ) -> None:
+        """
+        Rewrites all the records except ones in the active segment. Closes the
+        active segment first, reads all closed segments, passes their records
+        to the specified callable and replaces closed segments with a single
+        segment which contains only the records returned by the callable.
+
+        :param select_live: a callable which receives all the stored records
+               and returns only the records to be kept
+        :return: None
+        """
+        with self._lock:
+            self._flush_locked()
+
+            if self._active.tell() > 0:
+                self._roll_locked()
+
+            numbers = [
+                number for number in self._list_segments()
+                if number < self._active_number
+            ]
+
+        if not numbers:
+            return
+
+        def _read_closed() -> Iterator[bytes]:
+            for number in numbers:
+                yield from self._read_segment(number)
+
+        target_number = numbers[-1]
+        target_path = self._segment_path(target_number)
+        temp_path = target_path + TEMP_SUFFIX
+
+        with open(temp_path, 'wb') as target:
+            for payload in select_live(_read_closed()):
+                target.write(encode_record(payload))
+
+            target.flush()
+            os.fsync(target.fileno())
+
+        # the compaction is committed by an atomic rename; if it's
+        # interrupted before, then the compacted segments are kept intact,
+        # otherwise it's finished on the next opening of the log
+        os.replace(temp_path, target_path + COMPACTED_SUFFIX)
+        self._replace_compacted(target_number)
+
+    def close(self) -> None:
+        """
+        Flushes all buffered records and closes the log
+
+        :return: None
+        """
+        with self._lock:
+            self._flush_locked()
+            self._active.close()
@@ -145,7 +145,9 @@ setup(
     # Similar to `install_requires` above, these must be valid existing
     # projects.
     extras_require={  # Optional
-        'discovery': ['zeroconf']
+        'discovery': ['zeroconf'],
+        'msgpack': ['msgpack>=0.5.2'],
+        'cbor': ['cbor2']
     },
 
     # If there are data files included in your packages that need to be
@@ -0,0 +1,123 @@
+"""
+This module contains unit tests for compilation of filter expressions
+"""
+
+import unittest
+
+from dpl.api.streaming_api.body_filter import (
+    FilterSyntaxError, compile_filter, any_of
+)
+
+
+SENSOR = {
+    'id': 'T1', 'is_available': True, 'temperature_c': 31.5,
+    'capabilities': ['has_value', 'has_temperature'],
+    'metadata': {'vendor': 'dummy'}
+}
+
+
+class TestBodyFilter(unittest.TestCase):
+    def _check(self, expression, expected, body=SENSOR, previous=None):
+        predicate = compile_filter(expression)
+        self.assertEqual(expected, predicate(body, previous))
+
+    def test_comparisons(self):
+        cases = (
+            ({'field': 'temperature_c', 'gt': 30}, True),
+            ({'field': 'temperature_c', 'le': 30}, False),
+            ({'field': 'is_available', 'eq': True}, True),
+            ({'field': 'id', 'ne': 'T1'}, False),
+            ({'field': 'id', 'in': ['T1', 'T2']}, True),
+            ({'field': 'capabilities', 'contains': 'has_temperature'}, True),
+            ({'field': 'capabilities', 'contains': 'has_brightness'}, False),
+            ({'field': 'metadata.vendor', 'eq': 'dummy'}, True),
+            ({'field': 'brightness', 'exists': False}, True),
+        )
+
+        for expression, expected in cases:
+            with self.subTest(expression=expression):
+                self._check(expression, expected)
+
+    def test_missing_fields_and_type_mismatch(self):
+        cases = (
+            {'field': 'brightness', 'gt': 0},
+            {'field': 'brightness', 'ne': 0},
+            {'field': 'metadata.model.name', 'eq': 'x'},
+            {'field': 'id', 'gt': 30},
+            {'field': 'temperature_c', 'contains': 3},
+            {'field': 'capabilities', 'in': ['has_value']},
+        )
+
+        for expression in cases:
+            with self.subTest(expression=expression):
+                self._check(expression, False)
+
+    def test_logical(self):
+        self._check({'and': [
+            {'field': 'is_available', 'eq': True},
+            {'or': [
+                {'field': 'temperature_c', 'gt': 40},
+                {'not': {'field': 'id', 'eq': 'T2'}}
+            ]}
+        ]}, True)
+
+        self._check({'and': [
+            {'field': 'is_available', 'eq': True},
+            {'field': 'temperature_c', 'gt': 40}
+        ]}, False)
+
+    def test_changed(self):
+        expression = {'field': 'is_available', 'changed': True}
+        unavailable = dict(SENSOR, is_available=False)
+
+        self._check(expression, True, previous=unavailable)
+        self._check(expression, False, previous=SENSOR)
+        # an update without a known previous state is always a change
+        self._check(expression, True, previous=None)
+
+        self._check(
+            {'field': 'is_available', 'changed': False}, True,
+            previous=dict(SENSOR, temperature_c=20)
+        )
+
+    def test_any_of(self):
+        predicate = any_of(
+            compile_filter({'field': 'temperature_c', 'lt': 0}),
+            compile_filter({'field': 'id', 'eq': 'T1'})
+        )
+
+        self.assertTrue(predicate(SENSOR, None))
+        self.assertFalse(predicate(dict(SENSOR, id='T2'), None))
+
+    def test_invalid_expressions(self):
+        cases = (
+            [],
+            {},
+            {'field': 'id'},
+            {'field': 'id', 'eq': 1, 'ne': 2},
+            {'field': 5, 'eq': 1},
+            {'field': 'id', 'like': 'T%'},
+            {'field': 'id', 'in': 'T1'},
+            {'field': 'id', 'changed': 'yes'},
+            {'and': []},
+            {'xor': [{'field': 'id', 'eq': 1}]},
+            {'and': [{'field': 'id', 'eq': 1}], 'or': []},
+        )
+
+        for expression in cases:
+            with self.subTest(expression=expression):
+                with self.assertRaises(FilterSyntaxError):
+                    compile_filter(expression)
+
+    def test_depth_is_limited(self):
+        expression = {'field': 'id', 'eq': 'T1'}
+
+        for _ in range(20):
+            expression = {'not': expression}
+
+        with self.assertRaises(FilterSyntaxError):
+            compile_filter(expression)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,381 @@
+"""
+This module contains unit tests for DeliveryManager
+"""
+
+import asyncio
+import tempfile
+import unittest
+from typing import Callable, List
+
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.delivery_manager import DeliveryManager
+from dpl.api.streaming_api.pending_queue import OverflowPolicy
+from dpl.api.streaming_api.segment_log_retained_store import (
+    SegmentLogRetainedStore
+)
+
+
+def _data(number: int, topic: str = 'things/L1/modified') -> Message:
+    return Message(
+        timestamp=1517232368.30256, type_='data', topic=topic,
+        body={'number': number}
+    )
+
+
+class BaseDeliveryManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self._managers = list()  # type: List[DeliveryManager]
+
+    def tearDown(self):
+        handlers = [
+            session_retained.retransmission_handler
+            for manager in self._managers
+            for session_retained in manager._retained.values()
+            if session_retained.retransmission_handler is not None
+        ]
+
+        # lets handlers to process pending wakeups before cancellation
+        self._run(asyncio.sleep(0, loop=self.loop))
+
+        for handler in handlers:
+            handler.cancel()
+
+        if handlers:
+            self._run(asyncio.gather(
+                *handlers, loop=self.loop, return_exceptions=True
+            ))
+
+        self.loop.close()
+
+    def _run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def _wait_for(self, condition: Callable[[], bool]) -> None:
+        for _ in range(1000):
+            if condition():
+                return
+
+            self._run(asyncio.sleep(0.001, loop=self.loop))
+
+        self.fail("The condition was not met in time")
+
+    def _build_manager(self, **kwargs) -> DeliveryManager:
+        manager = DeliveryManager(loop=self.loop, **kwargs)
+        self._managers.append(manager)
+
+        return manager
+
+    def _drain(
+            self, manager: DeliveryManager, session_id: str
+    ) -> List[Message]:
+        return manager._get_pending_queue(session_id).drain_nowait(1000)
+
+    @staticmethod
+    def _numbers(messages: List[Message]) -> List[int]:
+        return [message.body['number'] for message in messages]
+
+
+class TestSlowConsumers(BaseDeliveryManagerTest):
+    def test_fan_out_never_blocks(self):
+        manager = self._build_manager(max_pending_messages=2)
+
+        # nobody consumes messages of S1, but S2 still receives all of them
+        for number in range(5):
+            manager.put_message_nowait('S1', _data(number))
+            manager.put_message_nowait('S2', _data(number))
+
+            self.assertEqual(
+                [number], self._numbers(self._drain(manager, 'S2'))
+            )
+
+        # the oldest messages are dropped, sequence numbers are kept
+        messages = self._drain(manager, 'S1')
+
+        self.assertEqual([3, 4], self._numbers(messages))
+        self.assertEqual([4, 5], [message.seq for message in messages])
+
+    def test_disconnect_policy(self):
+        disconnected = list()
+        manager = self._build_manager(
+            max_pending_messages=2, overflow_policy=OverflowPolicy.disconnect,
+            slow_consumer_handler=disconnected.append
+        )
+
+        for number in range(2):
+            manager.put_message_nowait('S1', _data(number))
+            manager.put_message_nowait('S2', _data(number))
+
+        self.assertEqual([], disconnected)
+
+        manager.put_message_nowait('S1', _data(2))
+
+        self.assertEqual(['S1'], disconnected)
+        self.assertEqual([], self._drain(manager, 'S1'))
+        self.assertEqual([0, 1], self._numbers(self._drain(manager, 'S2')))
+
+
+class TestRetainedConflation(BaseDeliveryManagerTest):
+    def test_conflated_message_replaces_unacknowledged(self):
+        manager = self._build_manager(retransmission_timeout=0.01)
+
+        for number in range(2):
+            manager.put_message_nowait(
+                'S1', _data(number), ensure_delivery=True, conflate=True
+            )
+
+        manager.put_message_nowait(
+            'S1', _data(2, topic='things/L2/modified'), ensure_delivery=True,
+            conflate=True
+        )
+
+        self.assertEqual([0, 1, 2], self._numbers(self._drain(manager, 'S1')))
+        self.assertEqual(2, manager.get_gauges()['S1']['retained'])
+
+        self._run(asyncio.sleep(0.015, loop=self.loop))
+
+        # only the latest message of each topic is retransmitted
+        self.assertEqual([1, 2], self._numbers(self._drain(manager, 'S1')))
+
+
+class TestRetransmissions(BaseDeliveryManagerTest):
+    def setUp(self):
+        super().setUp()
+        self.manager = self._build_manager(
+            retransmission_window=2, retransmission_timeout=0.05
+        )
+
+        for number in range(5):
+            self.manager.put_message_nowait(
+                'S1', _data(number), ensure_delivery=True
+            )
+
+        self._drain(self.manager, 'S1')
+        self.retained = self.manager._retained['S1']
+
+    def test_window_limits_retransmissions(self):
+        # all timers are expired at once, but only two messages are sent
+        self._wait_for(lambda: self.retained.ready)
+
+        messages = self._drain(self.manager, 'S1')
+
+        self.assertEqual([0, 1], self._numbers(messages))
+        self.assertEqual(2, self.retained.in_flight)
+        self.assertEqual(3, len(self.retained.ready))
+
+    def test_window_moves_after_ack(self):
+        self._wait_for(lambda: len(self.retained.ready) == 3)
+        self._drain(self.manager, 'S1')
+
+        acked = self._run(self.manager.ack_delivery('S1', 1))
+        self._wait_for(lambda: len(self.retained.ready) == 2)
+
+        self.assertEqual(1, acked)
+        self.assertEqual([2], self._numbers(self._drain(self.manager, 'S1')))
+
+    def test_backoff_is_reset_after_progress(self):
+        item = self.retained.messages[5]
+
+        def delay() -> float:
+            return item.retransmit_at - item.sent_at
+
+        self.manager._retransmission_window = 5
+        self._wait_for(lambda: item.number_of_reschedules == 2)
+        self.assertAlmostEqual(0.1, delay())
+
+        epoch = self.retained.backoff_epoch
+        self._run(self.manager.ack_delivery('S1', 1))
+        self._wait_for(lambda: item.backoff_epoch != epoch)
+
+        self.assertEqual(1, item.number_of_reschedules)
+        self.assertAlmostEqual(0.05, delay())
+
+
+class TestAcknowledgements(BaseDeliveryManagerTest):
+    def setUp(self):
+        super().setUp()
+        self.manager = self._build_manager()
+
+        # messages with identifiers from 1 to 6
+        for number in range(6):
+            self.manager.put_message_nowait(
+                'S1', _data(number), ensure_delivery=True
+            )
+
+    def _ack(self, *args, **kwargs) -> int:
+        return self._run(self.manager.ack_delivery('S1', *args, **kwargs))
+
+    def _retained_ids(self) -> List[int]:
+        return list(self.manager._retained['S1'].messages)
+
+    def test_cumulative(self):
+        self.assertEqual(3, self._ack(up_to=3))
+        self.assertEqual([4, 5, 6], self._retained_ids())
+
+    def test_ranges(self):
+        self.assertEqual(4, self._ack(ranges=[(5, 6), (1, 2)]))
+        self.assertEqual([3, 4], self._retained_ids())
+
+    def test_overlapping_ranges(self):
+        self.assertEqual(4, self._ack(ranges=[(2, 4), (1, 3)]))
+        self.assertEqual([5, 6], self._retained_ids())
+
+    def test_already_acknowledged(self):
+        self.assertEqual(1, self._ack(1))
+        self.assertEqual(0, self._ack(1))
+        self.assertEqual(0, self._ack(up_to=1))
+        self.assertEqual(0, self._ack(ranges=[(0, 1)]))
+
+        # each message is counted only once
+        self.assertEqual(2, self._ack(2, up_to=3, ranges=[(1, 3)]))
+        self.assertEqual([4, 5, 6], self._retained_ids())
+
+    def test_unknown_session(self):
+        acked = self._run(self.manager.ack_delivery('S2', up_to=3))
+
+        self.assertEqual(0, acked)
+        self.assertEqual(6, len(self._retained_ids()))
+
+
+class TestResumption(BaseDeliveryManagerTest):
+    def setUp(self):
+        super().setUp()
+        self.manager = self._build_manager(replay_buffer_size=3)
+
+        # messages with sequence numbers from 1 to 5, all of them were sent
+        for number in range(5):
+            self.manager.put_message_nowait('S1', _data(number))
+
+        self._drain(self.manager, 'S1')
+        self._run(self.manager.pause_for('S1'))
+
+    def test_resume_inside_buffer(self):
+        for resume_from, expected in ((3, [4, 5]), (5, []), (2, [3, 4, 5])):
+            is_resumed = self._run(
+                self.manager.resume_for('S1', resume_from=resume_from)
+            )
+            messages = self._drain(self.manager, 'S1')
+
+            self.assertTrue(is_resumed)
+            self.assertEqual(expected, [message.seq for message in messages])
+
+    def test_resume_before_buffer(self):
+        self.manager.put_message_nowait('S1', _data(5))
+
+        is_resumed = self._run(self.manager.resume_for('S1', resume_from=1))
+
+        self.assertFalse(is_resumed)
+        self.assertEqual([], self._drain(self.manager, 'S1'))
+        self.assertEqual(6, self.manager.get_last_seq('S1'))
+
+    def test_resume_unknown_session(self):
+        self.assertTrue(self._run(self.manager.resume_for('S2')))
+        self.assertTrue(self._run(
+            self.manager.resume_for('S3', resume_from=0)
+        ))
+        self.assertFalse(self._run(
+            self.manager.resume_for('S4', resume_from=5)
+        ))
+        self.assertEqual(0, self.manager.get_last_seq('S4'))
+
+
+class TestRetainedLimit(BaseDeliveryManagerTest):
+    def setUp(self):
+        super().setUp()
+        self.manager = self._build_manager(max_retained_messages=3)
+
+        for number in range(2):
+            for session_id in ('S1', 'S2'):
+                self.manager.put_message_nowait(
+                    session_id, _data(number), ensure_delivery=True
+                )
+
+    def _retained(self, session_id: str) -> int:
+        return self.manager.get_gauges()[session_id]['retained']
+
+    def test_oldest_message_is_dropped(self):
+        self.assertEqual(1, self._retained('S1'))
+        self.assertEqual(2, self._retained('S2'))
+        self.assertEqual(
+            [2], list(self.manager._retained['S1'].messages)
+        )
+
+        # dropped messages are still available for replay
+        self._drain(self.manager, 'S1')
+        self._run(self.manager.pause_for('S1'))
+        is_resumed = self._run(self.manager.resume_for('S1', resume_from=0))
+
+        self.assertTrue(is_resumed)
+        self.assertEqual(
+            [0, 1], self._numbers(self._drain(self.manager, 'S1'))
+        )
+
+    def test_discarded_messages_are_not_counted(self):
+        self._run(self.manager.discard_for('S1'))
+        self.manager.put_message_nowait('S2', _data(2), ensure_delivery=True)
+
+        self.assertEqual(3, self._retained('S2'))
+
+
+class TestRestoredSessions(BaseDeliveryManagerTest):
+    def setUp(self):
+        super().setUp()
+        self._dir = tempfile.TemporaryDirectory()
+
+        manager = self._build_restored_manager()
+
+        for number in range(3):
+            manager.put_message_nowait(
+                'S1', _data(number), ensure_delivery=True
+            )
+
+        self._run(manager.ack_delivery('S1', 2))
+        self._run(manager.close())
+
+        self.manager = self._build_restored_manager()
+
+    def tearDown(self):
+        self._run(self.manager.close())
+        super().tearDown()
+        self._dir.cleanup()
+
+    def _build_restored_manager(self) -> DeliveryManager:
+        manager = self._build_manager(
+            retained_store=SegmentLogRetainedStore(
+                self._dir.name, loop=self.loop
+            )
+        )
+        self._run(manager.open())
+
+        return manager
+
+    def test_restore(self):
+        self.assertEqual(2, self.manager.get_gauges()['S1']['retained'])
+        self.assertEqual(3, self.manager.get_last_seq('S1'))
+
+    def test_restore_and_discard(self):
+        self._run(self.manager.discard_for('S1'))
+        self.assertEqual(set(), self.manager.list_sessions())
+
+        self._run(self.manager.close())
+        self.manager = self._build_restored_manager()
+
+        self.assertEqual(set(), self.manager.list_sessions())
+
+    def test_restore_and_reconnect(self):
+        is_resumed = self._run(self.manager.resume_for('S1'))
+        self._wait_for(lambda: self.manager.get_gauges()['S1']['pending'])
+
+        messages = self._drain(self.manager, 'S1')
+
+        self.assertTrue(is_resumed)
+        self.assertEqual([0, 2], self._numbers(messages))
+        self.assertEqual([1, 3], [message.message_id for message in messages])
+
+        self._run(self.manager.pause_for('S1'))
+        self._run(self.manager.discard_for('S1'))
+        self.assertEqual(set(), self.manager.list_sessions())
+
+
+if __name__ == '__main__':
+    unittest.main()
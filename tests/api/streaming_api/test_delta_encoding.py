@@ -0,0 +1,121 @@
+"""
+This module contains unit tests for DeltaEncoder
+"""
+
+import json
+import unittest
+
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.delta_encoding import DeltaEncoder, VersionedFrame
+
+
+def _build_message(topic: str, **body) -> Message:
+    return Message(
+        timestamp=1517232368.30256, type_='data', topic=topic, body=body
+    )
+
+
+DTO = {
+    'id': 'L1', 'state': 'off', 'is_active': False,
+    'commands': ['activate', 'deactivate', 'toggle']
+}
+
+
+class TestDeltaEncoder(unittest.TestCase):
+    def setUp(self):
+        self.encoder = DeltaEncoder()
+
+    def _publish(self, event_type='modified', **changes):
+        return self.encoder.build_frame(
+            _build_message('things/L1/%s' % event_type, **dict(DTO, **changes))
+        )
+
+    def _body(self, session_id, frame):
+        rendered = self.encoder.select(session_id, frame).render()
+        return json.loads(rendered)['body']
+
+    def test_first_update_is_full(self):
+        frame = self._publish(state='on')
+
+        self.assertIsInstance(frame, VersionedFrame)
+        self.assertEqual(
+            {'version': 1, 'object': dict(DTO, state='on')},
+            self._body('S1', frame)
+        )
+
+    def test_delta(self):
+        self._body('S1', self._publish())
+        body = self._body('S1', self._publish(state='on', is_active=True))
+
+        self.assertEqual({
+            'version': 2, 'base_version': 1,
+            'changed': {'state': 'on', 'is_active': True}, 'removed': []
+        }, body)
+
+    def test_version_gap_leads_to_full_update(self):
+        self._body('S1', self._publish())
+        self._publish(state='on')  # is not sent to S1, like if throttled
+
+        self.assertEqual(
+            {'version': 3, 'object': dict(DTO, state='off')},
+            self._body('S1', self._publish(state='off'))
+        )
+
+    def test_skipped_update_leads_to_full_update(self):
+        self._body('S1', self._publish())
+        self.encoder.skip_update('things/L1/modified')
+
+        frame = self._publish(state='on')
+
+        self.assertIsNone(frame.previous)
+        self.assertEqual(
+            {'version': 3, 'object': dict(DTO, state='on')},
+            self._body('S1', frame)
+        )
+
+    def test_variants_are_shared(self):
+        first = self._publish()
+        self._body('S1', first)
+        self._body('S2', first)
+        frame = self._publish(state='on')
+
+        self.assertIs(
+            self.encoder.select('S1', frame), self.encoder.select('S2', frame)
+        )
+
+    def test_original_frame_is_not_changed(self):
+        frame = self._publish(state='on')
+
+        self.assertEqual(
+            dict(DTO, state='on'), json.loads(frame.render())['body']
+        )
+
+    def test_deletion_resets_versions(self):
+        self._body('S1', self._publish())
+        self.encoder.build_frame(_build_message('things/L1/deleted'))
+
+        self.assertEqual(0, self.encoder.get_version('things/L1'))
+        self.assertEqual(
+            {'version': 1, 'object': DTO},
+            self._body('S1', self._publish(event_type='added'))
+        )
+
+    def test_snapshot_and_forget(self):
+        self._publish()
+        self.encoder.set_known('S1', 'things/L1', 1)
+
+        self.assertIn('changed', self._body('S1', self._publish(state='on')))
+
+        self.encoder.forget('S1', 'things/+/modified')
+
+        self.assertIn('object', self._body('S1', self._publish(state='off')))
+
+    def test_not_object_topics(self):
+        frame = self.encoder.build_frame(_build_message('system/status'))
+
+        self.assertNotIsInstance(frame, VersionedFrame)
+        self.assertIs(frame, self.encoder.select('S1', frame))
+
+
+if __name__ == '__main__':
+    unittest.main()
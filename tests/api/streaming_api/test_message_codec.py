@@ -0,0 +1,118 @@
+"""
+This module contains unit tests for codecs of Streaming API Messages
+"""
+
+import json
+import unittest
+
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.message_json import SharedFrame, FramedMessage
+from dpl.api.streaming_api.message_codec import (
+    CODECS, JSON_CODEC, FrameDecodeError, UnsupportedCodecError, get_codec
+)
+
+
+class TestMessageCodecs(unittest.TestCase):
+    def setUp(self):
+        self.message = Message(
+            timestamp=1517232368.30256, type_='data',
+            topic='things/L1/modified', body={'id': 'L1', 'state': 'on'}
+        )
+        self.expected = {
+            'timestamp': 1517232368.30256, 'type': 'data',
+            'topic': 'things/L1/modified', 'body': {'id': 'L1', 'state': 'on'},
+            'message_id': 3, 'seq': 3
+        }
+
+    def _check_round_trip(self, codec):
+        frame = SharedFrame(self.message)
+
+        for _ in range(2):  # the second time the shared content is reused
+            framed = FramedMessage(frame, message_id=3, seq=3)
+            self.assertEqual(codec.decode(codec.encode(framed)), self.expected)
+
+        tracked = Message(
+            timestamp=self.message.timestamp, type_=self.message.type,
+            topic=self.message.topic, body=self.message.body,
+            message_id=3, seq=3
+        )
+        self.assertEqual(codec.decode(codec.encode(tracked)), self.expected)
+
+    def test_json_by_default(self):
+        self.assertIs(get_codec(), JSON_CODEC)
+        self.assertFalse(JSON_CODEC.is_binary)
+
+    def test_all_available_codecs(self):
+        for name in CODECS:
+            with self.subTest(codec=name):
+                self._check_round_trip(get_codec(name))
+
+    def test_compression(self):
+        for name in CODECS:
+            with self.subTest(codec=name):
+                codec = get_codec(name, 'zlib')
+                self.assertTrue(codec.is_binary)
+                self.assertEqual(codec.compression, 'zlib')
+                self._check_round_trip(codec)
+
+    def test_batch(self):
+        frame = SharedFrame(self.message)
+        messages = [
+            FramedMessage(frame, message_id=3, seq=3),
+            FramedMessage(frame, seq=4)
+        ]
+        second = dict(self.expected, seq=4)
+        del second['message_id']
+
+        for name in CODECS:
+            for compression in (None, 'zlib'):
+                with self.subTest(codec=name, compression=compression):
+                    codec = get_codec(name, compression)
+                    batch = codec.decode(codec.encode_batch(1.5, messages))
+
+                    self.assertEqual(batch['type'], 'control')
+                    self.assertEqual(batch['topic'], 'batch')
+                    self.assertEqual(
+                        batch['body']['messages'], [self.expected, second]
+                    )
+
+    def test_invalid_compressed_content(self):
+        codec = get_codec(compression='zlib')
+
+        with self.assertRaises(FrameDecodeError):
+            codec.decode(b'definitely not zlib')
+
+    def test_json_error_is_preserved(self):
+        with self.assertRaises(json.JSONDecodeError):
+            JSON_CODEC.decode('{')
+
+    def test_unsupported(self):
+        with self.assertRaises(UnsupportedCodecError):
+            get_codec('xml')
+
+        with self.assertRaises(UnsupportedCodecError):
+            get_codec(compression='lzma')
+
+    @unittest.skipUnless('msgpack' in CODECS, "msgpack is not installed")
+    def test_msgpack_map_is_valid(self):
+        import msgpack
+
+        codec = get_codec('msgpack')
+        framed = FramedMessage(SharedFrame(self.message), message_id=3, seq=3)
+
+        self.assertEqual(
+            msgpack.unpackb(codec.encode(framed), raw=False), self.expected
+        )
+
+    @unittest.skipUnless('cbor' in CODECS, "cbor2 is not installed")
+    def test_cbor_map_is_valid(self):
+        import cbor2
+
+        codec = get_codec('cbor')
+        framed = FramedMessage(SharedFrame(self.message), message_id=3, seq=3)
+
+        self.assertEqual(cbor2.loads(codec.encode(framed)), self.expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
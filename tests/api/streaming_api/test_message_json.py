@@ -0,0 +1,72 @@
+"""
+This module contains unit tests for encoding of Streaming API Messages
+"""
+
+import json
+import unittest
+
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.message_json import (
+    message_dumps, SharedFrame, FramedMessage
+)
+
+
+class TestSharedFrame(unittest.TestCase):
+    def setUp(self):
+        self.message = Message(
+            timestamp=1517232368.30256, type_='data',
+            topic='things/L1/modified', body={'id': 'L1', 'state': 'on'}
+        )
+        self.frame = SharedFrame(self.message)
+
+    def test_same_content(self):
+        framed = FramedMessage(self.frame)
+
+        self.assertEqual(
+            json.loads(message_dumps(self.message)),
+            json.loads(message_dumps(framed))
+        )
+
+    def test_message_id_added(self):
+        framed = FramedMessage(self.frame)
+        framed.message_id = 42
+        self.message.message_id = 42
+
+        self.assertEqual(
+            json.loads(message_dumps(self.message)),
+            json.loads(message_dumps(framed))
+        )
+
+    def test_seq_added(self):
+        framed = FramedMessage(self.frame, message_id=7, seq=7)
+        self.message.message_id = 7
+        self.message.seq = 7
+
+        self.assertEqual(
+            json.loads(message_dumps(self.message)),
+            json.loads(message_dumps(framed))
+        )
+
+        framed = FramedMessage(self.frame, seq=8)
+
+        self.assertEqual(json.loads(message_dumps(framed))['seq'], 8)
+
+    def test_frame_is_not_altered(self):
+        tracked = FramedMessage(self.frame, message_id=1)
+        untracked = FramedMessage(self.frame)
+
+        self.assertIn('message_id', json.loads(message_dumps(tracked)))
+        self.assertNotIn('message_id', json.loads(message_dumps(untracked)))
+
+    def test_message_properties(self):
+        framed = FramedMessage(self.frame)
+
+        self.assertEqual(self.message.timestamp, framed.timestamp)
+        self.assertEqual(self.message.type, framed.type)
+        self.assertEqual(self.message.topic, framed.topic)
+        self.assertEqual(self.message.body, framed.body)
+        self.assertIsNone(framed.message_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
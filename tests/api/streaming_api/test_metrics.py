@@ -0,0 +1,137 @@
+"""
+This module contains unit tests for collection and rendering of delivery
+metrics
+"""
+
+import unittest
+
+from dpl.api.streaming_api.metrics import (
+    Histogram, StreamingMetrics, build_diagnostics, render_text
+)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(
+            [(0.1, 2), (1.0, 3), (float('inf'), 4)], histogram.buckets()
+        )
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(2.65, histogram.sum)
+
+    def test_quantile(self):
+        histogram = Histogram(bounds=(1.0, 2.0, 4.0))
+        self.assertEqual(0.0, histogram.quantile(0.5))
+
+        for _ in range(50):
+            histogram.observe(0.5)
+
+        for _ in range(50):
+            histogram.observe(3.0)
+
+        self.assertAlmostEqual(1.0, histogram.quantile(0.5))
+        self.assertAlmostEqual(3.96, histogram.quantile(0.99))
+
+        histogram.observe(10.0)
+        self.assertEqual(4.0, histogram.quantile(1.0))
+
+    def test_merge(self):
+        first = Histogram(bounds=(1.0, ))
+        second = Histogram(bounds=(1.0, ))
+        first.observe(0.5)
+        second.observe(5.0)
+
+        first.merge(second)
+
+        self.assertEqual([(1.0, 1), (float('inf'), 2)], first.buckets())
+        self.assertEqual(5.5, first.sum)
+
+
+class TestStreamingMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = StreamingMetrics()
+        self.metrics.on_sent('S1', messages=3, size=300)
+        self.metrics.on_sent('S2', messages=1, size=50)
+        self.metrics.on_retransmitted('S1', 2)
+        self.metrics.on_dropped('S2')
+        self.metrics.on_acknowledged('S1', [0.01, 0.02])
+        self.metrics.observe_send_latency('S2', 0.003)
+
+    def test_total(self):
+        total = self.metrics.total()
+
+        self.assertEqual(2, total.frames_sent)
+        self.assertEqual(4, total.messages_sent)
+        self.assertEqual(350, total.bytes_sent)
+        self.assertEqual(2, total.retransmissions)
+        self.assertEqual(1, total.dropped)
+        self.assertEqual(2, total.acknowledged)
+        self.assertEqual(2, total.ack_latency.count)
+        self.assertEqual(1, total.send_latency.count)
+
+    def test_forget_keeps_aggregated_values(self):
+        self.metrics.forget('S1')
+
+        self.assertEqual(['S2'], [sid for sid, _ in self.metrics.sessions()])
+        self.assertEqual(350, self.metrics.total().bytes_sent)
+
+    def test_diagnostics(self):
+        gauges = {
+            'S1': {'pending': 4, 'retained': 2},
+            'S3': {'pending': 1, 'retained': 0}
+        }
+
+        report = build_diagnostics(self.metrics, gauges)
+
+        self.assertEqual(3, report['total']['sessions'])
+        self.assertEqual(5, report['total']['pending'])
+        self.assertEqual(300, report['sessions']['S1']['bytes_sent'])
+        self.assertEqual(4, report['sessions']['S1']['pending'])
+        self.assertEqual(0, report['sessions']['S3']['frames_sent'])
+        self.assertEqual(2, report['sessions']['S1']['ack_latency']['count'])
+
+    def test_render_text(self):
+        text = render_text(self.metrics, {'S1': {'pending': 4}})
+        lines = text.splitlines()
+
+        self.assertIn(
+            '# TYPE everpl_streaming_bytes_sent_total counter', lines
+        )
+        self.assertIn('everpl_streaming_bytes_sent_total 350', lines)
+        self.assertIn(
+            'everpl_streaming_session_bytes_sent_total{session="S1"} 300',
+            lines
+        )
+        self.assertIn(
+            'everpl_streaming_ack_latency_seconds_bucket{le="+Inf"} 2', lines
+        )
+        self.assertIn(
+            'everpl_streaming_session_ack_latency_seconds_count'
+            '{session="S1"} 2', lines
+        )
+        self.assertIn('everpl_streaming_pending 4', lines)
+        self.assertIn(
+            'everpl_streaming_session_pending{session="S1"} 4', lines
+        )
+        self.assertTrue(text.endswith('\n'))
+
+    def test_evictions(self):
+        self.metrics.on_evicted('S1', 3)
+        self.metrics.on_session_evicted()
+        self.metrics.forget('S1')
+
+        report = build_diagnostics(self.metrics, {})
+        lines = render_text(self.metrics, {}).splitlines()
+
+        self.assertEqual(3, report['total']['evicted'])
+        self.assertEqual(1, report['total']['evicted_sessions'])
+        self.assertIn('everpl_streaming_evicted_total 3', lines)
+        self.assertIn('everpl_streaming_evicted_sessions_total 1', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
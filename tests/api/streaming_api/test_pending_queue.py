@@ -0,0 +1,174 @@
+"""
+This module contains unit tests for PendingQueue
+"""
+
+import asyncio
+import unittest
+
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.pending_queue import (
+    PendingQueue, OverflowPolicy, PendingQueueOverflowError
+)
+
+
+def _build_message(type_: str, topic: str, number: int = 0) -> Message:
+    return Message(
+        timestamp=1517232368.30256, type_=type_, topic=topic,
+        body={'number': number}
+    )
+
+
+def _data(number: int, topic: str = 'things/L1/modified') -> Message:
+    return _build_message('data', topic, number)
+
+
+def _control(topic: str = 'subscribe_ack') -> Message:
+    return _build_message('control', topic)
+
+
+class TestPendingQueue(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _build_queue(self, max_size: int = 100, **kwargs) -> PendingQueue:
+        return PendingQueue(max_size=max_size, loop=self.loop, **kwargs)
+
+    def test_control_messages_go_first(self):
+        queue = self._build_queue()
+        queue.put_nowait(_data(1))
+        queue.put_nowait(_data(2), is_retransmission=True)
+        ack = _control()
+        queue.put_nowait(ack)
+
+        messages = queue.drain_nowait(10)
+
+        self.assertIs(ack, messages[0])
+        self.assertEqual(3, len(messages))
+        self.assertTrue(queue.empty())
+
+    def test_snapshots_keep_order_with_data(self):
+        queue = self._build_queue()
+        queue.put_nowait(_data(1))
+        snapshot = _control('snapshot')
+        queue.put_nowait(snapshot)
+        ack = _control()
+        queue.put_nowait(ack)
+        queue.put_nowait(_data(2))
+
+        messages = queue.drain_nowait(10)
+
+        self.assertIs(ack, messages[0])
+        self.assertEqual(1, messages[1].body['number'])
+        self.assertIs(snapshot, messages[2])
+        self.assertEqual(2, messages[3].body['number'])
+
+    def test_overflow_keeps_snapshots(self):
+        queue = self._build_queue(max_size=2, policy=OverflowPolicy.conflate)
+        snapshot = _control('snapshot')
+        queue.put_nowait(snapshot)
+        queue.put_nowait(_data(1))
+
+        dropped = queue.put_nowait(_control('snapshot'))
+
+        self.assertEqual(1, dropped.body['number'])
+        self.assertIs(snapshot, queue.drain_nowait(1)[0])
+
+    def test_weighted_fairness(self):
+        queue = self._build_queue(retransmission_weight=1, data_weight=2)
+
+        for number in range(6):
+            queue.put_nowait(_data(number))
+            queue.put_nowait(_data(-number), is_retransmission=True)
+
+        numbers = [m.body['number'] for m in queue.drain_nowait(12)]
+
+        self.assertEqual(
+            [0, 0, 1, -1, 2, 3, -2, 4, 5, -3, -4, -5], numbers
+        )
+
+    def test_get(self):
+        queue = self._build_queue()
+        queue.put_nowait(_data(1))
+        ack = _control()
+        queue.put_nowait(ack)
+
+        first = self.loop.run_until_complete(queue.get())
+
+        self.assertIs(ack, first)
+        self.assertEqual(1, queue.qsize())
+
+    def test_drop_oldest(self):
+        queue = self._build_queue(max_size=2)
+        queue.put_nowait(_data(1))
+        queue.put_nowait(_data(2))
+
+        dropped = queue.put_nowait(_data(3))
+
+        self.assertEqual(1, dropped.body['number'])
+        self.assertEqual(
+            [2, 3], [m.body['number'] for m in queue.drain_nowait(5)]
+        )
+
+    def test_overflow_drops_retransmissions_first(self):
+        queue = self._build_queue(max_size=3)
+        queue.put_nowait(_data(1))
+        queue.put_nowait(_data(2), is_retransmission=True)
+        queue.put_nowait(_control())
+
+        dropped = queue.put_nowait(_data(3))
+
+        self.assertEqual(2, dropped.body['number'])
+        self.assertEqual(3, queue.qsize())
+        self.assertEqual(3, queue.high_water_mark)
+
+    def test_overflow_keeps_control_messages(self):
+        queue = self._build_queue(max_size=2)
+        ack = _control()
+        queue.put_nowait(ack)
+        queue.put_nowait(_data(1))
+
+        dropped = queue.put_nowait(_data(2))
+
+        self.assertEqual(1, dropped.body['number'])
+        self.assertIs(ack, queue.drain_nowait(1)[0])
+
+    def test_conflate(self):
+        queue = self._build_queue(max_size=3, policy=OverflowPolicy.conflate)
+        queue.put_nowait(_data(1, topic='things/L1/modified'))
+        queue.put_nowait(_data(2, topic='things/L2/modified'))
+        queue.put_nowait(_data(3, topic='things/L3/modified'))
+
+        dropped = queue.put_nowait(_data(4, topic='things/L2/modified'))
+
+        self.assertEqual(2, dropped.body['number'])
+        self.assertEqual(
+            [1, 3, 4], [m.body['number'] for m in queue.drain_nowait(3)]
+        )
+
+    def test_disconnect(self):
+        queue = self._build_queue(
+            max_size=1, policy=OverflowPolicy.disconnect
+        )
+        queue.put_nowait(_data(1))
+
+        with self.assertRaises(PendingQueueOverflowError):
+            queue.put_nowait(_control())
+
+    def test_replace(self):
+        queue = self._build_queue()
+        queue.put_nowait(_control())
+        queue.put_nowait(_data(1), is_retransmission=True)
+
+        queue.replace([_data(5), _data(6)])
+
+        self.assertEqual(
+            [5, 6], [m.body['number'] for m in queue.drain_nowait(5)]
+        )
+        self.assertTrue(queue.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
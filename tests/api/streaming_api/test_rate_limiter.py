@@ -0,0 +1,129 @@
+"""
+This module contains unit tests for RateLimiter
+"""
+
+import unittest
+
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.message_json import SharedFrame
+from dpl.api.streaming_api.rate_limiter import RateLimiter, RateLimitMode
+
+
+class FakeTimer(object):
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop(object):
+    """
+    Executes scheduled callbacks only when the time is advanced manually
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+
+    def call_later(self, delay, callback, *args):
+        timer = FakeTimer(self.now + delay, callback, args)
+        self.timers.append(timer)
+        return timer
+
+    def advance(self, delta):
+        self.now += delta
+
+        due = sorted(
+            (t for t in self.timers if t.when <= self.now and not t.cancelled),
+            key=lambda t: t.when
+        )
+
+        for timer in due:
+            self.timers.remove(timer)
+            timer.callback(*timer.args)
+
+
+def _build_frame(number: int) -> SharedFrame:
+    return SharedFrame(Message(
+        timestamp=1517232368.30256, type_='data',
+        topic='things/V1/modified', body={'value': number}
+    ))
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.loop = FakeLoop()
+        self.delivered = []
+        self.limiter = RateLimiter(
+            loop=self.loop, deliver=lambda session_id, topic, frame:
+            self.delivered.append((session_id, frame.message.body['value']))
+        )
+
+    def _submit(self, number, mode, session_id='S1',
+                topic='things/V1/modified'):
+        self.limiter.submit(
+            session_id, topic, _build_frame(number),
+            min_interval=1.0, mode=mode
+        )
+
+    def test_throttle_latest(self):
+        self._submit(1, RateLimitMode.throttle)
+        self.assertEqual([('S1', 1)], self.delivered)
+
+        for number in (2, 3, 4):
+            self._submit(number, RateLimitMode.throttle)
+
+        self.loop.advance(0.5)
+        self.assertEqual([('S1', 1)], self.delivered)
+
+        self.loop.advance(0.5)
+        self.assertEqual([('S1', 1), ('S1', 4)], self.delivered)
+
+        # the interval is restarted after the delivery of the latest message
+        self._submit(5, RateLimitMode.throttle)
+        self.loop.advance(1.0)
+        self.assertEqual([('S1', 1), ('S1', 4), ('S1', 5)], self.delivered)
+
+    def test_throttle_expires(self):
+        self._submit(1, RateLimitMode.throttle)
+        self.loop.advance(1.0)
+
+        self.assertEqual({}, self.limiter._slots)
+
+        self._submit(2, RateLimitMode.throttle)
+        self.assertEqual([('S1', 1), ('S1', 2)], self.delivered)
+
+    def test_debounce(self):
+        for number in (1, 2, 3):
+            self._submit(number, RateLimitMode.debounce)
+            self.loop.advance(0.5)
+
+        self.assertEqual([], self.delivered)
+
+        self.loop.advance(0.5)
+        self.assertEqual([('S1', 3)], self.delivered)
+        self.assertEqual({}, self.limiter._slots)
+
+    def test_topics_and_sessions_are_independent(self):
+        self._submit(1, RateLimitMode.throttle)
+        self._submit(2, RateLimitMode.throttle, topic='things/V2/modified')
+        self._submit(3, RateLimitMode.throttle, session_id='S2')
+
+        self.assertEqual([('S1', 1), ('S1', 2), ('S2', 3)], self.delivered)
+
+    def test_discard_for(self):
+        self._submit(1, RateLimitMode.throttle)
+        self._submit(2, RateLimitMode.throttle)
+        self._submit(3, RateLimitMode.debounce, topic='things/V2/modified')
+
+        self.limiter.discard_for('S1')
+        self.loop.advance(1.0)
+
+        self.assertEqual([('S1', 1)], self.delivered)
+
+
+if __name__ == '__main__':
+    unittest.main()
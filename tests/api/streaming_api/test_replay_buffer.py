@@ -0,0 +1,68 @@
+"""
+This module contains unit tests for ReplayBuffer
+"""
+
+import unittest
+
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.replay_buffer import (
+    ReplayBuffer, ReplayOffsetError
+)
+
+
+def _build_message(number: int) -> Message:
+    return Message(
+        timestamp=1517232368.30256, type_='data',
+        topic='things/L1/modified', body={'number': number}
+    )
+
+
+class TestReplayBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = ReplayBuffer(max_size=3)
+
+    def _append(self, count: int) -> None:
+        for number in range(count):
+            self.buffer.append(_build_message(number))
+
+    def test_sequence_numbers(self):
+        self._append(5)
+
+        self.assertEqual(self.buffer.last_seq, 5)
+        self.assertEqual(len(self.buffer), 3)
+
+    def test_missed_suffix(self):
+        self._append(5)
+
+        self.assertEqual([m.seq for m in self.buffer.since(2)], [3, 4, 5])
+        self.assertEqual([m.seq for m in self.buffer.since(4)], [5])
+        self.assertEqual(self.buffer.since(5), [])
+
+    def test_aged_out_offset(self):
+        self._append(5)
+
+        with self.assertRaises(ReplayOffsetError):
+            self.buffer.since(1)
+
+    def test_future_offset(self):
+        self._append(2)
+
+        with self.assertRaises(ReplayOffsetError):
+            self.buffer.since(3)
+
+    def test_empty_buffer(self):
+        self.assertEqual(self.buffer.since(0), [])
+
+    def test_restored_sequence(self):
+        self.buffer.last_seq = 10
+        self._append(1)
+
+        self.assertEqual(self.buffer.last_seq, 11)
+        self.assertEqual([m.seq for m in self.buffer.since(10)], [11])
+
+        with self.assertRaises(ReplayOffsetError):
+            self.buffer.since(9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+This module contains unit tests for SegmentLogRetainedStore
+"""
+
+import asyncio
+import tempfile
+import unittest
+
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.segment_log_retained_store import (
+    SegmentLogRetainedStore
+)
+
+
+def _build_message(message_id: int) -> Message:
+    message = Message(
+        timestamp=1517232368.30256, type_='data',
+        topic='things/L1/modified', body={'number': message_id}
+    )
+    message.message_id = message_id
+
+    return message
+
+
+class TestSegmentLogRetainedStore(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.loop = asyncio.new_event_loop()
+        self.store = SegmentLogRetainedStore(
+            self._dir.name, loop=self.loop, flush_interval=0,
+            compaction_threshold=5
+        )
+        self._run(self.store.open())
+
+    def tearDown(self):
+        self._run(self.store.close())
+        self.loop.close()
+        self._dir.cleanup()
+
+    def _run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def _flush(self) -> None:
+        # lets the background flusher to run a few times
+        for _ in range(3):
+            self._run(asyncio.sleep(0.01, loop=self.loop))
+
+    def test_load(self):
+        for message_id in range(3):
+            self.store.add('S1', _build_message(message_id), False)
+
+        self.store.remove('S1', [1])
+        self._flush()
+
+        records = list(self.store.load())
+
+        self.assertEqual(
+            [('S1', 0, False), ('S1', 2, False)],
+            [(session_id, message.message_id, conflate)
+             for session_id, message, conflate in records]
+        )
+
+    def test_discard_triggers_compaction(self):
+        for message_id in range(10):
+            self.store.add('S1', _build_message(message_id), False)
+
+        self.store.add('S2', _build_message(0), True)
+        self._flush()
+        self.assertFalse(self.store._needs_compaction())
+
+        self.store.discard('S1')
+        self.assertTrue(self.store._needs_compaction())
+        self._flush()
+
+        self.assertFalse(self.store._needs_compaction())
+        self.assertEqual(
+            [('S2', 0)],
+            [(session_id, message.message_id)
+             for session_id, message, _ in self.store.load()]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,323 @@
+"""
+This module contains unit tests for StreamingApiProvider
+"""
+
+import asyncio
+import tempfile
+import unittest
+from typing import List, Mapping
+from unittest import mock
+
+from dpl.auth.abs_auth_service import AbsAuthService
+from dpl.auth.auth_context import AuthContext
+from dpl.events.event_hub import EventHub
+from dpl.events.object_related_event import ObjectRelatedEvent
+from dpl.services.abs_thing_service import AbsThingService
+from dpl.services.service_exceptions import (
+    ServiceEntityResolutionError, ServiceUnsupportedCommandError
+)
+from dpl.api.streaming_api.delivery_manager import DeliveryManager
+from dpl.api.streaming_api.message import Message
+from dpl.api.streaming_api.message_utils import build_message
+from dpl.api.streaming_api.segment_log_retained_store import (
+    SegmentLogRetainedStore
+)
+from dpl.api.streaming_api.streaming_api_provider import StreamingApiProvider
+from dpl.api.streaming_api.streaming_flow_error import StreamingFlowError
+
+
+class BaseStreamingApiProviderTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.event_hub = EventHub()
+        self.thing_service = mock.Mock(spec_set=AbsThingService)
+        self.thing_service.view_all.return_value = [
+            {'id': 'L1'}, {'id': 'L2'}
+        ]
+        self.provider = self._build_provider()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def _build_provider(self, **kwargs) -> StreamingApiProvider:
+        return StreamingApiProvider(
+            auth_context=AuthContext(),
+            auth_service=mock.Mock(spec_set=AbsAuthService),
+            loop=self.loop, thing_service=self.thing_service, **kwargs
+        )
+
+    def _connect(self, session_id: str) -> None:
+        self.provider._active_sessions[session_id] = (
+            mock.Mock(), mock.Mock()
+        )
+
+    def _subscribe(self, session_id: str, target_topic: str, **kwargs):
+        body = {'target_topic': target_topic}
+        body.update(kwargs)
+        message = build_message(type_='control', topic='subscribe', body=body)
+
+        self._run(
+            self.provider._handle_subscription_message(message, session_id)
+        )
+
+    def _publish(self, topic: str) -> None:
+        object_id = topic.split('/')[1]
+        self.provider.update(
+            self.event_hub, ObjectRelatedEvent(topic, {'id': object_id})
+        )
+
+    def _drain(self, session_id: str) -> List[Message]:
+        delivery_manager = self.provider._delivery_manager
+
+        return delivery_manager._get_pending_queue(session_id).drain_nowait(
+            1000
+        )
+
+
+class TestSubscriptions(BaseStreamingApiProviderTest):
+    def test_snapshot_keeps_order_with_updates(self):
+        self._connect('S1')
+        self._subscribe('S1', 'things/L1/#')
+        self._publish('things/L1/modified')
+        self._subscribe('S1', 'things/+/modified', with_snapshot=True)
+        self._publish('things/L2/modified')
+
+        messages = self._drain('S1')
+
+        # acknowledgements are sent first, the snapshot is sent after the
+        # update published before the subscription and before the next one
+        self.assertEqual(
+            ['subscribe_ack', 'subscribe_ack', 'things/L1/modified',
+             'snapshot', 'things/L2/modified'],
+            [message.topic for message in messages]
+        )
+        self.assertEqual(
+            ['things/L1/modified', 'things/L2/modified'],
+            [item['topic'] for item in messages[3].body['objects']]
+        )
+
+    def test_invalid_pattern(self):
+        self._connect('S1')
+
+        for pattern in ('things/#/modified', '#/modified'):
+            with self.subTest(pattern=pattern):
+                with self.assertRaises(StreamingFlowError):
+                    self._subscribe('S1', pattern)
+
+        self.assertEqual([], self._drain('S1'))
+
+
+class TestExecute(BaseStreamingApiProviderTest):
+    def setUp(self):
+        super().setUp()
+        self._connect('S1')
+
+    def _execute(self, **body) -> Message:
+        message = build_message(type_='control', topic='execute', body=body)
+        self._run(self.provider._handle_execute_message(message, 'S1'))
+
+        replies = self._drain('S1')
+        self.assertEqual(1, len(replies))
+
+        return replies[0]
+
+    def test_execute_ack(self):
+        for correlation_id in ('c1', 42):
+            with self.subTest(correlation_id=correlation_id):
+                reply = self._execute(
+                    correlation_id=correlation_id, thing_id='L1',
+                    command='on', command_args={}
+                )
+
+                self.assertEqual('execute_ack', reply.topic)
+                self.assertEqual(
+                    {'correlation_id': correlation_id}, reply.body
+                )
+
+        self.thing_service.send_command.assert_called_with(
+            to_actuator_id='L1', command='on', command_args={}
+        )
+
+    def test_execute_error(self):
+        self.thing_service.send_command.side_effect = (
+            ServiceEntityResolutionError()
+        )
+        reply = self._execute(
+            correlation_id='c2', thing_id='unknown', command='on',
+            command_args={}
+        )
+
+        self.assertEqual('execute_error', reply.topic)
+        self.assertEqual('c2', reply.body['correlation_id'])
+        self.assertEqual(1005, reply.body['error']['error_id'])
+
+        self.thing_service.send_command.side_effect = (
+            ServiceUnsupportedCommandError()
+        )
+        reply = self._execute(
+            correlation_id='c3', thing_id='L1', command='fly',
+            command_args={}
+        )
+
+        self.assertEqual('c3', reply.body['correlation_id'])
+        self.assertEqual(3110, reply.body['error']['error_id'])
+
+    def test_invalid_arguments(self):
+        reply = self._execute(
+            correlation_id='c4', thing_id='L1', command=1, command_args={}
+        )
+
+        self.assertEqual('execute_error', reply.topic)
+        self.assertEqual(3101, reply.body['error']['error_id'])
+        self.thing_service.send_command.assert_not_called()
+
+    def test_invalid_message(self):
+        for body in ({'thing_id': 'L1', 'command': 'on'},
+                     {'correlation_id': True, 'thing_id': 'L1'},
+                     {'correlation_id': 'c5', 'thing_id': 1},
+                     {'correlation_id': 'c6'}):
+            message = build_message(
+                type_='control', topic='execute', body=body
+            )
+
+            with self.subTest(body=body):
+                with self.assertRaises(StreamingFlowError):
+                    self._run(
+                        self.provider._handle_execute_message(message, 'S1')
+                    )
+
+        self.assertEqual([], self._drain('S1'))
+        self.thing_service.send_command.assert_not_called()
+
+
+class TestEviction(BaseStreamingApiProviderTest):
+    SESSION_TTL = 10
+
+    def setUp(self):
+        super().setUp()
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._run(self.provider.stop())
+        # lets cancelled retransmission handlers to finish
+        self._run(asyncio.sleep(0.01, loop=self.loop))
+        super().tearDown()
+        self._dir.cleanup()
+
+    def _build_store(self) -> SegmentLogRetainedStore:
+        return SegmentLogRetainedStore(self._dir.name, loop=self.loop)
+
+    def _expire(self, session_id: str) -> None:
+        self.provider._inactive_since[session_id] = \
+            self.loop.time() - self.SESSION_TTL - 1
+
+    def test_ttl_expiry(self):
+        self.provider = self._build_provider(session_ttl=self.SESSION_TTL)
+        self._run(self.provider.start())
+
+        for session_id in ('S1', 'S2'):
+            self._subscribe(session_id, 'things/#', retain_messages=True)
+            self.provider._inactive_since[session_id] = self.loop.time()
+
+        self._publish('things/L1/modified')
+        self._expire('S1')
+
+        evicted = self._run(self.provider._evict_inactive_sessions())
+        self.assertEqual(1, evicted)
+        self.assertEqual(0, self.provider._subs_storage.count_for('S1'))
+        self.assertEqual(1, self.provider._subs_storage.count_for('S2'))
+        self.assertEqual(
+            {'S2'}, self.provider._delivery_manager.list_sessions()
+        )
+
+        # the client of the evicted Session must resync its state
+        is_resumed = self._run(
+            self.provider._register_session('S1', ws=mock.Mock())
+        )
+        self.assertFalse(is_resumed)
+
+        self._run(self.provider._delivery_manager.pause_for('S1'))
+        self.assertTrue(self._run(
+            self.provider._register_session('S2', ws=mock.Mock())
+        ))
+        self._run(self.provider._delivery_manager.pause_for('S2'))
+
+    def test_failed_eviction(self):
+        self.provider = self._build_provider(session_ttl=self.SESSION_TTL)
+        delivery_manager = self.provider._delivery_manager
+        discard_for = delivery_manager.discard_for
+
+        async def failing_discard_for(session_id):
+            if session_id == 'S1':
+                raise OSError("Simulated failure")
+
+            await discard_for(session_id)
+
+        for session_id in ('S1', 'S2'):
+            self._subscribe(session_id, 'things/#')
+            self._expire(session_id)
+
+        with mock.patch.object(
+                delivery_manager, 'discard_for', failing_discard_for
+        ):
+            evicted = self._run(self.provider._evict_inactive_sessions())
+
+        # S1 is kept to be evicted again on the next check
+        self.assertEqual(1, evicted)
+        self.assertEqual(1, self.provider._subs_storage.count_for('S1'))
+        self.assertEqual(0, self.provider._subs_storage.count_for('S2'))
+        self.assertEqual({'S1'}, set(self.provider._inactive_since))
+
+        evicted = self._run(self.provider._evict_inactive_sessions())
+        self.assertEqual(1, evicted)
+
+    def test_restored_sessions(self):
+        delivery_manager = DeliveryManager(
+            loop=self.loop, retained_store=self._build_store()
+        )
+        self._run(delivery_manager.open())
+
+        for session_id in ('S1', 'S2'):
+            delivery_manager.put_message_nowait(
+                session_id, Message(
+                    timestamp=1517232368.30256, type_='data',
+                    topic='things/L1/modified', body={'id': 'L1'}
+                ), ensure_delivery=True
+            )
+
+        self._run(delivery_manager.pause_for('S1'))
+        self._run(delivery_manager.pause_for('S2'))
+        self._run(delivery_manager.close())
+
+        self.provider = self._build_provider(
+            session_ttl=self.SESSION_TTL, retained_store=self._build_store()
+        )
+        self._run(self.provider.start())
+        self._expire('S1')
+
+        evicted = self._run(self.provider._evict_inactive_sessions())
+        self.assertEqual(1, evicted)
+        self._run(self.provider.invalidate_session('S2'))
+
+        self.assertEqual(
+            set(), self.provider._delivery_manager.list_sessions()
+        )
+        self.assertEqual({}, self.provider._inactive_since)
+
+        # discarded messages are not restored again
+        self._run(self.provider.stop())
+        self.provider = self._build_provider(
+            retained_store=self._build_store()
+        )
+        self._run(self.provider.start())
+
+        self.assertEqual(
+            set(), self.provider._delivery_manager.list_sessions()
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+"""
+This module contains unit tests for SubscriptionStorage
+"""
+
+import unittest
+
+from dpl.api.streaming_api.rate_limiter import RateLimitMode
+from dpl.api.streaming_api.subscription_storage import (
+    SubscriptionStorage, SubscriptionParams
+)
+
+
+PLAIN = SubscriptionParams()
+RETAINED = SubscriptionParams(is_retained=True)
+CONFLATED = SubscriptionParams(is_retained=True, is_conflated=True)
+
+
+class TestSubscriptionStorage(unittest.TestCase):
+    def setUp(self):
+        self.storage = SubscriptionStorage()
+
+    def test_no_subscribers(self):
+        self.assertEqual(
+            {}, self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+    def test_exact_match(self):
+        self.storage.add_subscription('S1', 'things/L1/modified')
+        self.storage.add_subscription('S2', 'things/L2/modified')
+
+        self.assertEqual(
+            {'S1': PLAIN},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+    def test_single_level_wildcard(self):
+        self.storage.add_subscription('S1', 'things/+/modified', True)
+        self.storage.add_subscription('S2', 'things/+/deleted')
+
+        self.assertEqual(
+            {'S1': RETAINED},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+    def test_multi_level_wildcard(self):
+        self.storage.add_subscription('S1', 'things/#')
+        self.storage.add_subscription('S2', '#')
+
+        self.assertEqual(
+            {'S1': PLAIN, 'S2': PLAIN},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+        self.assertEqual(
+            {'S1': PLAIN, 'S2': PLAIN},
+            self.storage.resolve_subscribers('things')
+        )
+        self.assertEqual(
+            {'S2': PLAIN},
+            self.storage.resolve_subscribers('placements/R1/modified')
+        )
+
+    def test_overlapping_subscriptions_retained(self):
+        self.storage.add_subscription('S1', 'things/+/modified', False)
+        self.storage.add_subscription('S1', 'things/L1/modified', True)
+
+        self.assertEqual(
+            {'S1': RETAINED},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+        self.assertEqual(
+            {'S1': PLAIN},
+            self.storage.resolve_subscribers('things/L2/modified')
+        )
+
+    def test_overlapping_subscriptions_conflated(self):
+        self.storage.add_subscription('S1', 'things/+/modified', True, True)
+        self.storage.add_subscription('S1', 'things/L1/modified', True)
+        self.storage.add_subscription('S1', 'things/L1/#', False)
+
+        self.assertEqual(
+            {'S1': RETAINED},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+        self.assertEqual(
+            {'S1': CONFLATED},
+            self.storage.resolve_subscribers('things/L2/modified')
+        )
+
+    def test_conflation_requires_retention(self):
+        self.storage.add_subscription('S1', 'things/+/modified', False, True)
+
+        self.assertEqual(
+            {'S1': PLAIN},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+    def test_overlapping_subscriptions_rate_limited(self):
+        self.storage.add_subscription(
+            'S1', 'things/#', min_interval=0.5,
+            rate_mode=RateLimitMode.debounce
+        )
+        self.storage.add_subscription(
+            'S1', 'things/+/modified', min_interval=1.0
+        )
+        self.storage.add_subscription('S1', 'things/L1/modified', True)
+
+        self.assertEqual(
+            {'S1': SubscriptionParams(
+                min_interval=0.5, rate_mode=RateLimitMode.debounce
+            )},
+            self.storage.resolve_subscribers('things/L2/modified')
+        )
+        self.assertEqual(
+            {'S1': RETAINED},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+    def test_resubscription_replaces_params(self):
+        self.storage.add_subscription('S1', 'things/+/modified', True)
+        self.storage.add_subscription('S1', 'things/+/modified', False)
+
+        self.assertEqual(
+            {'S1': PLAIN},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+    def test_remove_subscription(self):
+        self.storage.add_subscription('S1', 'things/+/modified')
+        self.storage.add_subscription('S2', 'things/+/modified')
+
+        self.storage.remove_subscription('S1', 'things/+/modified')
+
+        self.assertEqual(
+            {'S2': PLAIN},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+        self.storage.remove_subscription('S2', 'things/+/modified')
+
+        self.assertEqual(
+            {}, self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+    def test_remove_all_for(self):
+        self.storage.add_subscription('S1', 'things/+/modified')
+        self.storage.add_subscription('S1', 'placements/#')
+        self.storage.add_subscription('S2', 'placements/#')
+
+        self.storage.remove_all_for('S1')
+
+        self.assertNotIn('S1', self.storage.list_sessions())
+        self.assertEqual(
+            {}, self.storage.resolve_subscribers('things/L1/modified')
+        )
+        self.assertEqual(
+            {'S2': PLAIN},
+            self.storage.resolve_subscribers('placements/R1/modified')
+        )
+
+    def test_remove_all_for_unknown(self):
+        self.storage.remove_all_for('S1')
+        self.assertNotIn('S1', self.storage.list_sessions())
+
+    def test_subscription_params_backtracking(self):
+        self.storage.add_subscription('S1', 'things/+/modified', True)
+        self.storage.add_subscription('S1', 'things/L1/deleted')
+
+        self.assertEqual(
+            RETAINED, self.storage.resolve_subscription_params(
+                'S1', 'things/L1/modified'
+            )
+        )
+        self.assertTrue(self.storage.is_subscribed('S1', 'things/L1/deleted'))
+        self.assertFalse(self.storage.is_subscribed('S1', 'things/L1/added'))
+
+    def test_cache_invalidation(self):
+        self.storage.add_subscription('S1', 'things/+/modified')
+
+        # the result for this topic is cached now
+        self.assertEqual(
+            {'S1': PLAIN},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+        self.storage.add_subscription('S2', 'things/#')
+
+        self.assertEqual(
+            {'S1': PLAIN, 'S2': PLAIN},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+        self.storage.remove_subscription('S1', 'things/+/modified')
+
+        self.assertEqual(
+            {'S2': PLAIN},
+            self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+        self.storage.remove_all_for('S2')
+
+        self.assertEqual(
+            {}, self.storage.resolve_subscribers('things/L1/modified')
+        )
+
+    def test_cache_size(self):
+        storage = SubscriptionStorage(cache_size=2)
+        storage.add_subscription('S1', 'things/#')
+
+        for thing_id in ('L1', 'L2', 'L3', 'L1'):
+            self.assertEqual(
+                {'S1': PLAIN},
+                storage.resolve_subscribers('things/%s/modified' % thing_id)
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+"""
+This module contains unit tests for EventHub
+"""
+
+import asyncio
+import threading
+import unittest
+
+from dpl.events.event import Event
+from dpl.events.event_hub import EventHub
+from dpl.events.object_related_event import ObjectRelatedEvent
+from dpl.utils.observable import Observable
+from dpl.utils.observer import Observer
+
+
+class _Source(Observable):
+    pass
+
+
+def _build_event(source: _Source, topic: str) -> Event:
+    return Event(topic=topic)
+
+
+class _RecordingObserver(Observer):
+    def __init__(self):
+        self.topics = list()
+
+    def update(self, source: EventHub, event: Event) -> None:
+        self.topics.append(event.topic)
+
+
+class _CoroutineObserver(Observer):
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.topics = list()
+        self._loop = loop
+
+    async def update(self, source: EventHub, event: Event) -> None:
+        await asyncio.sleep(0, loop=self._loop)
+        self.topics.append(event.topic)
+
+
+class _FailingObserver(Observer):
+    def update(self, source: EventHub, event: Event) -> None:
+        raise RuntimeError("Failed to handle an event")
+
+
+class TestEventHub(unittest.TestCase):
+    def test_sync_dispatch(self):
+        hub = EventHub()
+        hub.register_handler(_Source, _build_event)
+        observer = _RecordingObserver()
+        hub.subscribe(observer)
+
+        hub.update(_Source(), 'things/L1/modified')
+
+        self.assertEqual(['things/L1/modified'], observer.topics)
+
+    def test_topic_routing(self):
+        hub = EventHub()
+        hub.register_handler(_Source, _build_event)
+        catch_all = _RecordingObserver()
+        things = _RecordingObserver()
+        l1_deleted = _RecordingObserver()
+        hub.subscribe(catch_all)
+        hub.subscribe(things, topics=['things/+/modified', 'things/#'])
+        hub.subscribe(l1_deleted, topics=['things/L1/deleted'])
+
+        for topic in ('things/L1/modified', 'users/U1/modified',
+                      'things/L1/deleted'):
+            hub.update(_Source(), topic)
+
+        self.assertEqual(3, len(catch_all.topics))
+        self.assertEqual(
+            ['things/L1/modified', 'things/L1/deleted'], things.topics
+        )
+        self.assertEqual(['things/L1/deleted'], l1_deleted.topics)
+
+        hub.unsubscribe(things)
+        hub.subscribe(l1_deleted, topics=['users/#'])
+        hub.update(_Source(), 'things/L2/deleted')
+        hub.update(_Source(), 'users/U1/deleted')
+
+        self.assertEqual(2, len(things.topics))
+        self.assertEqual(
+            ['things/L1/deleted', 'users/U1/deleted'], l1_deleted.topics
+        )
+
+    def test_dto_is_built_only_if_consumed(self):
+        built = list()
+
+        def build_dto():
+            built.append(True)
+            return {'id': 'L1'}
+
+        def build_lazy_event(source: _Source, topic: str) -> Event:
+            return ObjectRelatedEvent(topic, dto_builder=build_dto)
+
+        hub = EventHub()
+        hub.register_handler(_Source, build_lazy_event)
+        observer = _RecordingObserver()
+        hub.subscribe(observer, topics=['users/#'])
+
+        hub.update(_Source(), 'things/L1/modified')
+        self.assertEqual([], built)
+
+        event = ObjectRelatedEvent('things/L1/modified', dto_builder=build_dto)
+        self.assertEqual({'id': 'L1'}, event.object_dto)
+        self.assertEqual({'id': 'L1'}, event.object_dto)
+        self.assertEqual(1, len(built))
+
+
+class TestAsyncEventHub(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.hub = EventHub(loop=self.loop, async_dispatch=True, workers=2)
+        self.hub.register_handler(_Source, _build_event)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_dispatch_is_deferred(self):
+        observer = _RecordingObserver()
+        self.hub.subscribe(observer)
+        self._run(self.hub.start())
+
+        self.hub.update(_Source(), 'things/L1/modified')
+        self.assertEqual([], observer.topics)
+
+        self._run(self.hub.stop())
+        self.assertEqual(['things/L1/modified'], observer.topics)
+
+    def test_coroutine_observers_and_ordering(self):
+        observer = _CoroutineObserver(self.loop)
+        self.hub.subscribe(observer)
+        self.hub.subscribe(_FailingObserver())
+        source = _Source()
+        topics = ['things/L1/%s' % number for number in range(10)]
+
+        for topic in topics:
+            self.hub.update(source, topic)
+
+        self._run(self.hub.start())
+        self._run(self.hub.stop())
+
+        self.assertEqual(topics, observer.topics)
+
+    def test_update_from_other_thread(self):
+        observer = _RecordingObserver()
+        self.hub.subscribe(observer)
+        self._run(self.hub.start())
+        source = _Source()
+
+        def emit():
+            for number in range(100):
+                self.hub.update(source, 'things/L1/%s' % number)
+
+        thread = threading.Thread(target=emit)
+        thread.start()
+        thread.join()
+
+        self._run(self.hub.stop())
+
+        self.assertEqual(
+            ['things/L1/%s' % number for number in range(100)],
+            observer.topics
+        )
+
+
+class TestEventCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.hub = EventHub(loop=self.loop, coalesce_window=0)
+        self.hub.register_handler(_Source, _build_event)
+        self.observer = _RecordingObserver()
+        self.hub.subscribe(self.observer)
+        self.source = _Source()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _next_iteration(self) -> None:
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+
+    def test_same_tick_events_are_coalesced(self):
+        transition_observer = _RecordingObserver()
+        self.hub.subscribe(transition_observer, every_transition=True)
+
+        for topic in ('things/L1/modified', 'things/L2/modified',
+                      'things/L1/modified'):
+            self.hub.update(self.source, topic)
+
+        self.assertEqual([], self.observer.topics)
+        self.assertEqual(3, len(transition_observer.topics))
+
+        self._next_iteration()
+
+        self.assertEqual(
+            ['things/L1/modified', 'things/L2/modified'],
+            self.observer.topics
+        )
+        self.assertEqual(3, len(transition_observer.topics))
+
+    def test_other_events_flush_coalesced(self):
+        self.hub.update(self.source, 'things/L1/modified')
+        self.hub.update(self.source, 'things/L1/deleted')
+
+        self.assertEqual(
+            ['things/L1/modified', 'things/L1/deleted'], self.observer.topics
+        )
+
+        self._next_iteration()
+        self.assertEqual(2, len(self.observer.topics))
+
+    def test_early_flush_keeps_next_window(self):
+        window = 0.1
+        hub = EventHub(loop=self.loop, coalesce_window=window)
+        hub.register_handler(_Source, _build_event)
+        observer = _RecordingObserver()
+        hub.subscribe(observer)
+
+        def sleep(delay: float) -> None:
+            self.loop.run_until_complete(asyncio.sleep(delay, loop=self.loop))
+
+        hub.update(self.source, 'things/L1/modified')
+        sleep(window / 2)
+
+        # the first batch is flushed early, the second one is started
+        hub.update(self.source, 'things/L1/deleted')
+        hub.update(self.source, 'things/L2/modified')
+        sleep(window * 0.6)
+
+        # the timer of the first batch must not flush the second one
+        self.assertEqual(
+            ['things/L1/modified', 'things/L1/deleted'], observer.topics
+        )
+
+        sleep(window)
+        self.assertEqual('things/L2/modified', observer.topics[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
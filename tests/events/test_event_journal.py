@@ -0,0 +1,127 @@
+"""
+This module contains unit tests for EventJournal
+"""
+
+import asyncio
+import json
+import tempfile
+import threading
+import time
+import unittest
+
+from dpl.events.event_journal import (
+    EventJournal, JournalCursor, decode_event, encode_event
+)
+from dpl.events.object_related_event import ObjectRelatedEvent
+
+
+class TestEventJournal(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self._dir.cleanup()
+
+    def _run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def _open(self, **kwargs) -> EventJournal:
+        journal = EventJournal(self._dir.name, loop=self.loop, **kwargs)
+        self._run(journal.open())
+
+        return journal
+
+    def _emit(self, journal: EventJournal, topic: str, timestamp: float):
+        event = ObjectRelatedEvent(topic=topic, object_dto={'at': timestamp})
+        event._timestamp = timestamp
+        journal.update(None, event)
+
+    def _fetch_all(self, journal: EventJournal, **kwargs):
+        cursor = journal.open_cursor(**kwargs)
+        records = list()
+
+        while True:
+            chunk = self._run(cursor.fetch(2))
+
+            if not chunk:
+                break
+
+            records.extend(chunk)
+
+        self._run(cursor.close())
+
+        return [(topic, json.loads(body.decode('utf-8'))['at'])
+                for _, topic, body in records]
+
+    def test_encoding(self):
+        payload = encode_event(1.5, 'things/L1/modified', b'{}')
+
+        self.assertEqual(
+            (1.5, 'things/L1/modified', b'{}'), decode_event(payload)
+        )
+
+    def test_close_during_fetch(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def read_records():
+            started.set()
+            release.wait()
+            yield 1.5, 'things/L1/modified', b'{}'
+
+        cursor = JournalCursor(read_records(), self.loop)
+        fetch = asyncio.ensure_future(cursor.fetch(1), loop=self.loop)
+        self._run(self.loop.run_in_executor(None, started.wait))
+
+        # the fetching task is cancelled while the read is still in progress
+        fetch.cancel()
+        self.loop.call_later(0.01, release.set)
+        self._run(cursor.close())
+
+        self.assertEqual([], self._run(cursor.fetch(1)))
+
+    def test_range_query(self):
+        # each pair of events is flushed to a separate segment
+        for first in range(0, 10, 2):
+            journal = self._open(segment_size=64)
+
+            for timestamp in (first, first + 1):
+                self._emit(journal, 'things/L%d/modified' % (timestamp % 2),
+                           float(timestamp))
+
+            self._run(journal.close())
+
+        journal = self._open(segment_size=64)
+
+        self.assertEqual(
+            [('things/L1/modified', 3.0), ('things/L1/modified', 5.0)],
+            self._fetch_all(journal, key='things/L1', since=2.0, until=6.0)
+        )
+        self.assertEqual(10, len(self._fetch_all(journal)))
+        self.assertEqual([], self._fetch_all(journal, key='things/L2'))
+        self._run(journal.close())
+
+    def test_retention(self):
+        now = time.time()
+
+        for timestamps in ((now - 7200, now - 7100), (now - 10, now)):
+            journal = self._open(segment_size=64)
+
+            for timestamp in timestamps:
+                self._emit(journal, 'things/L1/modified', timestamp)
+
+            self._run(journal.close())
+
+        journal = self._open(segment_size=64, retention_period=3600)
+
+        self.assertEqual(
+            [now - 10, now],
+            [at for _, at in self._fetch_all(journal, key='things/L1')]
+        )
+        self._run(journal.close())
+
+
+if __name__ == '__main__':
+    unittest.main()
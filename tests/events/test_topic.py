@@ -0,0 +1,67 @@
+"""
+This module contains unit tests for topic utilities
+"""
+
+import unittest
+
+from dpl.events.topic import is_valid_pattern, topic_matches
+
+
+class TestTopicMatches(unittest.TestCase):
+    def _check(self, pattern: str, matching, not_matching) -> None:
+        for topic in matching:
+            with self.subTest(pattern=pattern, topic=topic):
+                self.assertTrue(topic_matches(pattern, topic))
+
+        for topic in not_matching:
+            with self.subTest(pattern=pattern, topic=topic):
+                self.assertFalse(topic_matches(pattern, topic))
+
+    def test_exact(self):
+        self._check(
+            'things/L1/modified',
+            matching=('things/L1/modified', ),
+            not_matching=('things/L2/modified', 'things/L1', 'things')
+        )
+
+    def test_single_level_wildcard(self):
+        self._check(
+            'things/+/modified',
+            matching=('things/L1/modified', 'things/L2/modified'),
+            not_matching=('things/L1/deleted', 'things/L1/modified/x')
+        )
+        self._check(
+            '+/+/modified',
+            matching=('things/L1/modified', 'placements/R1/modified'),
+            not_matching=('things/L1', )
+        )
+
+    def test_multi_level_wildcard(self):
+        self._check(
+            '#',
+            matching=('things', 'things/L1/modified'),
+            not_matching=()
+        )
+        self._check(
+            'things/L1/#',
+            matching=('things/L1', 'things/L1/modified'),
+            not_matching=('things/L2/modified', 'placements/R1/modified')
+        )
+
+
+
+class TestIsValidPattern(unittest.TestCase):
+    def test_valid(self):
+        for pattern in ('things/L1/modified', 'things/+/modified',
+                        'things/#', '#', '+/+/#'):
+            with self.subTest(pattern=pattern):
+                self.assertTrue(is_valid_pattern(pattern))
+
+    def test_invalid(self):
+        for pattern in ('#/modified', 'things/#/modified', '#/#'):
+            with self.subTest(pattern=pattern):
+                self.assertFalse(is_valid_pattern(pattern))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+This module contains unit tests for TopicTree
+"""
+
+import unittest
+
+from dpl.events.topic_tree import TopicTree
+
+
+class TestTopicTree(unittest.TestCase):
+    def setUp(self):
+        self.tree = TopicTree()
+
+    def _match(self, topic: str):
+        return sorted(self.tree.match(topic))
+
+    def test_exact_and_wildcards(self):
+        self.tree.add('things/L1/modified', 'exact', 1)
+        self.tree.add('things/+/modified', 'single', 2)
+        self.tree.add('things/#', 'multi', 3)
+        self.tree.add('#', 'all', 4)
+        self.tree.add('things/L1/deleted', 'other', 5)
+
+        self.assertEqual(
+            [('all', 4), ('exact', 1), ('multi', 3), ('single', 2)],
+            self._match('things/L1/modified')
+        )
+        self.assertEqual(
+            [('all', 4), ('multi', 3)], self._match('things')
+        )
+        self.assertEqual([('all', 4)], self._match('placements/R1/modified'))
+
+    def test_backtracking(self):
+        # an exact branch exists but doesn't lead to the match
+        self.tree.add('things/L1/deleted', 'S1', 1)
+        self.tree.add('things/+/modified', 'S1', 2)
+        self.tree.add('+/L1/#', 'S2', 3)
+
+        self.assertEqual(
+            [('S1', 2), ('S2', 3)], self._match('things/L1/modified')
+        )
+
+    def test_same_key_for_several_patterns(self):
+        self.tree.add('things/+/modified', 'S1', 1)
+        self.tree.add('things/L1/modified', 'S1', 2)
+
+        self.assertEqual(
+            [('S1', 1), ('S1', 2)], self._match('things/L1/modified')
+        )
+
+    def test_replace_and_remove(self):
+        self.tree.add('things/+/modified', 'S1', 1)
+        self.tree.add('things/+/modified', 'S1', 2)
+        self.assertEqual(1, len(self.tree))
+        self.assertEqual([('S1', 2)], self._match('things/L1/modified'))
+
+        self.assertFalse(self.tree.remove('things/+/modified', 'S2'))
+        self.assertFalse(self.tree.remove('things/L1/modified', 'S1'))
+        self.assertTrue(self.tree.remove('things/+/modified', 'S1'))
+
+        self.assertEqual(0, len(self.tree))
+        self.assertEqual([], self._match('things/L1/modified'))
+        self.assertTrue(self.tree._root.is_empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
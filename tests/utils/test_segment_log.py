@@ -0,0 +1,154 @@
+# Include standard modules
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+# Include 3rd-party modules
+# Include DPL modules
+from dpl.utils import segment_log
+from dpl.utils.segment_log import SegmentLog, encode_record, iter_records
+
+
+class TestRecordFraming(unittest.TestCase):
+    def test_round_trip(self):
+        data = encode_record(b'first') + encode_record(b'') + \
+            encode_record(b'second')
+
+        self.assertEqual(list(iter_records(data)), [b'first', b'', b'second'])
+
+    def test_truncated_record_ignored(self):
+        data = encode_record(b'first') + encode_record(b'second')[:-1]
+
+        self.assertEqual(list(iter_records(data)), [b'first'])
+
+    def test_corrupted_record_ignored(self):
+        second = bytearray(encode_record(b'second'))
+        second[-1] ^= 0xff
+        data = encode_record(b'first') + bytes(second)
+
+        self.assertEqual(list(iter_records(data)), [b'first'])
+
+
+class TestSegmentLog(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = self._dir.name
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_append_is_buffered(self):
+        log = SegmentLog(self.path)
+        log.append(b'record')
+
+        segments = os.listdir(self.path)
+        self.assertEqual(len(segments), 1)
+        self.assertEqual(
+            os.path.getsize(os.path.join(self.path, segments[0])), 0
+        )
+
+        log.close()
+
+    def test_reopen(self):
+        log = SegmentLog(self.path)
+        log.append(b'first')
+        log.flush()
+        log.append(b'second')
+        log.close()
+
+        log = SegmentLog(self.path)
+        log.append(b'third')
+
+        self.assertEqual(
+            list(log.read_all()), [b'first', b'second', b'third']
+        )
+        log.close()
+
+    def test_segments_roll(self):
+        log = SegmentLog(self.path, segment_size=10)
+
+        for i in range(5):
+            log.append(b'record %d' % i)
+            log.flush()
+
+        self.assertGreater(len(os.listdir(self.path)), 1)
+        self.assertEqual(
+            list(log.read_all()), [b'record %d' % i for i in range(5)]
+        )
+        log.close()
+
+    def test_compact(self):
+        log = SegmentLog(self.path, segment_size=10)
+
+        for i in range(6):
+            log.append(b'record %d' % i)
+
+        log.compact(
+            lambda payloads: [p for p in payloads if int(p[-1:]) % 2]
+        )
+        log.append(b'record 6')
+
+        self.assertEqual(
+            list(log.read_all()), [b'record 1', b'record 3', b'record 5',
+                                   b'record 6']
+        )
+        log.close()
+
+    def test_interrupted_compaction(self):
+        log = SegmentLog(self.path, segment_size=10)
+
+        # the second record cancels the first one, only the third is live
+        for record in (b'add 1', b'remove 1', b'add 2'):
+            log.append(record)
+            log.flush()
+
+        replace = os.replace
+
+        def crash_on_replace(source, destination):
+            if destination.endswith(segment_log.SEGMENT_SUFFIX):
+                raise OSError("Simulated crash")
+
+            replace(source, destination)
+
+        # the process "crashes" after the compaction was committed, but
+        # before the compacted segment was put in place
+        with mock.patch.object(segment_log.os, 'replace', crash_on_replace):
+            with self.assertRaises(OSError):
+                log.compact(
+                    lambda payloads: [p for p in payloads if p == b'add 2']
+                )
+
+        log.close()
+
+        log = SegmentLog(self.path, segment_size=10)
+
+        self.assertEqual(list(log.read_all()), [b'add 2'])
+        log.close()
+
+    def test_remove_segment(self):
+        log = SegmentLog(self.path, segment_size=10)
+
+        for i in range(3):
+            log.append(b'record %d' % i)
+            log.flush()
+
+        numbers = log.list_segments()
+        self.assertEqual(numbers[-1], log.active_segment)
+        self.assertEqual(list(log.read_segment(numbers[0])), [b'record 0'])
+
+        log.remove_segment(numbers[0])
+
+        self.assertEqual(log.list_segments(), numbers[1:])
+        self.assertEqual(
+            list(log.read_all()), [b'record 1', b'record 2']
+        )
+
+        with self.assertRaises(ValueError):
+            log.remove_segment(log.active_segment)
+
+        log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()